@@ -0,0 +1,181 @@
+# bench_db.py
+"""
+بنچمارک لایه‌ی دیتابیس روی یک فایل SQLite موقت (دیتابیس ربات دست نمی‌خورد).
+- writes: update های همزمان که هر کدام زبان کاربر را می‌خوانند و یک دانلود ثبت می‌کنند
+    sync:  کار قبلی — connect/query/commit/close برای هر کوئری، مستقیم روی event loop
+    async: database.py — connection ماندگار روی thread دیتابیس، کش پروفایل و write-behind save_download
+  گزارش: update در ثانیه و بیشترین تأخیر event loop (زمانی که loop به update های دیگر جواب نمی‌دهد)
+- quota: چک سهمیه‌ی روزانه روی چند میلیون ردیف تاریخچه‌ی مصنوعی
+    scan:    کوئری قبلی COUNT(*) ... date(downloaded_at)=? بدون index (مثل schema قبلی)
+    index:   همان کوئری با idx_downloads_user_time (date() هنوز کل تاریخچه‌ی کاربر را می‌خواند)
+    counter: جدول daily_counts — یک lookup روی primary key
+
+    python bench_db.py writes
+    python bench_db.py writes --updates 5000 --users 200 --concurrency 64
+    python bench_db.py quota --rows 5000000 --users 2000
+"""
+import os
+import time
+import shutil
+import asyncio
+import sqlite3
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+import database as db
+
+def _sync_update(path: str, user_id: int, i: int):
+    """مسیر قبلی: هر کوئری connection خودش را باز و بسته می‌کند"""
+    conn = sqlite3.connect(path)
+    row = conn.execute('SELECT language FROM users WHERE user_id=?', (user_id,)).fetchone()
+    conn.close()
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO downloads (user_id, platform, url, title, size, downloaded_at) VALUES (?,?,?,?,?,?)',
+                 (user_id, "youtube", f"https://example.com/{i}", row[0], 1024, datetime.utcnow().isoformat()))
+    conn.execute('INSERT INTO daily_counts (user_id, day, count) VALUES (?,?,1) ON CONFLICT(user_id, day) DO UPDATE SET count=count+1',
+                 (user_id, datetime.utcnow().strftime("%Y-%m-%d")))
+    conn.commit()
+    conn.close()
+
+async def _async_update(path: str, user_id: int, i: int):
+    lang = await db.get_user_lang(user_id)
+    await db.save_download(user_id, "youtube", f"https://example.com/{i}", lang, 1024)
+
+async def _run_updates(fn, path: str, updates: int, users: int, concurrency: int):
+    """returns (ثانیه، بیشترین تأخیر event loop به ms)"""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - started - 0.001)
+
+    async def worker(n: int):
+        for i in range(n, updates, concurrency):
+            result = fn(path, i % users + 1, i)
+            if asyncio.iscoroutine(result):
+                await result
+            else:
+                # handler قبلی هم بین update ها به loop برمی‌گشت
+                await asyncio.sleep(0)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    await db.flush_downloads()
+    elapsed = time.perf_counter() - started
+    done = True
+    await tick
+    return elapsed, lag * 1000
+
+def _fresh_db(path: str, users: int):
+    db._executor.submit(db._close).result()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db._profiles.clear()
+    db.DATABASE_PATH = path
+    db.init_db()
+    with sqlite3.connect(path) as conn:
+        conn.executemany('INSERT INTO users (user_id, username, language) VALUES (?,?,?)',
+                         [(u, f"user{u}", "fa") for u in range(1, users + 1)])
+
+def bench_writes(args):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "bench.db")
+    print(f"{'mode':6} {'updates':>8} {'sec':>7} {'updates/s':>10} {'max loop lag ms':>16} {'speedup':>8}")
+    base = None
+    for mode, fn in (("sync", _sync_update), ("async", _async_update)):
+        _fresh_db(path, args.users)
+        elapsed, lag = asyncio.run(_run_updates(fn, path, args.updates, args.users, args.concurrency))
+        with sqlite3.connect(path) as conn:
+            assert conn.execute('SELECT COUNT(*) FROM downloads').fetchone()[0] == args.updates
+        rate = args.updates / elapsed
+        base = base or rate
+        print(f"{mode:6} {args.updates:8} {elapsed:7.2f} {rate:10.0f} {lag:16.1f} {rate / base:7.1f}x", flush=True)
+    db._executor.submit(db._close).result()
+    shutil.rmtree(os.path.dirname(path))
+
+QUOTA_QUERIES = {
+    "scan": "SELECT COUNT(*) FROM downloads NOT INDEXED WHERE user_id=? AND date(downloaded_at)=?",
+    "index": "SELECT COUNT(*) FROM downloads WHERE user_id=? AND date(downloaded_at)=?",
+    "counter": "SELECT count FROM daily_counts WHERE user_id=? AND day=?",
+}
+
+def _history(rows: int, users: int, days: int):
+    """ردیف‌های downloads پخش‌شده روی days روز گذشته (امروز هم شامل است)"""
+    rnd = random.Random(1)
+    now = datetime.utcnow()
+    for i in range(rows):
+        at = now - timedelta(seconds=rnd.randrange(days * 86400))
+        yield (rnd.randrange(1, users + 1), "youtube", f"https://example.com/{i}", "t", 1024, at.isoformat())
+
+def _p95(values: list) -> float:
+    return sorted(values)[max(0, int(len(values) * 0.95) - 1)]
+
+def bench_quota(args):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "bench.db")
+    _fresh_db(path, 0)
+    db._executor.submit(db._close).result()
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    conn.executemany('INSERT INTO downloads (user_id, platform, url, title, size, downloaded_at) VALUES (?,?,?,?,?,?)',
+                     _history(args.rows, args.users, args.days))
+    conn.commit()
+    print(f"{args.rows} rows inserted in {time.perf_counter() - started:.1f}s", flush=True)
+    # همان backfill مهاجرت init_db
+    started = time.perf_counter()
+    db._migrate_1(conn.cursor())
+    conn.commit()
+    print(f"daily_counts backfill (migration 1) in {time.perf_counter() - started:.1f}s\n", flush=True)
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    rnd = random.Random(2)
+    user_ids = [rnd.randrange(1, args.users + 1) for _ in range(args.lookups)]
+    print(f"{'mode':8} {'lookups':>8} {'mean us':>10} {'p95 us':>10} {'speedup':>9}")
+    base = None
+    expected = None
+    for mode, sql in QUOTA_QUERIES.items():
+        # scan کند است؛ تعداد کمتری اجرا می‌شود
+        ids = user_ids[:max(1, args.lookups // 100)] if mode == "scan" else user_ids
+        times, counts = [], []
+        for user_id in ids:
+            started = time.perf_counter()
+            row = conn.execute(sql, (user_id, today)).fetchone()
+            times.append((time.perf_counter() - started) * 1e6)
+            counts.append(row[0] if row else 0)
+        # هر سه روش باید همان عدد را بدهند
+        expected = expected or counts
+        n = min(len(counts), len(expected))
+        assert counts[:n] == expected[:n], mode
+        expected = max(expected, counts, key=len)
+        mean = statistics.mean(times)
+        base = base or mean
+        print(f"{mode:8} {len(ids):8} {mean:10.1f} {_p95(times):10.1f} {base / mean:8.0f}x", flush=True)
+    conn.close()
+    shutil.rmtree(os.path.dirname(path))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    writes = sub.add_parser("writes", help="update در ثانیه: sync قبلی در برابر لایه‌ی async")
+    writes.add_argument("--updates", type=int, default=3000)
+    writes.add_argument("--users", type=int, default=100)
+    writes.add_argument("--concurrency", type=int, default=32, help="تعداد update همزمان")
+    writes.set_defaults(fn=bench_writes)
+    quota = sub.add_parser("quota", help="چک سهمیه‌ی روزانه: COUNT روی تاریخچه در برابر daily_counts")
+    quota.add_argument("--rows", type=int, default=2_000_000, help="ردیف‌های مصنوعی downloads")
+    quota.add_argument("--users", type=int, default=1000)
+    quota.add_argument("--days", type=int, default=365, help="بازه‌ی تاریخچه")
+    quota.add_argument("--lookups", type=int, default=2000)
+    quota.set_defaults(fn=bench_quota)
+    args = parser.parse_args()
+    args.fn(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_keyboards.py
+"""
+بنچمارک تأخیر handler های منو (بدون شبکه): handler واقعی bot.py با CallbackQuery جعلی و دیتابیس موقت.
+- rebuild:  کار قبلی — هر بار زدن دکمه یک lookup زبان اضافه در keyboard و ساختن InlineKeyboardMarkup
+            با یک get_text برای هر دکمه
+- registry: bot._keyboards — یک lookup در registry ساخته‌شده در startup
+
+    python bench_keyboards.py
+    python bench_keyboards.py --taps 20000 --lang en
+"""
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+# bot.py موقع import توکن می‌خواهد؛ درخواستی به تلگرام فرستاده نمی‌شود
+os.environ.setdefault("TOKEN", "123456:BENCH-TOKEN")
+
+import database as db  # noqa: E402
+import bot  # noqa: E402
+
+# (handler, callback_data)
+TAPS = {
+    "main_menu": (bot.main_menu_callback, "main_menu"),
+    "back": (bot.back_callback, "back"),
+    "panel": (bot.panel_callback, "cancel_current"),
+}
+
+class FakeQuery:
+    def __init__(self, user_id: int, data: str):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.data = data
+        self.markup = None
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.markup = reply_markup
+
+def _rebuild(handler):
+    """مسیر قبلی: keyboard خودش زبان را از دیتابیس می‌خواند و دکمه‌ها را از نو می‌سازد"""
+    async def run(update, context):
+        original = bot._keyboard
+        lang = await db.get_user_lang(update.callback_query.from_user.id)
+        bot._keyboard = lambda name, _lang: bot._build_menu(name, lang)
+        try:
+            await handler(update, context)
+        finally:
+            bot._keyboard = original
+    return run
+
+async def _measure(handler, data: str, user_id: int, taps: int) -> list:
+    times = []
+    for _ in range(taps):
+        query = FakeQuery(user_id, data)
+        started = time.perf_counter()
+        await handler(SimpleNamespace(callback_query=query), None)
+        times.append((time.perf_counter() - started) * 1e6)
+    assert query.markup is not None
+    return times
+
+def _p95(values: list) -> float:
+    return sorted(values)[max(0, int(len(values) * 0.95) - 1)]
+
+async def _bench(args):
+    user_id = 1
+    await db.create_user(user_id, "bench", "Bench User", "x", args.lang)
+    print(f"{'handler':10} {'mode':9} {'mean us':>9} {'p95 us':>9} {'speedup':>8}")
+    for name, (handler, data) in TAPS.items():
+        base = None
+        for mode, fn in (("rebuild", _rebuild(handler)), ("registry", handler)):
+            times = await _measure(fn, data, user_id, args.taps)
+            mean = statistics.mean(times)
+            base = base or mean
+            print(f"{name:10} {mode:9} {mean:9.1f} {_p95(times):9.1f} {base / mean:7.1f}x", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taps", type=int, default=5000, help="تعداد زدن دکمه برای هر handler و روش")
+    parser.add_argument("--lang", default="fa", choices=bot.SUPPORTED_LANGS)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-kb-")
+    db.DATABASE_PATH = os.path.join(workdir, "bench.db")
+    db.init_db()
+    try:
+        asyncio.run(_bench(args))
+    finally:
+        db._executor.submit(db._close).result()
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
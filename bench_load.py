@@ -0,0 +1,366 @@
+# bench_load.py
+"""
+بنچمارک بار کل ربات، کاملاً offline: Application واقعی (bot.build_application با همه‌ی handler ها،
+sender، صف، worker ها و SQLite) با Update های ساختگی راه می‌افتد.
+- Telegram و yt-dlp جعلی همان tests/fakes.py هستند: تأخیر رفت‌وبرگشت و سرعت آپلود، 429 / retry_after
+  اختیاری، و دانلودی که فایل واقعی در پوشه‌ی job می‌نویسد (progress hook ها و لغو مثل yt-dlp واقعی)
+- کاربرها: guest (لینک اینستاگرام/اسپاتیفای)، member (ثبت‌نام، ورود، پنل و لینک همه‌ی پلتفرم‌ها)،
+  browser (فقط /start و دکمه‌های منو و پنل)
+
+خروجی: throughput، p50/p95/p99 تأخیر هر نوع کار (از put شدن update تا پاسخ/فایل)، peak RSS و زمان DB.
+همه‌چیز در یک پوشه‌ی موقت اجرا می‌شود (دیتابیس و downloads پروژه دست نمی‌خورند).
+
+    python bench_load.py
+    python bench_load.py --users 200 --mix guest=4,member=3,browser=3 --links 3 --ytdl-sec 2 --file-mb 5
+    python bench_load.py --json result.json
+    python bench_load.py --compare baseline.json --tolerance 0.2   # exit 1 اگر throughput یا p95 بدتر شده باشد
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import itertools
+from collections import Counter, defaultdict
+
+from tests.fakes import MB, MEDIA_METHODS, REPLY_METHODS, FakeTelegram, FakeYoutubeDL
+
+PLATFORM_URLS = {
+    "youtube": "https://www.youtube.com/watch?v=bench{n:06d}",
+    "instagram": "https://www.instagram.com/reel/bench{n}/",
+    "tiktok": "https://www.tiktok.com/@bench/video/{n}",
+    "soundcloud": "https://soundcloud.com/bench/track-{n}",
+    "spotify": "https://open.spotify.com/track/bench{n}",
+}
+GUEST_PLATFORMS = ("instagram", "spotify")
+PANEL_BUTTONS = ("profile", "stats", "recent", "queue_status")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--mix", default="guest=4,member=3,browser=3", help="نسبت نوع کاربرها")
+    parser.add_argument("--links", type=int, default=3, help="پیام لینک هر کاربر guest/member")
+    parser.add_argument("--urls-per-message", type=int, default=1)
+    parser.add_argument("--hot-ratio", type=float, default=0.1, help="سهم لینک‌های تکراری (کش و single-flight)")
+    parser.add_argument("--ramp-sec", type=float, default=5, help="شروع کاربرها در این بازه پخش می‌شود")
+    parser.add_argument("--think-ms", type=float, default=300, help="میانگین مکث کاربر بین دو کار")
+    parser.add_argument("--api-latency-ms", type=float, default=40, help="رفت‌وبرگشت هر درخواست Bot API")
+    parser.add_argument("--upload-mbps", type=float, default=20, help="سرعت آپلود به Telegram (MB/s، 0 = بی‌نهایت)")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="سهم ارسال‌هایی که 429 می‌گیرند")
+    parser.add_argument("--ytdl-sec", type=float, default=1.0, help="زمان دانلود هر فایل در yt-dlp جعلی")
+    parser.add_argument("--probe-ms", type=float, default=50, help="زمان extract_info بدون دانلود")
+    parser.add_argument("--file-mb", type=float, default=2, help="حجم میانگین فایل (±50%%)")
+    parser.add_argument("--keep-limits", action="store_true", help="سقف روزانه و صف کاربر دست نخورد")
+    parser.add_argument("--timeout", type=float, default=300, help="سقف انتظار برای تمام شدن همه‌ی دانلودها")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="نتیجه در این فایل نوشته شود")
+    parser.add_argument("--compare", help="فایل json اجرای پایه")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+# ---------------- Update های ساختگی ----------------
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1_000_000)
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}", "username": f"bench{uid}"}
+
+def message_update(uid: int, text: str) -> dict:
+    msg = {"message_id": next(_message_ids), "date": int(time.time()), "text": text,
+           "chat": {"id": uid, "type": "private"}, "from": _user(uid)}
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": msg}
+
+def callback_update(uid: int, data: str) -> dict:
+    msg = {"message_id": next(_message_ids), "date": int(time.time()), "text": "menu",
+           "chat": {"id": uid, "type": "private"}, "from": {"id": 1, "is_bot": True, "first_name": "bench"}}
+    return {"update_id": next(_update_ids),
+            "callback_query": {"id": str(next(_update_ids)), "from": _user(uid), "chat_instance": str(uid),
+                               "data": data, "message": msg}}
+
+# ---------------- کاربرهای شبیه‌سازی‌شده ----------------
+class Run:
+    def __init__(self, app, args, rng):
+        self.app = app
+        self.args = args
+        self.rng = rng
+        self.users = {}
+        self.latency = defaultdict(list)
+        self.links = Counter()  # sent / done / failed / refused
+        self.updates = 0
+        self.link_seq = itertools.count(1)
+
+    def on_event(self, chat_id, method, params, result):
+        user = self.users.get(chat_id)
+        if user is not None:
+            user.event(method, params, result)
+
+    def link(self, platforms) -> str:
+        platform = self.rng.choice(platforms)
+        n = self.rng.randrange(5) if self.rng.random() < self.args.hot_ratio else next(self.link_seq) + 100
+        return PLATFORM_URLS[platform].format(n=n)
+
+class SimUser:
+    def __init__(self, run: Run, uid: int, kind: str):
+        self.run = run
+        self.uid = uid
+        self.kind = kind
+        self.replies = asyncio.Queue()
+        self.status_ids = set()
+        # زمان ارسال لینک‌هایی که هنوز فایلشان نرسیده (به ترتیب)
+        self.waiting = []
+        # عنوان فایل لینک‌هایی که منتظر پاسخشان (تأیید صف یا فایل از کش) هستیم
+        self.acking = set()
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def event(self, method, params, result):
+        now = time.monotonic()
+        text = params.get("text") or ""
+        if method in MEDIA_METHODS or (method == "sendMessage" and text.startswith(("❌", "🚫"))):
+            if self.waiting:
+                started = self.waiting.pop(0)
+                ok = method in MEDIA_METHODS
+                self.run.links["done" if ok else "failed"] += 1
+                if ok:
+                    self.run.latency["link_done"].append(now - started)
+                if not self.waiting:
+                    self.idle.set()
+            # لینکی که از کش جواب داده شد پیام «در صف» نمی‌گیرد؛ خود فایل پاسخ آن است
+            if method in MEDIA_METHODS and params.get("caption") in self.acking:
+                self.replies.put_nowait((now, params))
+            return
+        if method == "sendMessage" and text.startswith("⏳"):
+            self.status_ids.add(result["message_id"])
+            return
+        if method == "editMessageText" and params.get("message_id") in self.status_ids:
+            return
+        if method in REPLY_METHODS:
+            self.replies.put_nowait((now, params))
+
+    async def act(self, kind: str, update: dict):
+        """update را می‌فرستد و تا اولین پاسخ به همین chat صبر می‌کند؛ returns params پاسخ یا None"""
+        from telegram import Update
+        while not self.replies.empty():
+            self.replies.get_nowait()
+        started = time.monotonic()
+        await self.run.app.update_queue.put(Update.de_json(update, self.run.app.bot))
+        self.run.updates += 1
+        try:
+            at, params = await asyncio.wait_for(self.replies.get(), 30)
+        except asyncio.TimeoutError:
+            self.run.latency[f"{kind}_timeout"].append(30.0)
+            return None
+        self.run.latency[kind].append(at - started)
+        await asyncio.sleep(self.run.rng.expovariate(1000 / self.run.args.think_ms) if self.run.args.think_ms else 0)
+        return params
+
+    async def send_links(self, platforms):
+        args = self.run.args
+        for _ in range(args.links):
+            urls = [self.run.link(platforms) for _ in range(args.urls_per_message)]
+            urls = list(dict.fromkeys(urls))
+            started = time.monotonic()
+            self.waiting.extend([started] * len(urls))
+            self.idle.clear()
+            self.run.links["sent"] += len(urls)
+            self.acking = {FakeYoutubeDL.title_for(u) for u in urls}
+            reply = await self.act("link_ack", message_update(self.uid, " ".join(urls)))
+            self.acking = set()
+            # بدون دکمه‌ی لغو = هیچ لینکی در صف نرفت (سقف روزانه/صف)
+            if reply is None or "cancel" not in json.dumps(reply.get("reply_markup") or ""):
+                for _ in urls:
+                    if started in self.waiting:
+                        self.waiting.remove(started)
+                        self.run.links["refused"] += 1
+                if not self.waiting:
+                    self.idle.set()
+
+    async def script(self):
+        uid = self.uid
+        await self.act("start", message_update(uid, "/start"))
+        if self.kind == "guest":
+            await self.send_links(GUEST_PLATFORMS)
+        elif self.kind == "member":
+            await self.act("callback", callback_update(uid, "main_menu"))
+            await self.act("register", callback_update(uid, "create_account"))
+            await self.act("register", message_update(uid, f"Bench User {uid}"))
+            await self.act("register", message_update(uid, f"bench{uid}"))
+            await self.act("register", message_update(uid, f"pass{uid % 10000:04d}x"))
+            await self.act("login", callback_update(uid, "login"))
+            await self.act("login", message_update(uid, f"bench{uid}"))
+            await self.act("login", message_update(uid, f"pass{uid % 10000:04d}x"))
+            await self.send_links(tuple(PLATFORM_URLS))
+            await self.act("callback", callback_update(uid, "queue_status"))
+        else:
+            await self.act("callback", callback_update(uid, "help"))
+            await self.act("callback", callback_update(uid, "back"))
+            for button in self.run.rng.sample(PANEL_BUTTONS, len(PANEL_BUTTONS)):
+                await self.act("callback", callback_update(uid, button))
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+    return {"n": len(values), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": values[-1]}
+
+def rss_mb() -> float:
+    # ru_maxrss روی لینوکس KB است
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def run_bench(args, FakeTelegram):
+    import bot
+    import database as db
+    import metrics
+    # bot.py موقع import، logging را روی INFO تنظیم می‌کند
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    rng = random.Random(args.seed)
+    fake = FakeTelegram(args.api_latency_ms / 1000, args.upload_mbps * MB, args.retry_after_rate, args.seed)
+    db.init_db()
+    app = bot.build_application(request=fake, get_updates_request=FakeTelegram(0, 0, 0, 0))
+    run = Run(app, args, rng)
+    fake.on_event = run.on_event
+
+    weights = {}
+    for part in args.mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    kinds = rng.choices(list(weights), weights=list(weights.values()), k=args.users)
+    for i, kind in enumerate(kinds):
+        uid = 10_000 + i
+        run.users[uid] = SimUser(run, uid, kind)
+
+    await app.initialize()
+    await bot.post_init(app)
+    await app.start()
+    rss_before = rss_mb()
+    started = time.monotonic()
+
+    async def user_task(user):
+        await asyncio.sleep(rng.uniform(0, args.ramp_sec))
+        await user.script()
+
+    await asyncio.gather(*(user_task(u) for u in run.users.values()))
+    scripted = time.monotonic() - started
+    try:
+        await asyncio.wait_for(asyncio.gather(*(u.idle.wait() for u in run.users.values())), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.monotonic() - started
+    peak = rss_mb()
+
+    await app.stop()
+    await bot.post_shutdown(app)
+    await app.shutdown()
+
+    db_count = db_sum = 0
+    per_query = Counter()
+    for key, (count, total) in metrics.totals("bot_db_query_seconds").items():
+        db_count += count
+        db_sum += total
+        per_query[dict(key)["query"]] += total
+    pending = sum(len(u.waiting) for u in run.users.values())
+    return {
+        "params": vars(args),
+        "users": dict(Counter(kinds)),
+        "elapsed_sec": elapsed,
+        "scripted_sec": scripted,
+        "updates": run.updates,
+        "updates_per_sec": run.updates / scripted if scripted else 0,
+        "links": dict(run.links, pending=pending),
+        "links_per_min": run.links["done"] / elapsed * 60 if elapsed else 0,
+        "latency": {kind: percentiles(v) for kind, v in sorted(run.latency.items())},
+        "rss_mb": {"before_load": rss_before, "peak": peak},
+        "db": {"queries": db_count, "total_sec": db_sum,
+               "top": {q: round(s, 4) for q, s in per_query.most_common(5)}},
+        "api_calls": dict(fake.calls),
+        "api_retry_after": fake.retried,
+        "upload_mb": fake.upload_bytes / MB,
+    }
+
+def report(res: dict):
+    p = res["params"]
+    print(f"users={p['users']} {res['users']} links/user={p['links']}x{p['urls_per_message']} "
+          f"ytdl={p['ytdl_sec']}s file={p['file_mb']}MB api={p['api_latency_ms']:.0f}ms upload={p['upload_mbps']}MB/s")
+    links = res["links"]
+    print(f"elapsed {res['elapsed_sec']:.1f}s  updates {res['updates']} ({res['updates_per_sec']:.1f}/s)  "
+          f"links sent {links.get('sent', 0)} done {links.get('done', 0)} failed {links.get('failed', 0)} "
+          f"refused {links.get('refused', 0)} pending {links['pending']}")
+    print(f"throughput {res['links_per_min']:.1f} links/min, uploaded {res['upload_mb']:.1f} MB")
+    print(f"{'latency':16} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for kind, st in res["latency"].items():
+        if st["n"]:
+            print(f"{kind:16} {st['n']:6d} {st['p50']:8.3f} {st['p95']:8.3f} {st['p99']:8.3f} {st['max']:8.3f}")
+    print(f"RSS before load {res['rss_mb']['before_load']:.0f} MB, peak {res['rss_mb']['peak']:.0f} MB")
+    db = res["db"]
+    print(f"DB {db['queries']} calls, {db['total_sec']:.2f}s total; top: "
+          + ", ".join(f"{q}={s:.3f}s" for q, s in db["top"].items()))
+    print("Bot API:", ", ".join(f"{m}={c}" for m, c in sorted(res["api_calls"].items())),
+          f"(429: {res['api_retry_after']})")
+
+def compare(res: dict, path: str, tolerance: float) -> list:
+    """returns پیام‌های پسرفت نسبت به اجرای پایه"""
+    with open(path) as f:
+        base = json.load(f)
+    problems = []
+    if res["links_per_min"] < base["links_per_min"] * (1 - tolerance):
+        problems.append(f"throughput {res['links_per_min']:.1f} < baseline {base['links_per_min']:.1f} links/min")
+    for kind in ("link_done", "link_ack", "callback"):
+        now, was = res["latency"].get(kind, {}), base["latency"].get(kind, {})
+        if now.get("n") and was.get("n") and now["p95"] > was["p95"] * (1 + tolerance):
+            problems.append(f"{kind} p95 {now['p95']:.3f}s > baseline {was['p95']:.3f}s")
+    return problems
+
+def main():
+    args = parse_args()
+    # قبل از import ماژول‌های ربات: بدون شبکه، بدون endpoint metrics، yt-dlp در همین process
+    os.environ.setdefault("TOKEN", "1:bench")
+    os.environ.update({"METRICS_PORT": "0", "LOCAL_BOT_API_URL": "", "YTDL_BACKEND": "thread",
+                       "TRANSCODE_ENABLED": "0", "UPDATE_MODE": "polling"})
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    work = tempfile.mkdtemp(prefix="bench-load-")
+    os.chdir(work)  # DATABASE_PATH و DOWNLOAD_FOLDER نسبی هستند
+    try:
+        import config
+        if not args.keep_limits:
+            # ماژول‌ها با from config import مقدار را برمی‌دارند؛ باید قبل از import آن‌ها عوض شود
+            config.GUEST_DAILY_LIMIT = config.REGISTERED_DAILY_LIMIT = 10 ** 6
+            config.GUEST_MAX_PENDING = config.REGISTERED_MAX_PENDING = 10 ** 6
+        import yt_dlp
+        FakeYoutubeDL.delay = args.ytdl_sec
+        FakeYoutubeDL.probe_delay = args.probe_ms / 1000
+        FakeYoutubeDL.size = int(args.file_mb * MB)
+        yt_dlp.YoutubeDL = FakeYoutubeDL
+        import messages
+        messages.warm_up = lambda: None  # ترجمه‌ی catalog شبکه لازم دارد
+        res = asyncio.run(run_bench(args, FakeTelegram))
+    finally:
+        os.chdir(here)
+        shutil.rmtree(work, ignore_errors=True)
+
+    report(res)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+    if args.compare:
+        problems = compare(res, args.compare, args.tolerance)
+        for line in problems:
+            print("REGRESSION:", line)
+        if problems:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# bench_profiles.py
+"""
+بنچمارک پروفایل‌های دانلود (profiles.py) روی fixture های محلی HLS/DASH:
+fixture ها از یک HTTP server روی loopback با تأخیر هر درخواست و سقف سرعت هر اتصال سرو می‌شوند
+(مثل CDN واقعی که هر اتصال را محدود می‌کند) و هر پروفایل با تعداد fragment همزمان متفاوت اجرا می‌شود.
+
+    python bench_profiles.py                      # fixture ها با ffmpeg ساخته می‌شوند
+    python bench_profiles.py --fixtures DIR       # DIR/hls/index.m3u8 و DIR/dash/manifest.mpd
+    python bench_profiles.py --platform youtube --fragments 1,2,4,8 --latency-ms 80 --rate-kbps 1500
+
+نیاز: ffmpeg در PATH (ساخت fixture و merge صدا/تصویر DASH)
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import yt_dlp
+import profiles
+
+FIXTURES = {"hls": "hls/index.m3u8", "dash": "dash/manifest.mpd"}
+
+def make_fixtures(root: str, seconds: int):
+    """ویدیوی تست 720p با صدا، بخش‌بندی‌شده با fragment های ۲ ثانیه‌ای"""
+    src = ["-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={seconds}",
+           "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+           "-c:v", "libx264", "-preset", "ultrafast", "-b:v", "3M", "-g", "60", "-c:a", "aac", "-b:a", "128k"]
+    os.makedirs(os.path.join(root, "hls"), exist_ok=True)
+    os.makedirs(os.path.join(root, "dash"), exist_ok=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *src, "-f", "hls", "-hls_time", "2", "-hls_playlist_type", "vod",
+                    "-hls_segment_filename", os.path.join(root, "hls", "seg_%03d.ts"),
+                    os.path.join(root, FIXTURES["hls"])], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *src, "-f", "dash", "-seg_duration", "2",
+                    "-use_template", "1", "-use_timeline", "0",
+                    os.path.join(root, FIXTURES["dash"])], check=True)
+
+def serve(root: str, latency: float, rate: int) -> ThreadingHTTPServer:
+    """rate: بایت در ثانیه برای هر اتصال (0 = بدون سقف)"""
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+        def copyfile(self, source, outputfile):
+            # تأخیر رفت‌وبرگشت، بعد ارسال با سرعت محدود
+            time.sleep(latency)
+            block = max(rate // 20, 16 * 1024) if rate else 1024 * 1024
+            while True:
+                buf = source.read(block)
+                if not buf:
+                    break
+                outputfile.write(buf)
+                if rate:
+                    time.sleep(len(buf) / rate)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_once(url: str, profile: dict, outdir: str):
+    """returns (seconds, bytes)"""
+    shutil.rmtree(outdir, ignore_errors=True)
+    opts = profiles.ydl_options(profile, os.path.join(outdir, "%(id)s.%(ext)s"))
+    # فقط زمان انتقال اندازه گرفته می‌شود؛ fixup های ffmpeg (remux ts) کنار گذاشته می‌شوند
+    opts.update({"quiet": True, "no_warnings": True, "noprogress": True, "fixup": "never"})
+    started = time.monotonic()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+    elapsed = time.monotonic() - started
+    size = sum(os.path.getsize(d["filepath"]) for d in info.get("requested_downloads") or []
+               if d.get("filepath") and os.path.exists(d["filepath"]))
+    return elapsed, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="پوشه‌ی fixture های موجود (پیش‌فرض: ساخت موقت با ffmpeg)")
+    parser.add_argument("--seconds", type=int, default=30, help="طول ویدیوی fixture ساخته‌شده")
+    parser.add_argument("--platform", default="youtube", help="پروفایل پایه (کلید DOWNLOAD_PROFILES)")
+    parser.add_argument("--fragments", default="1,2,4,8", help="مقادیر concurrent_fragments")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--rate-kbps", type=int, default=2000, help="سقف سرعت هر اتصال (KB/s، 0 = بدون سقف)")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    profiles.validate()
+    work = tempfile.mkdtemp(prefix="bench-profiles-")
+    try:
+        root = args.fixtures
+        if root is None:
+            if shutil.which("ffmpeg") is None:
+                sys.exit("ffmpeg is needed to build fixtures (or pass --fixtures)")
+            root = os.path.join(work, "fixtures")
+            print(f"building {args.seconds}s fixtures...", flush=True)
+            make_fixtures(root, args.seconds)
+        server = serve(root, args.latency_ms / 1000, args.rate_kbps * 1024)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"profile={args.platform} latency={args.latency_ms:.0f}ms rate/conn={args.rate_kbps}KB/s")
+        print(f"{'fixture':8} {'fragments':>9} {'seconds':>8} {'MB/s':>7} {'speedup':>8}")
+        for name, rel in FIXTURES.items():
+            if not os.path.exists(os.path.join(root, rel)):
+                print(f"{name:8} (missing {rel})")
+                continue
+            baseline = None
+            for n in [int(x) for x in args.fragments.split(",")]:
+                profile = dict(profiles.get(args.platform), concurrent_fragments=n)
+                runs = [run_once(f"{base}/{rel}", profile, os.path.join(work, "out")) for _ in range(args.repeat)]
+                elapsed = min(r[0] for r in runs)
+                size = runs[0][1]
+                baseline = baseline or elapsed
+                print(f"{name:8} {n:9d} {elapsed:8.2f} {size / elapsed / 1e6:7.2f} {baseline / elapsed:7.2f}x",
+                      flush=True)
+        server.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_ytdl_setup.py
+"""
+بنچمارک سربار آماده‌سازی yt-dlp برای هر job (بدون شبکه): از ساختن YoutubeDL تا پیدا شدن extractor لینک.
+- fresh: کار قبلی هر job — YoutubeDL تازه و امتحان regex همه‌ی extractor ها تا اولین extractor مناسب
+- warm:  ytdl_pool.warm_ydl (instance گرم + گزینه‌های همان job) و ytdl_pool.extractor_key
+اولین job هر روش (cold: compile شدن regex ها) جدا از حالت پایدار گزارش می‌شود.
+
+    python bench_ytdl_setup.py
+    python bench_ytdl_setup.py --jobs 100 --platform instagram
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+import yt_dlp
+import profiles
+import ytdl_pool
+from utils import detect_platform
+
+URLS = {
+    "youtube": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "instagram": "https://www.instagram.com/p/C0bench0001/",
+    "tiktok": "https://www.tiktok.com/@bench/video/7300000000000000001",
+    "soundcloud": "https://soundcloud.com/bench-artist/bench-track",
+    "spotify": "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC",
+}
+
+def _opts(url: str, outdir: str) -> dict:
+    opts = profiles.ydl_options(profiles.get(detect_platform(url)), os.path.join(outdir, "%(id)s.%(ext)s"))
+    opts.update({"quiet": True, "no_warnings": True, "progress_hooks": [lambda d: None]})
+    return opts
+
+def fresh(url: str, outdir: str):
+    """همان مسیر YoutubeDL.extract_info بدون ie_key"""
+    with yt_dlp.YoutubeDL(_opts(url, outdir)) as ydl:
+        for key, ie in ydl._ies.items():
+            if ie.suitable(url):
+                return ydl.get_info_extractor(key)
+
+def warm(url: str, outdir: str):
+    with ytdl_pool.warm_ydl(_opts(url, outdir)) as ydl:
+        key = ytdl_pool.extractor_key(ydl, url)
+        if key is None:
+            for key, ie in ydl._ies.items():
+                if ie.suitable(url):
+                    break
+        return ydl.get_info_extractor(key)
+
+def measure(fn, url: str, outdir: str, jobs: int):
+    """returns (cold ms, لیست ms حالت پایدار, کلید extractor)"""
+    times = []
+    ie = None
+    for _ in range(jobs + 1):
+        started = time.perf_counter()
+        ie = fn(url, outdir)
+        times.append((time.perf_counter() - started) * 1000)
+    return times[0], times[1:], ie.ie_key()
+
+def _p95(values: list) -> float:
+    return sorted(values)[max(0, int(len(values) * 0.95) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=30, help="تعداد job حالت پایدار برای هر لینک")
+    parser.add_argument("--platform", help="فقط همین پلتفرم (کلید URLS)")
+    args = parser.parse_args()
+
+    profiles.validate()
+    outdir = tempfile.mkdtemp(prefix="bench-ytdl-")
+    urls = {args.platform: URLS[args.platform]} if args.platform else URLS
+    print(f"{'platform':11} {'mode':6} {'extractor':12} {'cold ms':>8} {'mean ms':>8} {'p95 ms':>8} {'speedup':>8}")
+    # regex های compile شده بین دو روش مشترک‌اند؛ cold فقط برای fresh اولین لینک واقعاً سرد است
+    for platform, url in urls.items():
+        base = None
+        for mode, fn in (("fresh", fresh), ("warm", warm)):
+            cold, steady, key = measure(fn, url, outdir, args.jobs)
+            mean = statistics.mean(steady)
+            base = base or mean
+            print(f"{platform:11} {mode:6} {key:12} {cold:8.1f} {mean:8.2f} {_p95(steady):8.2f} {base / mean:7.1f}x",
+                  flush=True)
+    print(f"\nytdl_pool.ydl_stats: {ytdl_pool.ydl_stats}")
+    os.rmdir(outdir)
+
+if __name__ == "__main__":
+    main()
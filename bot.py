@@ -4,22 +4,39 @@
 نکته مهم: قبل از اجرای ربات، متغیر محیطی TOKEN را در Railway یا local تنظیم کن.
 """
 
+import io
 import os
+import time
 import asyncio
+import hashlib
+import functools
+import importlib.util
 import logging
 from datetime import datetime
 
+from types import MappingProxyType
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ConversationHandler, filters, ContextTypes
+    ConversationHandler, TypeHandler, filters, ContextTypes
 )
 
 import config
 import database as db
 import downloader
+import messages
+import metrics
+import profiler
+import profiles
+import sender
+import transcode
+import tracing
+import workspace
+import ytdl_pool
 from messages import get_text
-from utils import detect_platform, is_audio_platform, is_video_platform
+from translator import SUPPORTED_LANGS
+from utils import detect_platform, extract_urls, is_audio_platform, is_video_platform
 
 # logging
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
@@ -33,62 +50,88 @@ if not TOKEN:
 (REG_NAME, REG_USERNAME, REG_PASSWORD, LOGIN_USER, LOGIN_PASS) = range(5)
 
 # ------------- UI builders -------------
-def welcome_keyboard(user_id: int):
-    lang = db.get_user_lang(user_id)
-    kb = [
-        [InlineKeyboardButton(get_text("btn_help", lang), callback_data="help")],
-        [InlineKeyboardButton(get_text("btn_main_menu", lang), callback_data="main_menu")],
-        [InlineKeyboardButton(get_text("btn_set_lang", lang), callback_data="set_lang")],
-    ]
+# منوهای ثابت یک بار برای هر زبان ساخته می‌شوند (InlineKeyboardMarkup ها immutable هستند)؛
+# handler ها فقط با (name, lang) از registry برمی‌دارند.
+def _build_menu(name: str, lang: str):
+    if name == "welcome":
+        kb = [
+            [InlineKeyboardButton(get_text("btn_help", lang), callback_data="help")],
+            [InlineKeyboardButton(get_text("btn_main_menu", lang), callback_data="main_menu")],
+            [InlineKeyboardButton(get_text("btn_set_lang", lang), callback_data="set_lang")],
+        ]
+    elif name == "main_menu":
+        kb = [
+            [InlineKeyboardButton(get_text("btn_create_account", lang), callback_data="create_account")],
+            [InlineKeyboardButton(get_text("btn_login", lang), callback_data="login")],
+            [InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")],
+        ]
+    elif name == "user_panel":
+        kb = [
+            [InlineKeyboardButton(get_text("btn_profile", lang), callback_data="profile")],
+            [InlineKeyboardButton(get_text("btn_recent", lang), callback_data="recent")],
+            [InlineKeyboardButton(get_text("btn_stats", lang), callback_data="stats")],
+            [InlineKeyboardButton(get_text("btn_audio", lang), callback_data="download_audio"),
+             InlineKeyboardButton(get_text("btn_video", lang), callback_data="download_video")],
+            [InlineKeyboardButton(get_text("btn_queue_status", lang), callback_data="queue_status"),
+             InlineKeyboardButton(get_text("btn_cancel_download", lang), callback_data="cancel_current")],
+            [InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")],
+        ]
+    elif name == "back":
+        kb = [[InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")]]
+    elif name == "login":
+        kb = [[InlineKeyboardButton(get_text("btn_login", lang), callback_data="login")]]
+    else:  # "lang" — مستقل از زبان
+        kb = [
+            [InlineKeyboardButton("🇮🇷 فارسی", callback_data="lang:fa")],
+            [InlineKeyboardButton("🇺🇸 English", callback_data="lang:en")],
+            [InlineKeyboardButton("🇸🇦 العربية", callback_data="lang:ar")],
+        ]
     return InlineKeyboardMarkup(kb)
 
-def main_menu_keyboard(user_id: int):
-    lang = db.get_user_lang(user_id)
-    kb = [
-        [InlineKeyboardButton(get_text("btn_create_account", lang), callback_data="create_account")],
-        [InlineKeyboardButton(get_text("btn_login", lang), callback_data="login")],
-        [InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")],
-    ]
-    return InlineKeyboardMarkup(kb)
+_MENUS = ("welcome", "main_menu", "user_panel", "back", "login", "lang")
+_keyboards = MappingProxyType({})
+
+def build_keyboards():
+    """startup و بعد از به‌روز شدن catalog ترجمه‌ها"""
+    global _keyboards
+    _keyboards = MappingProxyType({(name, lang): _build_menu(name, lang) for name in _MENUS for lang in SUPPORTED_LANGS})
+
+def _keyboard(name: str, lang: str):
+    return _keyboards.get((name, lang)) or _keyboards[(name, "fa")]
+
+def welcome_keyboard(lang: str):
+    return _keyboard("welcome", lang)
+
+def main_menu_keyboard(lang: str):
+    return _keyboard("main_menu", lang)
 
 def lang_keyboard():
-    kb = [
-        [InlineKeyboardButton("🇮🇷 فارسی", callback_data="lang:fa")],
-        [InlineKeyboardButton("🇺🇸 English", callback_data="lang:en")],
-        [InlineKeyboardButton("🇸🇦 العربية", callback_data="lang:ar")],
-    ]
-    return InlineKeyboardMarkup(kb)
+    return _keyboard("lang", "fa")
 
-def user_panel_keyboard(user_id: int):
-    lang = db.get_user_lang(user_id)
-    kb = [
-        [InlineKeyboardButton(get_text("btn_profile", lang), callback_data="profile")],
-        [InlineKeyboardButton(get_text("btn_recent", lang), callback_data="recent")],
-        [InlineKeyboardButton(get_text("btn_stats", lang), callback_data="stats")],
-        [InlineKeyboardButton(get_text("btn_audio", lang), callback_data="download_audio"),
-         InlineKeyboardButton(get_text("btn_video", lang), callback_data="download_video")],
-        [InlineKeyboardButton(get_text("btn_queue_status", lang), callback_data="queue_status"),
-         InlineKeyboardButton(get_text("btn_cancel_download", lang), callback_data="cancel_current")],
-        [InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")],
-    ]
-    return InlineKeyboardMarkup(kb)
+def user_panel_keyboard(lang: str):
+    return _keyboard("user_panel", lang)
+
+def back_keyboard(lang: str):
+    return _keyboard("back", lang)
+
+build_keyboards()
 
 # ------------- Handlers -------------
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     # ensure user row exists? we allow guest so not necessary
-    lang = db.get_user_lang(user_id)
+    lang = await db.get_user_lang(user_id)
     title = get_text("welcome_title", lang, bot_name=config.BOT_NAME)
     sub = get_text("welcome_sub", lang)
-    await update.message.reply_text(f"{title}\n\n{sub}", reply_markup=welcome_keyboard(user_id))
+    await update.message.reply_text(f"{title}\n\n{sub}", reply_markup=welcome_keyboard(lang))
 
 # help
 async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     user_id = q.from_user.id
-    lang = db.get_user_lang(user_id)
-    await q.edit_message_text(get_text("help_full", lang), reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")]]))
+    lang = await db.get_user_lang(user_id)
+    await q.edit_message_text(get_text("help_full", lang), reply_markup=back_keyboard(lang))
 
 # set language
 async def set_lang_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -105,40 +148,41 @@ async def lang_select_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         _, code = data.split(":", 1)
     except Exception:
         return
-    db.set_user_lang(user_id, code)
-    await q.edit_message_text(get_text("welcome_sub", code), reply_markup=welcome_keyboard(user_id))
+    await db.set_user_lang(user_id, code)
+    await q.edit_message_text(get_text("welcome_sub", code), reply_markup=welcome_keyboard(code))
 
 # main menu
 async def main_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    user_id = q.from_user.id
-    await q.edit_message_text(get_text("main_menu_text", db.get_user_lang(user_id)), reply_markup=main_menu_keyboard(user_id))
+    lang = await db.get_user_lang(q.from_user.id)
+    await q.edit_message_text(get_text("main_menu_text", lang), reply_markup=main_menu_keyboard(lang))
 
 async def back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    user_id = q.from_user.id
-    await q.edit_message_text(get_text("welcome_sub", db.get_user_lang(user_id)), reply_markup=welcome_keyboard(user_id))
+    lang = await db.get_user_lang(q.from_user.id)
+    await q.edit_message_text(get_text("welcome_sub", lang), reply_markup=welcome_keyboard(lang))
 
 # ---------------- Registration Conversation ----------------
 async def create_account_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    user_id = q.from_user.id
-    if db.user_exists(user_id):
-        await q.edit_message_text(get_text("create_fail", db.get_user_lang(user_id)), reply_markup=main_menu_keyboard(user_id))
+    profile = await db.get_user_profile(q.from_user.id)
+    lang = profile["lang"]
+    if profile["registered"]:
+        await q.edit_message_text(get_text("create_fail", lang), reply_markup=main_menu_keyboard(lang))
         return ConversationHandler.END
-    await q.edit_message_text(get_text("create_prompt_name", db.get_user_lang(user_id)))
+    await q.edit_message_text(get_text("create_prompt_name", lang))
     return REG_NAME
 
 async def reg_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
     if not text:
-        await update.message.reply_text(get_text("create_prompt_name", db.get_user_lang(update.effective_user.id)))
+        await update.message.reply_text(get_text("create_prompt_name", await db.get_user_lang(update.effective_user.id)))
         return REG_NAME
     context.user_data["reg_fullname"] = text
-    await update.message.reply_text(get_text("create_prompt_username", db.get_user_lang(update.effective_user.id)))
+    await update.message.reply_text(get_text("create_prompt_username", await db.get_user_lang(update.effective_user.id)))
     return REG_USERNAME
 
 async def reg_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -146,36 +190,37 @@ async def reg_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if text.startswith("@"):
         text = text[1:]
     if len(text) < 3:
-        await update.message.reply_text(get_text("create_prompt_username", db.get_user_lang(update.effective_user.id)))
+        await update.message.reply_text(get_text("create_prompt_username", await db.get_user_lang(update.effective_user.id)))
         return REG_USERNAME
-    if db.get_user_by_username(text):
-        await update.message.reply_text(get_text("create_fail", db.get_user_lang(update.effective_user.id)))
+    if await db.get_user_by_username(text):
+        await update.message.reply_text(get_text("create_fail", await db.get_user_lang(update.effective_user.id)))
         return REG_USERNAME
     context.user_data["reg_username"] = text
-    await update.message.reply_text(get_text("create_prompt_password", db.get_user_lang(update.effective_user.id)))
+    await update.message.reply_text(get_text("create_prompt_password", await db.get_user_lang(update.effective_user.id)))
     return REG_PASSWORD
 
 async def reg_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
     if not (8 <= len(text) <= 12 and text.isalnum()):
-        await update.message.reply_text(get_text("create_prompt_password", db.get_user_lang(update.effective_user.id)))
+        await update.message.reply_text(get_text("create_prompt_password", await db.get_user_lang(update.effective_user.id)))
         return REG_PASSWORD
     user_id = update.effective_user.id
+    lang = await db.get_user_lang(user_id)
     fullname = context.user_data.get("reg_fullname")
     username = context.user_data.get("reg_username")
-    ok = db.create_user(user_id, username, fullname, text, db.get_user_lang(user_id))
+    ok = await db.create_user(user_id, username, fullname, text, lang)
     context.user_data.clear()
     if ok:
-        await update.message.reply_text(get_text("create_success", db.get_user_lang(user_id)), reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text("btn_login", db.get_user_lang(user_id)), callback_data="login")]]))
+        await update.message.reply_text(get_text("create_success", lang), reply_markup=_keyboard("login", lang))
     else:
-        await update.message.reply_text(get_text("create_fail", db.get_user_lang(user_id)))
+        await update.message.reply_text(get_text("create_fail", lang))
     return ConversationHandler.END
 
 # ---------------- Login Conversation ----------------
 async def login_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    await q.edit_message_text(get_text("login_prompt_username", db.get_user_lang(q.from_user.id)))
+    await q.edit_message_text(get_text("login_prompt_username", await db.get_user_lang(q.from_user.id)))
     return LOGIN_USER
 
 async def login_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -183,33 +228,33 @@ async def login_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if text.startswith("@"):
         text = text[1:]
     context.user_data["login_username"] = text
-    await update.message.reply_text(get_text("login_prompt_password", db.get_user_lang(update.effective_user.id)))
+    await update.message.reply_text(get_text("login_prompt_password", await db.get_user_lang(update.effective_user.id)))
     return LOGIN_PASS
 
 async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pwd = (update.message.text or "").strip()
     username = context.user_data.get("login_username")
     context.user_data.clear()
-    row = db.check_login(username, pwd)
+    row = await db.check_login(username, pwd)
     if row:
         # login success
-        await update.message.reply_text(get_text("login_success", db.get_user_lang(update.effective_user.id)))
+        await update.message.reply_text(get_text("login_success", await db.get_user_lang(update.effective_user.id)))
         # show user panel
         await send_user_panel(update.effective_user.id, context)
     else:
-        await update.message.reply_text(get_text("login_fail", db.get_user_lang(update.effective_user.id)))
+        await update.message.reply_text(get_text("login_fail", await db.get_user_lang(update.effective_user.id)))
     return ConversationHandler.END
 
 # ---------------- User Panel ----------------
 async def send_user_panel(user_id: int, context: ContextTypes.DEFAULT_TYPE):
-    lang = db.get_user_lang(user_id)
-    row = db.get_user_by_id(user_id)
+    lang = await db.get_user_lang(user_id)
+    row = await db.get_user_by_id(user_id)
     display = row[2] if row else str(user_id)
-    count = db.get_daily_download_count(user_id)
+    count = await db.get_daily_download_count(user_id)
     limit = config.REGISTERED_DAILY_LIMIT
     text = get_text("panel_welcome", lang, display_name=display, count=count, limit=limit)
     try:
-        await context.bot.send_message(chat_id=user_id, text=text, reply_markup=user_panel_keyboard(user_id))
+        await context.bot.send_message(chat_id=user_id, text=text, reply_markup=user_panel_keyboard(lang))
     except Exception:
         pass
 
@@ -217,98 +262,155 @@ async def panel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     user_id = q.from_user.id
-    lang = db.get_user_lang(user_id)
+    lang = await db.get_user_lang(user_id)
     data = q.data
 
     if data == "profile":
-        row = db.get_user_by_id(user_id)
+        row = await db.get_user_by_id(user_id)
         if row:
-            total_count, total_bytes = db.get_user_stats(user_id)
+            total_count, total_bytes = await db.get_user_stats(user_id)
             mb = total_bytes / (1024*1024) if total_bytes else 0
-            await q.edit_message_text(f"👤 {row[2]}\n\n📥 دانلودها: {total_count}\n📦 حجم: {mb:.2f} MB", reply_markup=user_panel_keyboard(user_id))
+            await q.edit_message_text(f"👤 {row[2]}\n\n📥 دانلودها: {total_count}\n📦 حجم: {mb:.2f} MB", reply_markup=user_panel_keyboard(lang))
         else:
-            await q.edit_message_text("اطلاعاتی یافت نشد.", reply_markup=user_panel_keyboard(user_id))
+            await q.edit_message_text("اطلاعاتی یافت نشد.", reply_markup=user_panel_keyboard(lang))
 
     elif data == "recent":
-        rows = db.get_user_downloads(user_id, limit=7)
+        rows = await db.get_user_downloads(user_id, limit=7)
         if not rows:
-            await q.edit_message_text(get_text("invalid_link", lang), reply_markup=user_panel_keyboard(user_id))
+            await q.edit_message_text(get_text("invalid_link", lang), reply_markup=user_panel_keyboard(lang))
             return
         lines = []
         for platform, title, size, at in rows:
             mb = size / (1024*1024) if size else 0
             lines.append(f"• {platform} — {title} — {mb:.2f} MB")
-        await q.edit_message_text("\n".join(lines), reply_markup=user_panel_keyboard(user_id))
+        await q.edit_message_text("\n".join(lines), reply_markup=user_panel_keyboard(lang))
 
     elif data == "stats":
-        total_count, total_bytes = db.get_user_stats(user_id)
+        total_count, total_bytes = await db.get_user_stats(user_id)
         mb = total_bytes / (1024*1024) if total_bytes else 0
-        await q.edit_message_text(f"📊 کل دانلودها: {total_count}\n📦 مجموع حجم: {mb:.2f} MB", reply_markup=user_panel_keyboard(user_id))
+        await q.edit_message_text(f"📊 کل دانلودها: {total_count}\n📦 مجموع حجم: {mb:.2f} MB", reply_markup=user_panel_keyboard(lang))
 
     elif data == "download_audio":
-        await q.edit_message_text("🔊 برای دانلود صدا، لینک Spotify یا SoundCloud بفرستید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")]]))
+        await q.edit_message_text("🔊 برای دانلود صدا، لینک Spotify یا SoundCloud بفرستید.", reply_markup=back_keyboard(lang))
 
     elif data == "download_video":
-        await q.edit_message_text("🎬 برای دانلود ویدیو، لینک YouTube/Instagram/TikTok بفرستید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(get_text("btn_back", lang), callback_data="back")]]))
+        await q.edit_message_text("🎬 برای دانلود ویدیو، لینک YouTube/Instagram/TikTok بفرستید.", reply_markup=back_keyboard(lang))
 
     elif data == "queue_status":
-        qsize = downloader.download_queue.qsize()
-        await q.edit_message_text(f"🗂 تعداد در صف: {qsize}", reply_markup=user_panel_keyboard(user_id))
+        total = downloader.pending_count()
+        pos = downloader.queue_position(user_id)
+        if pos:
+            text = get_text("queue_position", lang, position=pos[0], wait=pos[1], total=total)
+        else:
+            text = get_text("queue_empty", lang, total=total)
+        await q.edit_message_text(text, reply_markup=user_panel_keyboard(lang))
 
     elif data == "cancel_current":
-        await q.edit_message_text(get_text("cancel_info", lang), reply_markup=user_panel_keyboard(user_id))
+        await q.edit_message_text(get_text("cancel_info", lang), reply_markup=user_panel_keyboard(lang))
 
     elif data == "back":
-        await q.edit_message_text(get_text("welcome_sub", lang), reply_markup=welcome_keyboard(user_id))
+        await q.edit_message_text(get_text("welcome_sub", lang), reply_markup=welcome_keyboard(lang))
 
     else:
         await q.answer("در حال توسعه...")
 
 # ---------------- Text message handler (enqueue) ----------------
-async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def _allowed_urls(urls, registered: bool):
+    """returns (allowed, reason) — reason کلید پیام اگر هیچ لینکی مجاز نیست"""
+    supported = [u for u in urls if detect_platform(u)]
+    if not supported:
+        return [], "invalid_link"
+    if registered:
+        return supported, None
+    # guest rules: only instagram videos and spotify audio allowed
+    allowed = [u for u in supported if detect_platform(u) in ("instagram", "spotify")]
+    return allowed, (None if allowed else "guest_must_register")
+
+async def _enqueue(message, context, user_id: int, urls, profile):
     """
-    این هندلر فقط وقتی اجرا می‌شود که ConversationHandlerها کاری نکنند.
-    اگر user در وسط ثبت‌نام/ورود باشد، پیام‌ها توسط ConversationHandler مدیریت می‌شوند.
+    چک سهمیه، صف و ارسال تأیید — مشترک بین پیام لینک و /playlist
+    (سقف روزانه‌ی دقیق را enqueue_downloads در یک تراکنش حساب می‌کند؛ این چک فقط رد سریع از کش است)
     """
-    user_id = update.effective_user.id
-    lang = db.get_user_lang(user_id)
-    text = (update.message.text or "").strip()
-
-    # basic url check
-    if not (text.startswith("http://") or text.startswith("https://")):
-        await update.message.reply_text(get_text("invalid_link", lang))
+    lang = profile["lang"]
+    registered = profile["registered"]
+    limit = config.REGISTERED_DAILY_LIMIT if registered else config.GUEST_DAILY_LIMIT
+    limit_key = "registered_limit" if registered else "guest_limit"
+    if profile["daily_count"] >= limit:
+        await message.reply_text(get_text(limit_key, lang, limit))
         return
 
-    platform = detect_platform(text)
-    if not platform:
-        await update.message.reply_text(get_text("invalid_link", lang))
+    # دیسک پر است: job تازه پذیرفته نمی‌شود تا دانلودهای در حال اجرا تمام شوند
+    if not downloader.disk_available():
+        await message.reply_text(get_text("disk_full", lang))
         return
 
-    # check permissions and limits
-    registered = db.user_exists(user_id)
-    daily = db.get_daily_download_count(user_id)
-
-    if not registered:
-        # guest rules: only instagram videos and spotify audio allowed
-        if platform not in ("instagram", "spotify"):
-            await update.message.reply_text(get_text("guest_must_register", lang))
-            return
-        if daily >= config.GUEST_DAILY_LIMIT:
-            await update.message.reply_text(get_text("guest_limit", lang, config.GUEST_DAILY_LIMIT))
-            return
-    else:
-        if daily >= config.REGISTERED_DAILY_LIMIT:
-            await update.message.reply_text(get_text("registered_limit", lang, config.REGISTERED_DAILY_LIMIT))
-            return
-
     # enqueue
-    job_id = await downloader.enqueue_download(user_id, update.effective_chat.id, text)
+    job_ids, batch_id, reason = await downloader.enqueue_downloads(user_id, message.chat_id, urls, registered=registered)
+    if not job_ids:
+        if reason is None:
+            # همه از کش فرستاده شدند
+            return
+        if reason == "quota":
+            await message.reply_text(get_text(limit_key, lang, limit))
+        else:
+            await message.reply_text(get_text("queue_full", lang, limit=downloader.max_pending_for(registered)))
+        return
     # store last job in chat_data to allow cancel
-    context.chat_data["last_job"] = job_id
+    context.chat_data["last_job"] = job_ids[-1]
 
     # send confirmation with cancel button
-    kb = InlineKeyboardMarkup([[InlineKeyboardButton("🚫 لغو دانلود", callback_data=f"cancel:{job_id}")]])
-    await update.message.reply_text(get_text("added_queue", lang), reply_markup=kb)
+    if batch_id is None:
+        kb = InlineKeyboardMarkup([[InlineKeyboardButton("🚫 لغو دانلود", callback_data=f"cancel:{job_ids[0]}")]])
+        text = get_text("added_queue", lang)
+    else:
+        kb = InlineKeyboardMarkup([[InlineKeyboardButton(get_text("btn_cancel_all", lang), callback_data=f"cancelb:{batch_id}")]])
+        text = get_text("added_queue_batch", lang, count=len(job_ids))
+    if reason:
+        text += "\n" + get_text("batch_partial", lang, skipped=len(urls) - len(job_ids))
+    await message.reply_text(text, reply_markup=kb)
+
+async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    این هندلر فقط وقتی اجرا می‌شود که ConversationHandlerها کاری نکنند.
+    اگر user در وسط ثبت‌نام/ورود باشد، پیام‌ها توسط ConversationHandler مدیریت می‌شوند.
+    یک پیام می‌تواند چند لینک داشته باشد (حداکثر MESSAGE_MAX_URLS)؛ به ترتیب دانلود و ارسال می‌شوند.
+    """
+    user_id = update.effective_user.id
+    # language, registered flag and today's count in one (usually cached) lookup
+    profile = await db.get_user_profile(user_id)
+    lang = profile["lang"]
+
+    urls, reason = _allowed_urls(extract_urls(update.message.text, config.MESSAGE_MAX_URLS), profile["registered"])
+    if not urls:
+        await update.message.reply_text(get_text(reason, lang))
+        return
+    await _enqueue(update.message, context, user_id, urls, profile)
+
+# ---------------- Playlist / album ----------------
+async def playlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/playlist <url> — آیتم‌های فهرست (حداکثر PLAYLIST_MAX_ITEMS) مثل یک پیام چندلینکی در صف می‌روند"""
+    user_id = update.effective_user.id
+    profile = await db.get_user_profile(user_id)
+    lang = profile["lang"]
+    urls, reason = _allowed_urls(extract_urls(" ".join(context.args or []), 1), profile["registered"])
+    if not urls:
+        if context.args:
+            await update.message.reply_text(get_text(reason, lang))
+        else:
+            await update.message.reply_text(get_text("playlist_usage", lang, limit=config.PLAYLIST_MAX_ITEMS))
+        return
+    await update.message.reply_text(get_text("playlist_expanding", lang))
+    # خواندن فهرست شبکه‌ای است؛ update های بعدی پشت آن نمی‌مانند
+    context.application.create_task(_expand_playlist(update.message, context, user_id, urls[0]),
+                                    update=update)
+
+async def _expand_playlist(message, context, user_id: int, url: str):
+    profile = await db.get_user_profile(user_id)
+    entries, _reason = _allowed_urls(await downloader.expand_playlist(url), profile["registered"])
+    if not entries:
+        await message.reply_text(get_text("playlist_empty", profile["lang"]))
+        return
+    await _enqueue(message, context, user_id, entries, profile)
 
 # ---------------- Cancel callback ----------------
 async def cancel_download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -319,29 +421,241 @@ async def cancel_download_callback(update: Update, context: ContextTypes.DEFAULT
         await q.answer()
         return
     job_id = data.split(":", 1)[1]
-    downloader.canceled_jobs.add(job_id)
-    lang = db.get_user_lang(q.from_user.id)
+    ok = await downloader.cancel_job(job_id, q.from_user.id)
+    lang = await db.get_user_lang(q.from_user.id)
+    try:
+        await q.edit_message_text(get_text("cancelled" if ok else "cancel_too_late", lang))
+    except Exception:
+        pass
+
+async def cancel_batch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    batch_id = q.data.split(":", 1)[1]
+    count = await downloader.cancel_batch(batch_id, q.from_user.id)
+    lang = await db.get_user_lang(q.from_user.id)
     try:
-        await q.edit_message_text(get_text("cancelled", lang))
+        await q.edit_message_text(get_text("cancelled_batch", lang, count=count) if count else get_text("cancel_too_late", lang))
     except Exception:
         pass
 
+# ---------------- Admin: profiling ----------------
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [seconds] [cpu|stack] — فقط ADMIN_IDS؛ گزارش به صورت فایل متنی فرستاده می‌شود"""
+    if update.effective_user.id not in config.ADMIN_IDS:
+        return
+    args = context.args or []
+    try:
+        seconds = min(max(int(args[0]), 1), config.PROFILE_MAX_SEC) if args else 10
+    except ValueError:
+        seconds = 10
+    mode = args[1] if len(args) > 1 and args[1] in profiler.MODES else "cpu"
+    await update.message.reply_text(f"⏱ profiling ({mode}) for {seconds}s...")
+    # پروفایل باید در پس‌زمینه اجرا شود تا update های بعدی (بار واقعی) پردازش شوند
+    context.application.create_task(_run_profile(update.message, seconds, mode), update=update)
+
+async def _run_profile(message, seconds: int, mode: str):
+    report = await profiler.capture(seconds, mode)
+    if report is None:
+        await message.reply_text("⚠️ یک پروفایل دیگر در حال اجراست.")
+        return
+    name = f"profile-{mode}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+    await message.reply_document(io.BytesIO(report.encode()), filename=name)
+
 # ---------------- Background tasks (post_init) ----------------
+async def _warm_up_translations():
+    # translate catalog keys that are missing or changed (network, so off the loop), then rebuild menus
+    await asyncio.to_thread(messages.warm_up)
+    build_keyboards()
+
 async def post_init(app: Application):
+    # write-behind flush loop for save_download
+    db.start()
+    await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)
+    # translate catalog keys that are missing or changed (network, so off the loop)
+    app.create_task(_warm_up_translations())
+    # jobs left unfinished by the previous run go back to the queue
+    requeued, failed = await downloader.recover_jobs(app.bot)
+    if requeued or failed:
+        logger.info("Recovered %d jobs (%d failed).", requeued, failed)
     # schedule worker and cleanup inside running loop (safe)
-    app.create_task(downloader.worker_loop(app))
-    app.create_task(downloader.cleanup_loop())
+    downloader.start_workers(app)
     logger.info("Background workers scheduled.")
 
-# ---------------- Setup and run ----------------
-def main():
-    # init db
-    db.init_db()
+async def post_shutdown(app: Application):
+    await metrics.stop_server()
+    await downloader.stop_workers()
+    await db.close()
+    logger.info("Background workers stopped.")
 
-    app = Application.builder().token(TOKEN).post_init(post_init).build()
+# ---------------- Update latency (polling vs webhook) ----------------
+class _StampedQueue(asyncio.Queue):
+    """
+    update_queue برنامه: Updater (polling) و وب‌سرور webhook هر دو اینجا put می‌کنند؛
+    زمان رسیدن هر update ثبت می‌شود تا تأخیر تا handler اندازه‌گیری شود.
+    """
+    def __init__(self):
+        super().__init__()
+        self.stamps = {}
+
+    def put_nowait(self, item):
+        if isinstance(item, Update):
+            self.stamps[item.update_id] = time.monotonic()
+        super().put_nowait(item)
+
+_update_queue = _StampedQueue()
+# queue: رسیدن به process تا handler — e2e: زمان پیام در تلگرام تا handler (دقت ثانیه، فقط پیام‌ها)
+update_latency = {"mode": "polling", "count": 0, "queue_total": 0.0, "queue_max": 0.0,
+                  "e2e_count": 0, "e2e_total": 0.0, "e2e_max": 0.0}
+
+async def _track_latency(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    received = _update_queue.stamps.pop(update.update_id, None)
+    st = update_latency
+    if received is not None:
+        lag = time.monotonic() - received
+        st["count"] += 1
+        st["queue_total"] += lag
+        st["queue_max"] = max(st["queue_max"], lag)
+    msg = update.message or update.edited_message
+    if msg is not None and msg.date is not None:
+        e2e = max(0.0, time.time() - msg.date.timestamp())
+        st["e2e_count"] += 1
+        st["e2e_total"] += e2e
+        st["e2e_max"] = max(st["e2e_max"], e2e)
+    if st["count"] and st["count"] % config.UPDATE_LATENCY_LOG_EVERY == 0:
+        logger.info("update latency (%s): queue avg %.1f ms max %.1f ms, e2e avg %.2fs max %.0fs",
+                    st["mode"], st["queue_total"] / st["count"] * 1000, st["queue_max"] * 1000,
+                    st["e2e_total"] / max(st["e2e_count"], 1), st["e2e_max"])
+
+# ---------------- Metrics ----------------
+metrics.histogram("bot_handler_seconds", "Time spent in each update handler")
+metrics.counter("bot_handler_errors_total", "Handlers that raised, by handler and exception class")
+
+def _timed(callback):
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.monotonic()
+        try:
+            with tracing.span(f"handler:{name}"):
+                return await callback(update, context)
+        except Exception as e:
+            metrics.inc("bot_handler_errors_total", handler=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", time.monotonic() - started, handler=name)
+    return wrapper
+
+def _instrument_handlers(handlers):
+    """callback همه‌ی handler ها (و handler های داخل ConversationHandler) زمان‌گیری می‌شود"""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            _instrument_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                _instrument_handlers(state_handlers)
+            _instrument_handlers(handler.fallbacks)
+        elif getattr(handler, "callback", None) is not None:
+            handler.callback = _timed(handler.callback)
+
+def _update_kind(update) -> str:
+    if isinstance(update, Update):
+        if update.callback_query is not None:
+            return "callback"
+        msg = update.effective_message
+        if msg is not None and msg.text and msg.text.startswith("/"):
+            return "command"
+        if msg is not None:
+            return "message"
+    return "other"
+
+class TracedApplication(Application):
+    """هر update یک trace دارد: handler ها، DB و Bot API فرزندان آن هستند"""
+    async def process_update(self, update: object) -> None:
+        user = getattr(update, "effective_user", None)
+        with tracing.trace("update", config.TRACE_SLOW_UPDATE_SEC, kind=_update_kind(update),
+                           user=user.id if user else None):
+            await super().process_update(update)
+
+def _collect_metrics():
+    """آمارهایی که ماژول‌ها خودشان نگه می‌دارند، هنگام هر scrape"""
+    yield "bot_queue_pending", "gauge", "Jobs waiting for a download worker", {}, downloader.pending_count()
+    yield "bot_transcode_queue", "gauge", "Downloaded files waiting for a transcode worker", {}, downloader._transcode_queue.qsize()
+    yield "bot_upload_queue", "gauge", "Downloaded files waiting for an upload worker", {}, downloader._upload_queue.qsize()
+    yield "bot_active_jobs", "gauge", "Jobs claimed by a worker (download or upload)", {}, len(downloader._active_jobs)
+    for stage, st in downloader.stage_stats.items():
+        yield "bot_stage_seconds_total", "counter", "Pipeline stage time", {"stage": stage}, st["total_sec"]
+        yield "bot_stage_count_total", "counter", "Pipeline stage samples", {"stage": stage}, st["count"]
+    yield "bot_cancel_seconds_total", "counter", "Cancel request to worker free", {}, downloader.cancel_stats["total_sec"]
+    yield "bot_cancel_count_total", "counter", "Cancelled running downloads", {}, downloader.cancel_stats["count"]
+    for key, value in workspace.metrics().items():
+        if key in workspace.disk_stats:
+            yield f"bot_workspace_{key}_total", "counter", f"Workspace manager: {key}", {}, value
+        else:
+            yield f"bot_workspace_{key}", "gauge", f"Workspace manager: {key}", {}, value
+    yield "bot_download_folder_bytes", "gauge", "Bytes on disk under DOWNLOAD_FOLDER", {}, workspace.cached_folder_bytes()
+    for key, value in sender.send_stats.items():
+        yield f"bot_send_{key}_total", "counter", f"Outbound limiter: {key}", {}, value
+    for key, value in transcode.transcode_stats.items():
+        yield f"bot_transcode_{key}_total", "counter", f"Transcode stage: {key}", {}, value
+    # در backend process فقط probe ها (thread های همین process) شمرده می‌شوند
+    for key, value in ytdl_pool.ydl_stats.items():
+        yield "bot_ytdl_instances_total", "counter", "Warm YoutubeDL: created/reused/discarded, extractor direct/scan", {"event": key}, value
+    for name, stats in (("media", db.media_cache_stats), ("profile", db.profile_cache_stats),
+                        ("catalog", messages.catalog_stats)):
+        for key, value in stats.items():
+            yield "bot_cache_events_total", "counter", "Cache hits/misses by cache", {"cache": name, "event": key}, value
+    for key, value in tracing.trace_stats.items():
+        yield "bot_traces_total", "counter", "Tracing: started/unsampled/slow traces and dropped spans", {"event": key}, value
+    st = update_latency
+    yield "bot_update_queue_seconds_total", "counter", "Update arrival to handler", {}, st["queue_total"]
+    yield "bot_update_queue_count_total", "counter", "Updates timed", {}, st["count"]
+
+def _webhook_secret() -> str:
+    # همه‌ی instance ها بدون تنظیم اضافه روی یک secret توافق دارند
+    return config.WEBHOOK_SECRET or hashlib.sha256(f"webhook:{TOKEN}".encode()).hexdigest()[:48]
+
+def _update_mode() -> str:
+    if config.UPDATE_MODE != "webhook":
+        return "polling"
+    if not config.WEBHOOK_URL:
+        logger.warning("UPDATE_MODE=webhook but WEBHOOK_URL is not set; falling back to polling.")
+        return "polling"
+    # وب‌سرور داخلی python-telegram-bot[webhooks]
+    if importlib.util.find_spec("tornado") is None:
+        logger.warning("tornado is not installed (python-telegram-bot[webhooks]); falling back to polling.")
+        return "polling"
+    return "webhook"
+
+# ---------------- Setup and run ----------------
+def build_application(request=None, get_updates_request=None) -> Application:
+    """
+    Application با همه‌ی handler ها؛ main و bench_load.py (با request جعلی و بدون شبکه) از آن استفاده می‌کنند
+    request / get_updates_request: telegram.request.BaseRequest جایگزین (پیش‌فرض httpx)
+    """
+    # همه‌ی ارسال‌ها (handler ها و downloader) از زمان‌بند sender رد می‌شوند
+    builder = (Application.builder().application_class(TracedApplication).token(TOKEN)
+               .rate_limiter(sender.OutboundLimiter())
+               .update_queue(_update_queue).post_init(post_init).post_shutdown(post_shutdown))
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    if config.LOCAL_BOT_API:
+        # فایل‌ها با مسیر محلی (file://) فرستاده می‌شوند و سقف آپلود 2GB است
+        builder = (builder.base_url(f"{config.LOCAL_BOT_API_URL}/bot")
+                   .base_file_url(f"{config.LOCAL_BOT_API_URL}/file/bot").local_mode(True))
+        logger.info("Using local Bot API server at %s (upload limit %d MB).",
+                    config.LOCAL_BOT_API_URL, config.MAX_UPLOAD_SIZE // (1024 * 1024))
+    app = builder.build()
+
+    # latency of every update (group -1 runs before the real handlers and never blocks them)
+    app.add_handler(TypeHandler(Update, _track_latency), group=-1)
 
     # basic handlers
     app.add_handler(CommandHandler("start", start_handler))
+    app.add_handler(CommandHandler("playlist", playlist_command))
+    app.add_handler(CommandHandler("profile", profile_command))
     app.add_handler(CallbackQueryHandler(help_callback, pattern="^help$"))
     app.add_handler(CallbackQueryHandler(main_menu_callback, pattern="^main_menu$"))
     app.add_handler(CallbackQueryHandler(set_lang_callback, pattern="^set_lang$"))
@@ -374,6 +688,7 @@ def main():
 
     # cancel job callback
     app.add_handler(CallbackQueryHandler(cancel_download_callback, pattern="^cancel:"))
+    app.add_handler(CallbackQueryHandler(cancel_batch_callback, pattern="^cancelb:"))
 
     # admin stats (optional)
     # app.add_handler(CommandHandler("stats", stats_command))
@@ -381,8 +696,35 @@ def main():
     # main text handler (enqueue)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
 
-    logger.info("Bot starting (polling)...")
-    app.run_polling()
+    for handlers in app.handlers.values():
+        _instrument_handlers(handlers)
+    metrics.register_collector(_collect_metrics)
+    return app
+
+def main():
+    # init db
+    db.init_db()
+    # DOWNLOAD_PROFILES غلط همین‌جا (نه وسط اولین دانلود) خطا می‌دهد
+    profiles.validate()
+    app = build_application()
+
+    mode = _update_mode()
+    update_latency["mode"] = mode
+    if mode == "webhook":
+        # Telegram هر update را با هدر X-Telegram-Bot-Api-Secret-Token می‌فرستد؛ بقیه با 403 رد می‌شوند
+        logger.info("Bot starting (webhook on :%d/%s)...", config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+        app.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=f"{config.WEBHOOK_URL}/{config.WEBHOOK_PATH}",
+            secret_token=_webhook_secret(),
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        # start_polling خودش webhook قبلی را حذف می‌کند
+        logger.info("Bot starting (polling)...")
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,6 @@
 # config.py
+import os
+
 BOT_NAME = "بات دانلودر حرفه ای"
 
 # محدودیت‌ها
@@ -8,9 +10,155 @@ REGISTERED_DAILY_LIMIT = 25
 # مسیرها و تنظیمات دانلود
 DATABASE_PATH = "downloads.db"
 DOWNLOAD_FOLDER = "downloads"
-MAX_VIDEO_DOC_SIZE = 50 * 1024 * 1024  # اگر بزرگتر بود به صورت document می‌فرستیم
-CLEANUP_OLDER_THAN_SEC = 10 * 60  # فایل‌های قدیمی‌تر از 10 دقیقه پاک شوند
+# سرور محلی telegram-bot-api (حالت --local)؛ خالی = Bot API عمومی
+# مثال: http://telegram-bot-api:8081 — DOWNLOAD_FOLDER باید با همان مسیر مطلق روی سرور دیده شود
+LOCAL_BOT_API_URL = os.getenv("LOCAL_BOT_API_URL", "").rstrip("/")
+LOCAL_BOT_API = bool(LOCAL_BOT_API_URL)
+CLOUD_UPLOAD_LIMIT = 50 * 1024 * 1024  # سقف آپلود Bot API عمومی
+LOCAL_UPLOAD_LIMIT = 2000 * 1024 * 1024  # سقف آپلود سرور محلی
+UPLOAD_TIMEOUT_SEC = 600  # فایل‌های بزرگ (مخصوصاً در حالت محلی) زمان می‌برند
+MAX_VIDEO_DOC_SIZE = LOCAL_UPLOAD_LIMIT if LOCAL_BOT_API else CLOUD_UPLOAD_LIMIT  # اگر بزرگتر بود به صورت document می‌فرستیم
+CLEANUP_OLDER_THAN_SEC = 10 * 60  # پوشه‌های یتیم (بدون job زنده) قدیمی‌تر از 10 دقیقه پاک شوند
+CLEANUP_INTERVAL_SEC = 5 * 60  # فاصله‌ی اجرای cleanup_loop (پوشه‌های یتیم، کش، job های گیرکرده)
+# بودجه‌ی دیسک (workspace.py): job تازه وقتی پذیرفته می‌شود که بعد از رزرو، این مقدار آزاد بماند
+WORKSPACE_MIN_FREE_MB = 1024
+WORKSPACE_DEFAULT_RESERVE_MB = 256  # وقتی probe حجم را نمی‌داند
 
 # yt-dlp default options (قابل تغییر)
 YTDL_DEFAULT_VIDEO_FORMAT = "bestvideo[height<=720]+bestaudio/best/best"
 YTDL_DEFAULT_AUDIO_FORMAT = "bestaudio/best"
+
+# پروفایل دانلود هر پلتفرم (profiles.py) — کلید = utils.detect_platform، بقیه‌ی لینک‌ها "default"
+# هر پلتفرم فقط کلیدهایی را که با default فرق دارد می‌نویسد؛ در startup بررسی می‌شود.
+# concurrent_fragments: fragment های HLS/DASH همزمان — http_chunk_size: بایت، 0 = یک درخواست
+# external_downloader: مثلاً "aria2c" (اگر نصب نباشد downloader خود yt-dlp)
+DOWNLOAD_PROFILES = {
+    "default": {
+        "format": YTDL_DEFAULT_VIDEO_FORMAT,
+        "audio": False,
+        "merge_output_format": "mp4",
+        "concurrent_fragments": 1,
+        "http_chunk_size": 0,
+        "retries": 10,
+        "fragment_retries": 10,
+        "external_downloader": None,
+        "external_downloader_args": [],
+    },
+    # DASH؛ درخواست‌های chunk شده از throttle سرعت یوتیوب روی اتصال‌های طولانی جلوگیری می‌کنند
+    "youtube": {"concurrent_fragments": 4, "http_chunk_size": 10 * 1024 * 1024},
+    "instagram": {"concurrent_fragments": 4},
+    "tiktok": {"concurrent_fragments": 2},
+    # HLS
+    "soundcloud": {"format": YTDL_DEFAULT_AUDIO_FORMAT, "audio": True, "concurrent_fragments": 4},
+    "spotify": {"format": YTDL_DEFAULT_AUDIO_FORMAT, "audio": True},
+}
+
+# کش نتایج (file_id تلگرام) برای لینک‌های تکراری
+RESULT_CACHE_TTL_SEC = 7 * 24 * 3600  # file_id ها بعد از یک هفته منقضی حساب می‌شوند
+RESULT_CACHE_MAX_ROWS = 50000  # بیشتر از این، قدیمی‌ترین‌ها حذف می‌شوند
+
+# صف دانلود: تعداد worker های همزمان و سقف همزمانی هر پلتفرم
+DOWNLOAD_WORKERS = 4
+# مرحله‌ی آپلود جدا از دانلود: worker های دانلود بعد از آماده شدن فایل آزاد می‌شوند
+UPLOAD_WORKERS = 2  # آپلودهای همزمان به تلگرام
+UPLOAD_QUEUE_SIZE = 2  # فایل‌های آماده‌ی منتظر آپلود؛ پر باشد دانلودها صبر می‌کنند (سقف فایل روی دیسک)
+STAGE_STATS_LOG_EVERY = 50  # هر چند آپلود زمان مراحل لاگ شود
+# endpoint متنی Prometheus روی http://METRICS_HOST:METRICS_PORT/metrics (0 = خاموش)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# tracing هر update و job (tracing.py): درصد trace ها و آستانه‌ی لاگ درخت span های کند
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SLOW_UPDATE_SEC = 1.0
+TRACE_SLOW_JOB_SEC = 300
+TRACE_MAX_SPANS = 200  # سقف span های هر trace (job های طولانی صدها کوئری دارند)
+# دستور /profile فقط برای این کاربرها (لیست id با کاما)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+PROFILE_MAX_SEC = 60
+PROFILE_SAMPLE_MS = 10
+# اجرای yt-dlp: "thread" (همین process) یا "process" (pool جدا، ytdl_pool.py)
+YTDL_BACKEND = os.getenv("YTDL_BACKEND", "thread").lower()
+YTDL_MAX_TASKS_PER_CHILD = 20  # process بعد از این تعداد job عوض می‌شود
+YTDL_MEMORY_LIMIT_MB = 2048  # سقف حافظه‌ی هر process (0 = بدون سقف)
+YTDL_CPU_LIMIT_SEC = 900  # سقف CPU هر job در backend process (0 = بدون سقف)
+YTDL_JOB_TIMEOUT_SEC = 1800  # سقف زمان هر دانلود در هر دو backend (0 = بدون سقف)
+YTDL_SOCKET_TIMEOUT_SEC = 30  # اتصال بی‌جواب بعد از این مدت خطا می‌دهد (thread دانلود بدون hook گیر نمی‌ماند)
+YTDL_KILL_GRACE_SEC = 15  # backend process: job ای که این مدت بعد از لغو/timeout هنوز تمام نشده kill می‌شود
+YTDL_REUSE_MAX_JOBS = 50  # YoutubeDL گرم هر thread بعد از این تعداد job دوباره ساخته می‌شود (0 = هر job تازه)
+PLATFORM_CONCURRENCY = {
+    "youtube": 2,  # دانلودهای طولانی؛ نباید همه worker ها را بگیرند
+    "instagram": 3,
+    "tiktok": 3,
+    "soundcloud": 2,
+    "spotify": 2,
+}
+DEFAULT_PLATFORM_CONCURRENCY = 1
+
+# زمان‌بندی منصفانه بین کاربران (deficit round robin)
+REGISTERED_QUEUE_WEIGHT = 2  # کاربر عضو در هر دور دو job برمی‌دارد
+GUEST_QUEUE_WEIGHT = 1
+REGISTERED_MAX_PENDING = 10  # سقف job های در انتظار هر کاربر
+GUEST_MAX_PENDING = 3
+# چند لینک در یک پیام، و /playlist (آیتم‌ها به ترتیب دانلود و به همان ترتیب ارسال می‌شوند)
+MESSAGE_MAX_URLS = 10
+PLAYLIST_MAX_ITEMS = 10  # سقف آیتم‌های هر playlist/album
+
+# صف پایدار (جدول jobs در دیتابیس)
+JOB_LEASE_SEC = 120  # اگر worker در این مدت heartbeat نفرستد، job دوباره به صف برمی‌گردد
+JOB_HEARTBEAT_SEC = 30
+JOB_MAX_ATTEMPTS = 3  # بعد از این تعداد تلاش (مثلاً crash های پشت سر هم) job شکست‌خورده حساب می‌شود
+JOB_HISTORY_KEEP_SEC = 3 * 24 * 3600  # job های تمام‌شده بعد از این مدت پاک می‌شوند
+
+# دیتابیس: save_download ها در بافر جمع و دسته‌ای نوشته می‌شوند
+DB_WRITE_BATCH_SIZE = 100
+DB_WRITE_FLUSH_SEC = 1.0
+
+# کش پروفایل کاربران (زبان، عضویت، تعداد دانلود امروز)
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL_SEC = 300
+
+# ترجمه: catalog از پیش ساخته‌شده (python messages.py)
+TRANSLATION_CATALOG_PATH = "translations.json"
+
+# پیش‌بررسی (probe) قبل از دانلود
+MAX_UPLOAD_SIZE = LOCAL_UPLOAD_LIMIT if LOCAL_BOT_API else CLOUD_UPLOAD_LIMIT
+MAX_VIDEO_HEIGHT = 720
+MAX_MEDIA_DURATION_SEC = 3 * 3600  # 0 = بدون محدودیت
+PROBE_WORKERS = 2
+PROBE_CACHE_TTL_SEC = 10 * 60
+PROBE_CACHE_SIZE = 500
+
+# مرحله‌ی اختیاری ffmpeg بعد از دانلود (transcode.py)
+TRANSCODE_ENABLED = os.getenv("TRANSCODE_ENABLED", "0") == "1"
+TRANSCODE_MAX_INPUT_MB = 1024  # فایل بزرگ‌تر از سقف آپلود تا این حجم دانلود و فشرده می‌شود
+TRANSCODE_WORKERS = 1  # ffmpeg های همزمان
+TRANSCODE_QUEUE_SIZE = 2  # فایل‌های دانلودشده‌ی منتظر transcode؛ پر باشد دانلودها صبر می‌کنند
+TRANSCODE_THREADS = 2  # thread های هر ffmpeg
+TRANSCODE_NICE = 10
+TRANSCODE_TIMEOUT_SEC = 1800
+TRANSCODE_PRESET = "veryfast"
+TRANSCODE_CRF = 26  # کیفیت؛ حجم با maxrate محاسبه‌شده محدود می‌شود
+TRANSCODE_SIZE_MARGIN = 0.92  # سربار container و نوسان bitrate
+TRANSCODE_MIN_VIDEO_KBPS = 200  # کمتر از این ارزش فشرده‌سازی ندارد (job رد می‌شود)
+TRANSCODE_VIDEO_AUDIO_KBPS = 96
+TRANSCODE_AUDIO_CODEC = "mp3"  # "mp3" یا "opus"
+TRANSCODE_AUDIO_KBPS = 128
+
+# ارسال به تلگرام (sender.OutboundLimiter)
+SEND_GLOBAL_RATE = 25  # پیام در ثانیه برای کل بات (سقف تلگرام ~30)
+SEND_GLOBAL_BURST = 25
+SEND_CHAT_RATE = 1  # هر chat خصوصی ~1 پیام در ثانیه
+SEND_CHAT_BURST = 3
+SEND_GROUP_RATE = 20 / 60  # گروه‌ها ۲۰ پیام در دقیقه
+SEND_MAX_RETRIES = 3  # چند بار بعد از RetryAfter دوباره فرستاده شود
+SEND_UPLOAD_CONCURRENCY = 2  # آپلودهای همزمان فایل
+STATUS_EDIT_INTERVAL_SEC = 3  # فاصله‌ی حداقل بین ویرایش‌های پیام وضعیت (پیشرفت دانلود)
+
+# دریافت update ها: "polling" (پیش‌فرض) یا "webhook" از وب‌سرور داخلی python-telegram-bot
+# اگر webhook ممکن نباشد (آدرس عمومی یا tornado نباشد) به polling برمی‌گردد
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = (os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL", "")).rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # خالی = از TOKEN مشتق می‌شود
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+UPDATE_LATENCY_LOG_EVERY = 200  # هر چند update خلاصه‌ی تأخیر لاگ شود
@@ -1,15 +1,65 @@
 # database.py
+"""
+همه‌ی کوئری‌ها روی یک thread اختصاصی با یک connection ماندگار اجرا می‌شوند تا event loop
+منتظر دیسک نماند؛ توابع عمومی async هستند و از handler ها با await صدا زده می‌شوند.
+"""
+import asyncio
+import logging
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from config import DATABASE_PATH
+import metrics
+import tracing
+from config import (
+    DATABASE_PATH, RESULT_CACHE_TTL_SEC, RESULT_CACHE_MAX_ROWS, JOB_MAX_ATTEMPTS,
+    DB_WRITE_BATCH_SIZE, DB_WRITE_FLUSH_SEC, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SEC,
+)
 
-def _conn():
-    return sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+logger = logging.getLogger(__name__)
 
-def init_db():
-    conn = _conn()
+# شمارنده‌های کش نتایج (برای لاگ/آمار)
+media_cache_stats = {"hits": 0, "misses": 0, "stale": 0, "evicted": 0}
+
+metrics.histogram("bot_db_query_seconds", "DB calls as seen by the caller (db thread queue wait included)")
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+_local = threading.local()
+# write-behind buffer for save_download: (user_id, platform, url, title, size, downloaded_at)
+_download_buffer: deque = deque()
+_flush_task = None
+
+# LRU/TTL cache of user profiles: user_id -> (expires_at, profile)
+# فقط از event loop استفاده می‌شود (wrapper های async)، پس قفل لازم نیست
+_profiles: OrderedDict = OrderedDict()
+# با هر invalidate زیاد می‌شود تا load همزمان، داده‌ی کهنه را دوباره در کش نگذارد
+_profile_gen = 0
+profile_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _db():
+    """connection ماندگار همین thread (statement cache روی همین connection می‌ماند)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.execute('PRAGMA synchronous=NORMAL;')
+        _local.conn = conn
+    return conn
+
+async def _run(fn, *args):
+    query = fn.__name__.lstrip("_")
+    started = time.monotonic()
+    try:
+        with tracing.span("db", query=query):
+            return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        metrics.observe("bot_db_query_seconds", time.monotonic() - started, query=query)
+
+def _init_db():
+    conn = _db()
     c = conn.cursor()
-    c.execute('PRAGMA journal_mode=WAL;')
     c.execute('''
     CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY,
@@ -31,12 +81,114 @@ def init_db():
         downloaded_at TEXT
     )
     ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS media_cache (
+        cache_key TEXT PRIMARY KEY,
+        file_id TEXT,
+        kind TEXT,
+        title TEXT,
+        size INTEGER,
+        created_at REAL,
+        last_hit_at REAL,
+        hits INTEGER DEFAULT 0
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_media_cache_last_hit ON media_cache(last_hit_at)')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        chat_id INTEGER,
+        url TEXT,
+        platform TEXT,
+        weight INTEGER,
+        state TEXT,
+        attempts INTEGER DEFAULT 0,
+        worker TEXT,
+        lease_until REAL,
+        error TEXT,
+        created_at REAL,
+        updated_at REAL
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state)')
     conn.commit()
-    conn.close()
+    _migrate(conn)
+
+# schema migrations — PRAGMA user_version نسخه‌ی فعلی را نگه می‌دارد
+def _migrate_1(c):
+    """
+    سهمیه‌ی روزانه: شمارنده‌ی (user_id, day) به جای COUNT روی کل تاریخچه،
+    و index برای کوئری‌های downloads بر اساس کاربر.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS idx_downloads_user_time ON downloads(user_id, downloaded_at)')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS daily_counts (
+        user_id INTEGER,
+        day TEXT,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    ''')
+    # backfill از تاریخچه‌ی موجود (downloaded_at به صورت isoformat: ده کاراکتر اول = روز)
+    c.execute('''
+    INSERT OR REPLACE INTO daily_counts (user_id, day, count)
+    SELECT user_id, substr(downloaded_at, 1, 10), COUNT(*) FROM downloads GROUP BY user_id, substr(downloaded_at, 1, 10)
+    ''')
+
+_MIGRATIONS = [_migrate_1]
+
+def _migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for i, step in enumerate(_MIGRATIONS[version:], start=version + 1):
+        c = conn.cursor()
+        c.execute('BEGIN')
+        try:
+            step(c)
+            c.execute(f'PRAGMA user_version={i}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def init_db():
+    """sync — called from main() before the event loop starts"""
+    _executor.submit(_init_db).result()
+
+def _close():
+    _flush_downloads()
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(DB_WRITE_FLUSH_SEC)
+        try:
+            await _run(_flush_downloads)
+        except Exception:
+            # ردیف‌ها در بافر مانده‌اند؛ flush بعدی دوباره تلاش می‌کند
+            logger.exception("write-behind flush of %d downloads failed", len(_download_buffer))
+
+def start():
+    """flush loop بافر save_download — called from bot.post_init"""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_loop())
+
+async def close():
+    """called from bot.post_shutdown: بافر خالی و connection بسته می‌شود"""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await _run(_close)
+
 
 # user management
-def create_user(user_id: int, username: str, fullname: str, password: str, lang: str = 'fa') -> bool:
-    conn = _conn()
+def _create_user(user_id: int, username: str, fullname: str, password: str, lang: str = 'fa') -> bool:
+    conn = _db()
     c = conn.cursor()
     try:
         c.execute('INSERT INTO users (user_id, username, fullname, password, language, created_at) VALUES (?,?,?,?,?,?)',
@@ -44,83 +196,404 @@ def create_user(user_id: int, username: str, fullname: str, password: str, lang:
         conn.commit()
         return True
     except sqlite3.IntegrityError:
+        conn.rollback()
         return False
-    finally:
-        conn.close()
 
-def user_exists(user_id: int) -> bool:
-    conn = _conn()
+def _user_exists(user_id: int) -> bool:
+    conn = _db()
     c = conn.cursor()
     c.execute('SELECT 1 FROM users WHERE user_id=?', (user_id,))
     res = c.fetchone() is not None
-    conn.close()
     return res
 
-def get_user_by_username(username: str):
-    conn = _conn()
+def _get_user_by_username(username: str):
+    conn = _db()
     c = conn.cursor()
     c.execute('SELECT user_id, username, fullname, password, language FROM users WHERE username=?', (username,))
     row = c.fetchone()
-    conn.close()
     return row
 
-def get_user_by_id(user_id: int):
-    conn = _conn()
+def _get_user_by_id(user_id: int):
+    conn = _db()
     c = conn.cursor()
     c.execute('SELECT user_id, username, fullname, password, language FROM users WHERE user_id=?', (user_id,))
     row = c.fetchone()
-    conn.close()
     return row
 
-def check_login(username: str, password: str):
-    row = get_user_by_username(username)
+def _check_login(username: str, password: str):
+    row = _get_user_by_username(username)
     if not row:
         return None
     return row if row[3] == password else None
 
-def set_user_lang(user_id: int, lang: str):
-    conn = _conn()
+def _set_user_lang(user_id: int, lang: str):
+    conn = _db()
     c = conn.cursor()
     c.execute('UPDATE users SET language=? WHERE user_id=?', (lang, user_id))
     conn.commit()
-    conn.close()
 
-def get_user_lang(user_id: int) -> str:
-    row = get_user_by_id(user_id)
+def _get_user_lang(user_id: int) -> str:
+    row = _get_user_by_id(user_id)
     if not row:
         return 'fa'
     return row[4] or 'fa'
 
 # downloads
-def save_download(user_id: int, platform: str, url: str, title: str, size: int):
-    conn = _conn()
-    c = conn.cursor()
-    c.execute('INSERT INTO downloads (user_id, platform, url, title, size, downloaded_at) VALUES (?,?,?,?,?,?)',
-              (user_id, platform, url, title, size, datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
+def _flush_downloads() -> int:
+    """بافر save_download را در یک تراکنش می‌نویسد"""
+    rows = []
+    while _download_buffer:
+        rows.append(_download_buffer.popleft())
+    if not rows:
+        return 0
+    conn = _db()
+    # insert + شمارنده‌ی روزانه در یک تراکنش
+    try:
+        conn.executemany('INSERT INTO downloads (user_id, platform, url, title, size, downloaded_at) VALUES (?,?,?,?,?,?)', rows)
+        conn.executemany('INSERT INTO daily_counts (user_id, day, count) VALUES (?,?,1) ON CONFLICT(user_id, day) DO UPDATE SET count=count+1',
+                         [(r[0], r[5][:10]) for r in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # ردیف‌ها به ابتدای بافر برمی‌گردند (ترتیب حفظ می‌شود) تا از دست نروند
+        _download_buffer.extendleft(reversed(rows))
+        raise
+    return len(rows)
+
+def _flush_for_read():
+    """
+    تاریخچه با آخرین دانلودها خوانده شود؛ flush ناموفق (قفل، دیسک پر) خواندن را خراب نمی‌کند
+    (ردیف‌ها در بافر می‌مانند و flush loop دوباره تلاش می‌کند)
+    """
+    try:
+        _flush_downloads()
+    except Exception:
+        logger.warning("flush before read failed; %d downloads still buffered", len(_download_buffer), exc_info=True)
+
+def _buffered_count(user_id: int, day: str) -> int:
+    """دانلودهای امروز کاربر که هنوز در بافر write-behind هستند (هنوز در daily_counts نیستند)"""
+    # list(): کپی یک‌جا؛ save_download از event loop به بافر اضافه می‌کند
+    return sum(1 for r in list(_download_buffer) if r[0] == user_id and r[5].startswith(day))
 
-def get_user_downloads(user_id: int, limit: int = 10):
-    conn = _conn()
+def _get_user_downloads(user_id: int, limit: int = 10):
+    _flush_for_read()
+    conn = _db()
     c = conn.cursor()
     c.execute('SELECT platform, title, size, downloaded_at FROM downloads WHERE user_id=? ORDER BY downloaded_at DESC LIMIT ?', (user_id, limit))
     rows = c.fetchall()
-    conn.close()
     return rows
 
-def get_daily_download_count(user_id: int) -> int:
+def _load_profile(user_id: int) -> dict:
+    """language + registered + today's download count در یک رفت‌وبرگشت به thread دیتابیس"""
+    row = _get_user_by_id(user_id)
+    return {
+        "lang": (row[4] or 'fa') if row else 'fa',
+        "registered": row is not None,
+        "daily_count": _get_daily_download_count(user_id),
+        "day": datetime.utcnow().strftime("%Y-%m-%d"),
+    }
+
+def _get_daily_download_count(user_id: int) -> int:
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    conn = _conn()
+    conn = _db()
     c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM downloads WHERE user_id=? AND date(downloaded_at)=?", (user_id, today))
+    c.execute("SELECT count FROM daily_counts WHERE user_id=? AND day=?", (user_id, today))
     row = c.fetchone()
-    conn.close()
-    return row[0] if row else 0
+    return (row[0] if row else 0) + _buffered_count(user_id, today)
 
-def get_user_stats(user_id: int):
-    conn = _conn()
+def _get_user_stats(user_id: int):
+    _flush_for_read()
+    conn = _db()
     c = conn.cursor()
     c.execute("SELECT COUNT(*), SUM(size) FROM downloads WHERE user_id=?", (user_id,))
     row = c.fetchone()
-    conn.close()
     return (row[0] or 0, row[1] or 0)
+
+# media cache (file_id تلگرام برای لینک‌های تکراری)
+def _get_cached_media(cache_key: str):
+    """
+    returns (file_id, kind, title, size) or None
+    رکوردهای منقضی شده همین‌جا حذف می‌شوند.
+    """
+    now = time.time()
+    conn = _db()
+    c = conn.cursor()
+    c.execute('SELECT file_id, kind, title, size, created_at FROM media_cache WHERE cache_key=?', (cache_key,))
+    row = c.fetchone()
+    if row and now - row[4] > RESULT_CACHE_TTL_SEC:
+        c.execute('DELETE FROM media_cache WHERE cache_key=?', (cache_key,))
+        conn.commit()
+        row = None
+    if row:
+        c.execute('UPDATE media_cache SET last_hit_at=?, hits=hits+1 WHERE cache_key=?', (now, cache_key))
+        conn.commit()
+        media_cache_stats["hits"] += 1
+    else:
+        media_cache_stats["misses"] += 1
+    return row[:4] if row else None
+
+def _has_cached_media(cache_key: str) -> bool:
+    """بدون تغییر شمارنده‌ها (برای تصمیم‌های داخلی مثل رد کردن probe)"""
+    c = _db().cursor()
+    c.execute('SELECT 1 FROM media_cache WHERE cache_key=? AND created_at >= ?', (cache_key, time.time() - RESULT_CACHE_TTL_SEC))
+    return c.fetchone() is not None
+
+def _save_cached_media(cache_key: str, file_id: str, kind: str, title: str, size: int):
+    now = time.time()
+    conn = _db()
+    c = conn.cursor()
+    c.execute('INSERT OR REPLACE INTO media_cache (cache_key, file_id, kind, title, size, created_at, last_hit_at, hits) VALUES (?,?,?,?,?,?,?,0)',
+              (cache_key, file_id, kind, title, size, now, now))
+    # eviction: حذف قدیمی‌ترین‌ها (کم‌استفاده‌ترین از نظر زمان) بیشتر از سقف
+    c.execute('SELECT COUNT(*) FROM media_cache')
+    extra = c.fetchone()[0] - RESULT_CACHE_MAX_ROWS
+    if extra > 0:
+        c.execute('DELETE FROM media_cache WHERE cache_key IN (SELECT cache_key FROM media_cache ORDER BY last_hit_at ASC LIMIT ?)', (extra,))
+        media_cache_stats["evicted"] += extra
+    conn.commit()
+
+def _delete_cached_media(cache_key: str, stale: bool = False):
+    """stale=True یعنی تلگرام file_id را رد کرده است"""
+    conn = _db()
+    c = conn.cursor()
+    c.execute('DELETE FROM media_cache WHERE cache_key=?', (cache_key,))
+    conn.commit()
+    if stale:
+        media_cache_stats["stale"] += 1
+
+def _purge_expired_media():
+    conn = _db()
+    c = conn.cursor()
+    c.execute('DELETE FROM media_cache WHERE created_at < ?', (time.time() - RESULT_CACHE_TTL_SEC,))
+    n = c.rowcount
+    conn.commit()
+    media_cache_stats["evicted"] += max(n, 0)
+    return n
+
+# jobs (صف پایدار)
+# states: queued -> running -> uploading -> done | failed | cancelled
+# attached: گیرنده‌ی دانلود مشترک (single-flight) job دیگر؛ lease ندارد و با همان flight تمام می‌شود
+JOB_ACTIVE_STATES = ("queued", "running", "uploading", "attached")
+
+def _create_jobs(user_id: int, rows, daily_limit: int) -> int:
+    """
+    سهمیه و ثبت job های یک پیام (چند لینک یا playlist) در یک تراکنش:
+    دانلودهای امروز + job های فعال امروز از daily_limit کم می‌شوند و فقط باقی‌مانده ثبت می‌شود.
+    rows: [(job_id, chat_id, url, platform, weight)] به ترتیب
+    returns تعداد job های ثبت‌شده (از ابتدای rows)
+    """
+    now = time.time()
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    conn = _db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute("SELECT count FROM daily_counts WHERE user_id=? AND day=?", (user_id, today))
+        row = c.fetchone()
+        used = (row[0] if row else 0) + _buffered_count(user_id, today)
+        # job های در جریان هنوز در daily_counts نیستند (save_download بعد از ارسال)
+        c.execute("SELECT COUNT(*) FROM jobs WHERE user_id=? AND state IN ('queued','running','uploading','attached') AND created_at >= ?",
+                  (user_id, now - now % 86400))
+        used += c.fetchone()[0]
+        n = max(0, min(len(rows), daily_limit - used))
+        c.executemany('INSERT INTO jobs (id, user_id, chat_id, url, platform, weight, state, attempts, created_at, updated_at) VALUES (?,?,?,?,?,?,?,0,?,?)',
+                      [(job_id, user_id, chat_id, url, platform, weight, "queued", now, now)
+                       for job_id, chat_id, url, platform, weight in rows[:n]])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return n
+
+def _claim_job(job_id: str, worker: str, lease_sec: float) -> bool:
+    """queued -> running؛ returns False اگر job دیگر در صف نیست (مثلاً لغو شده)"""
+    now = time.time()
+    conn = _db()
+    c = conn.cursor()
+    c.execute("UPDATE jobs SET state='running', worker=?, lease_until=?, attempts=attempts+1, updated_at=? WHERE id=? AND state='queued'",
+              (worker, now + lease_sec, now, job_id))
+    ok = c.rowcount == 1
+    conn.commit()
+    return ok
+
+def _heartbeat_job(job_id: str, worker: str, lease_sec: float) -> bool:
+    now = time.time()
+    conn = _db()
+    c = conn.cursor()
+    c.execute("UPDATE jobs SET lease_until=?, updated_at=? WHERE id=? AND worker=? AND state IN ('running','uploading')",
+              (now + lease_sec, now, job_id, worker))
+    ok = c.rowcount == 1
+    conn.commit()
+    return ok
+
+def _set_job_state(job_id: str, state: str, error: str = None) -> bool:
+    """
+    فقط job های فعال تغییر می‌کنند — job لغو شده با done/failed بازنویسی نمی‌شود.
+    """
+    conn = _db()
+    c = conn.cursor()
+    c.execute("UPDATE jobs SET state=?, error=?, updated_at=? WHERE id=? AND state IN ('queued','running','uploading','attached')",
+              (state, error, time.time(), job_id))
+    ok = c.rowcount == 1
+    conn.commit()
+    return ok
+
+def _cancel_job(job_id: str, user_id: int):
+    """returns previous state, or None اگر job فعالی با این id برای این کاربر نیست"""
+    conn = _db()
+    c = conn.cursor()
+    c.execute("SELECT state FROM jobs WHERE id=? AND user_id=?", (job_id, user_id))
+    row = c.fetchone()
+    if not row or row[0] not in JOB_ACTIVE_STATES:
+        return None
+    c.execute("UPDATE jobs SET state='cancelled', updated_at=? WHERE id=? AND state=?", (time.time(), job_id, row[0]))
+    ok = c.rowcount == 1
+    conn.commit()
+    return row[0] if ok else None
+
+def _recover_jobs(only_expired: bool = True):
+    """
+    job های نیمه‌کاره را برمی‌گرداند و دوباره queued می‌کند.
+    only_expired=False (هنگام startup): همه‌ی running/uploading/attached ها یتیم‌اند؛
+    وگرنه فقط running/uploading با lease منقضی (attached تا پایان flight صاحبش زنده است).
+    job هایی که به JOB_MAX_ATTEMPTS رسیده‌اند failed می‌شوند.
+    returns (requeued_rows, failed_rows) — row: (id, user_id, chat_id, url, platform, weight, state)
+    """
+    now = time.time()
+    conn = _db()
+    c = conn.cursor()
+    if only_expired:
+        c.execute("SELECT id, user_id, chat_id, url, platform, weight, state, attempts FROM jobs WHERE state IN ('running','uploading') AND lease_until < ?", (now,))
+    else:
+        c.execute("SELECT id, user_id, chat_id, url, platform, weight, state, attempts FROM jobs WHERE state IN ('queued','running','uploading','attached') ORDER BY created_at")
+    requeued, failed = [], []
+    for row in c.fetchall():
+        if row[6] != "queued" and row[7] >= JOB_MAX_ATTEMPTS:
+            c.execute("UPDATE jobs SET state='failed', error='too many attempts', updated_at=? WHERE id=?", (now, row[0]))
+            failed.append(row[:7])
+        else:
+            c.execute("UPDATE jobs SET state='queued', worker=NULL, lease_until=NULL, updated_at=? WHERE id=?", (now, row[0]))
+            requeued.append(row[:7])
+    conn.commit()
+    return requeued, failed
+
+def _purge_finished_jobs(older_than_sec: float):
+    conn = _db()
+    c = conn.cursor()
+    c.execute("DELETE FROM jobs WHERE state IN ('done','failed','cancelled') AND updated_at < ?", (time.time() - older_than_sec,))
+    n = c.rowcount
+    conn.commit()
+    return n
+
+# ---------------- async API ----------------
+def invalidate_profile(user_id: int):
+    global _profile_gen
+    _profile_gen += 1
+    if _profiles.pop(user_id, None) is not None:
+        profile_cache_stats["invalidations"] += 1
+
+def profile_cache_hit_rate() -> float:
+    total = profile_cache_stats["hits"] + profile_cache_stats["misses"]
+    return profile_cache_stats["hits"] / total if total else 0.0
+
+async def get_user_profile(user_id: int) -> dict:
+    """
+    returns {"lang", "registered", "daily_count", "day"} — از کش اگر تازه باشد.
+    تغییر روز (UTC) هم مثل انقضا حساب می‌شود چون daily_count روزانه است.
+    """
+    entry = _profiles.get(user_id)
+    if entry and entry[0] > time.monotonic() and entry[1]["day"] == datetime.utcnow().strftime("%Y-%m-%d"):
+        _profiles.move_to_end(user_id)
+        profile_cache_stats["hits"] += 1
+        return entry[1]
+    profile_cache_stats["misses"] += 1
+    gen = _profile_gen
+    profile = await _run(_load_profile, user_id)
+    if gen == _profile_gen:
+        _profiles[user_id] = (time.monotonic() + PROFILE_CACHE_TTL_SEC, profile)
+        _profiles.move_to_end(user_id)
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+async def create_user(user_id: int, username: str, fullname: str, password: str, lang: str = 'fa') -> bool:
+    try:
+        return await _run(_create_user, user_id, username, fullname, password, lang)
+    finally:
+        invalidate_profile(user_id)
+
+async def user_exists(user_id: int) -> bool:
+    return (await get_user_profile(user_id))["registered"]
+
+async def get_user_by_username(username: str):
+    return await _run(_get_user_by_username, username)
+
+async def get_user_by_id(user_id: int):
+    return await _run(_get_user_by_id, user_id)
+
+async def check_login(username: str, password: str):
+    return await _run(_check_login, username, password)
+
+async def set_user_lang(user_id: int, lang: str):
+    try:
+        return await _run(_set_user_lang, user_id, lang)
+    finally:
+        invalidate_profile(user_id)
+
+async def get_user_lang(user_id: int) -> str:
+    return (await get_user_profile(user_id))["lang"]
+
+async def save_download(user_id: int, platform: str, url: str, title: str, size: int):
+    """write-behind: فقط در بافر؛ flush دسته‌ای توسط flush loop یا وقتی بافر پر شود"""
+    _download_buffer.append((user_id, platform, url, title, size, datetime.utcnow().isoformat()))
+    invalidate_profile(user_id)
+    if len(_download_buffer) >= DB_WRITE_BATCH_SIZE:
+        await _run(_flush_downloads)
+
+async def flush_downloads() -> int:
+    return await _run(_flush_downloads)
+
+async def get_user_downloads(user_id: int, limit: int = 10):
+    return await _run(_get_user_downloads, user_id, limit)
+
+async def get_daily_download_count(user_id: int) -> int:
+    return (await get_user_profile(user_id))["daily_count"]
+
+async def get_user_stats(user_id: int):
+    return await _run(_get_user_stats, user_id)
+
+async def get_cached_media(cache_key: str):
+    return await _run(_get_cached_media, cache_key)
+
+async def has_cached_media(cache_key: str) -> bool:
+    return await _run(_has_cached_media, cache_key)
+
+async def save_cached_media(cache_key: str, file_id: str, kind: str, title: str, size: int):
+    return await _run(_save_cached_media, cache_key, file_id, kind, title, size)
+
+async def delete_cached_media(cache_key: str, stale: bool = False):
+    return await _run(_delete_cached_media, cache_key, stale)
+
+async def purge_expired_media():
+    return await _run(_purge_expired_media)
+
+async def create_jobs(user_id: int, rows, daily_limit: int) -> int:
+    return await _run(_create_jobs, user_id, rows, daily_limit)
+
+async def claim_job(job_id: str, worker: str, lease_sec: float) -> bool:
+    return await _run(_claim_job, job_id, worker, lease_sec)
+
+async def heartbeat_job(job_id: str, worker: str, lease_sec: float) -> bool:
+    return await _run(_heartbeat_job, job_id, worker, lease_sec)
+
+async def set_job_state(job_id: str, state: str, error: str = None) -> bool:
+    return await _run(_set_job_state, job_id, state, error)
+
+async def cancel_job(job_id: str, user_id: int):
+    return await _run(_cancel_job, job_id, user_id)
+
+async def recover_jobs(only_expired: bool = True):
+    return await _run(_recover_jobs, only_expired)
+
+async def purge_finished_jobs(older_than_sec: float):
+    return await _run(_purge_finished_jobs, older_than_sec)
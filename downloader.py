@@ -1,182 +1,1161 @@
 # downloader.py
 import os
-import glob
+import time
+import signal
 import asyncio
-import tempfile
-import shutil
+import logging
+import threading
+from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import yt_dlp
-from config import DOWNLOAD_FOLDER, MAX_VIDEO_DOC_SIZE, YTDL_DEFAULT_VIDEO_FORMAT, YTDL_DEFAULT_AUDIO_FORMAT
+from telegram.error import BadRequest, TelegramError
+from config import (
+    DOWNLOAD_FOLDER, MAX_VIDEO_DOC_SIZE,
+    DOWNLOAD_WORKERS, PLATFORM_CONCURRENCY, DEFAULT_PLATFORM_CONCURRENCY,
+    REGISTERED_QUEUE_WEIGHT, GUEST_QUEUE_WEIGHT, REGISTERED_MAX_PENDING, GUEST_MAX_PENDING,
+    GUEST_DAILY_LIMIT, REGISTERED_DAILY_LIMIT, PLAYLIST_MAX_ITEMS, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE,
+    STAGE_STATS_LOG_EVERY, TRACE_SLOW_JOB_SEC,
+    JOB_LEASE_SEC, JOB_HEARTBEAT_SEC, JOB_HISTORY_KEEP_SEC, CLEANUP_INTERVAL_SEC,
+    MAX_UPLOAD_SIZE, MAX_MEDIA_DURATION_SEC, PROBE_WORKERS, LOCAL_BOT_API, UPLOAD_TIMEOUT_SEC,
+    YTDL_BACKEND, YTDL_JOB_TIMEOUT_SEC, YTDL_KILL_GRACE_SEC, STATUS_EDIT_INTERVAL_SEC, TRANSCODE_ENABLED, TRANSCODE_MAX_INPUT_MB,
+    TRANSCODE_WORKERS, TRANSCODE_QUEUE_SIZE,
+)
 import database as db
+import metrics
+import probe
+import tracing
+import profiles
+import scheduler
+import sender
+import transcode
+import workspace
+import ytdl_pool
+from messages import get_text
+from utils import canonical_media_id, detect_platform
+
+logger = logging.getLogger(__name__)
 
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
-# asyncio queue for jobs
-download_queue: asyncio.Queue = asyncio.Queue()
-# canceled job ids
-canceled_jobs: set = set()
+# jobs waiting for a worker live in scheduler (per-user fair queue);
+# وضعیت پایدار هر job در جدول jobs دیتابیس است (queued/running/uploading/attached/done/failed/cancelled)
+# تعداد job های در حال اجرا برای هر پلتفرم
+_running: dict = {}
+# میانگین متحرک مدت هر job (برای تخمین زمان انتظار)
+_avg_job_sec = 30.0
+_queue_cond = asyncio.Condition()
+# مرحله‌ی آپلود: worker های دانلود فایل آماده را اینجا می‌گذارند و upload_loop ها می‌فرستند؛
+# صف محدود است تا فایل‌های آماده روی دیسک جمع نشوند (دانلود تا جا باز شود صبر می‌کند)
+_upload_queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+# مرحله‌ی transcode (فقط با TRANSCODE_ENABLED) بین دانلود و آپلود: ffmpeg اسلات worker دانلود و پلتفرم را نگه نمی‌دارد
+_transcode_queue = asyncio.Queue(maxsize=TRANSCODE_QUEUE_SIZE)
+_worker_tasks: list = []
+# job های در حال اجرا در همین process (job_id -> item)
+_active_jobs: dict = {}
+# job های در حال اجرا که کاربر لغوشان کرده؛ با تمام شدن job حذف می‌شوند
+_cancelled_running: set = set()
+# کنترل لغو job های در حال دانلود: job_id -> {"event", "aevent", "tmpdir", "future", "cancel_at"}
+_job_ctrl: dict = {}
+# job های در حال transcode: job_id -> tmpdir (لغو، ffmpeg همان job را kill می‌کند)
+_transcoding: dict = {}
+# پیام‌های چندلینکی/playlist: آیتم‌ها به ترتیب از صف برداشته و به ترتیب ارسال می‌شوند
+# batch_id -> {"jobs": [job_id, ...], "queued": set(seq), "staged": set(seq), "pending": set(seq), "open": set(seq),
+#              "cond": asyncio.Condition}
+# queued: هنوز در صف دانلود، staged: هنوز به صف transcode نرسیده، pending: هنوز به صف آپلود نرسیده، open: تمام نشده
+_batches: dict = {}
+# فاصله‌ی زمانی لغو تا آزاد شدن worker
+cancel_stats = {"count": 0, "total_sec": 0.0, "max_sec": 0.0}
+
+metrics.counter("bot_jobs_total", "Finished jobs by platform, result (done/failed/rejected/cancelled) and reason")
+metrics.counter("bot_internal_errors_total", "Unexpected exceptions caught by background loops")
+metrics.histogram("bot_queue_wait_seconds", "Time from enqueue to a download worker picking the job")
+metrics.histogram("bot_ytdlp_seconds", "yt-dlp download time, merge included")
+metrics.histogram("bot_merge_seconds", "ffmpeg merge of separate video and audio streams")
+metrics.histogram("bot_transcode_seconds", "Optional ffmpeg transcode stage")
+metrics.histogram("bot_upload_seconds", "Telegram upload time")
+
+def _count_job(item, result: str, reason: str = ""):
+    metrics.inc("bot_jobs_total", platform=item.get("platform", "other"), result=result, reason=reason)
+
+def _internal_error(where: str):
+    """از داخل except: loop ادامه می‌دهد ولی خطا دیگر بی‌صدا گم نمی‌شود"""
+    logger.exception("unexpected error in %s", where)
+    metrics.inc("bot_internal_errors_total", where=where)
+
+# executor for blocking yt-dlp calls (یک thread برای هر worker) — backend "process" از ytdl_pool استفاده می‌کند
+_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="ytdlp")
+# probe (download=False) جدا از دانلودها اجرا می‌شود تا پشت job های طولانی نماند
+_probe_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="probe")
+# bot — set by start_workers (برای خبر دادن رد شدن job هایی که هنوز در صف‌اند)
+_bot = None
+
+def _platform_limit(platform: str) -> int:
+    return PLATFORM_CONCURRENCY.get(platform, DEFAULT_PLATFORM_CONCURRENCY)
+
+def pending_count() -> int:
+    return scheduler.pending_count()
+
+def queue_position(user_id: int):
+    """
+    returns (position, estimated_wait_sec) or None if user has nothing queued
+    """
+    pos = scheduler.position(user_id)
+    if pos is None:
+        return None
+    rounds = -(-pos // DOWNLOAD_WORKERS)  # ceil
+    return pos, int(rounds * _avg_job_sec)
+
+def disk_available() -> bool:
+    """False وقتی فضای آزاد دیسک (منهای رزرو job های در حال اجرا) زیر watermark است"""
+    return workspace.has_room()
+
+def max_pending_for(registered: bool) -> int:
+    return REGISTERED_MAX_PENDING if registered else GUEST_MAX_PENDING
+
+def daily_limit_for(registered: bool) -> int:
+    return REGISTERED_DAILY_LIMIT if registered else GUEST_DAILY_LIMIT
+
+async def enqueue_downloads(user_id: int, chat_id: int, urls: list, registered: bool = False):
+    """
+    called by bot when user sends one or more links (or a playlist was expanded).
+    سهمیه‌ی روزانه‌ی همه‌ی لینک‌ها در یک تراکنش دیتابیس حساب می‌شود.
+    returns (job_ids, batch_id, reason):
+      job_ids: job هایی که در صف رفتند (cache hit ها همین‌جا فرستاده و تمام شده‌اند)
+      batch_id: None برای یک لینک یا وقتی چیزی در صف نرفت؛ وگرنه شناسه‌ی batch (لغو همه با cancel_batch)
+      reason: None اگر همه پذیرفته شدند، "queue_full" یا "quota" برای باقی‌مانده
+    """
+    weight = REGISTERED_QUEUE_WEIGHT if registered else GUEST_QUEUE_WEIGHT
+    batch_id = os.urandom(6).hex() if len(urls) > 1 else None
+    async with _queue_cond:
+        room = max_pending_for(registered) - scheduler.user_pending(user_id)
+        items = []
+        for url in urls[:max(room, 0)]:
+            item = {"id": os.urandom(8).hex(), "user_id": user_id, "chat_id": chat_id, "url": url,
+                    "platform": detect_platform(url) or "other", "weight": weight, "enqueued_at": time.monotonic()}
+            if batch_id:
+                item["batch"], item["seq"] = batch_id, len(items)
+            items.append(item)
+        n = 0
+        if items:
+            n = await db.create_jobs(user_id, [(it["id"], chat_id, it["url"], it["platform"], weight) for it in items],
+                                     daily_limit_for(registered))
+        items = items[:n]
+        if batch_id and items:
+            _batches[batch_id] = {"jobs": [it["id"] for it in items], "queued": set(range(n)), "staged": set(range(n)),
+                                  "pending": set(range(n)), "open": set(range(n)), "cond": asyncio.Condition()}
+        hits = []
+        for item in items:
+            cache_key = _cache_key(item["url"], _is_audio_url(item["url"]))
+            if cache_key and _attach(cache_key, item):
+                # همین رسانه در حال دانلود است؛ بدون گرفتن worker گیرنده‌ی آن می‌شود (خارج از ترتیب batch)
+                await db.set_job_state(item["id"], "attached")
+                await _batch_finish(item)
+                continue
+            cached = await db.get_cached_media(cache_key) if cache_key and _bot is not None else None
+            if cached:
+                # cache hit: بعد از رها کردن قفل صف، بدون صف و worker فرستاده می‌شود (خارج از ترتیب batch)
+                hits.append((item, cache_key, cached))
+                continue
+            _push(item)
+        _queue_cond.notify_all()
+    served = set()
+    for item, cache_key, cached in hits:
+        if await _serve_cached(_bot, item, cache_key, cached):
+            served.add(item["id"])
+            await _batch_finish(item)
+            continue
+        # file_id منقضی شده بود؛ دانلود عادی
+        async with _queue_cond:
+            _push(item)
+            _queue_cond.notify_all()
+    if len(items) == len(urls):
+        reason = None
+    else:
+        reason = "quota" if len(items) < min(len(urls), max(room, 0)) else "queue_full"
+    job_ids = [it["id"] for it in items if it["id"] not in served]
+    return job_ids, (batch_id if job_ids else None), reason
+
+def _push(item):
+    """به صف منصفانه (زیر _queue_cond)"""
+    scheduler.push(item)
+    # probe همزمان با انتظار در صف؛ job غیرممکن قبل از گرفتن worker رد می‌شود
+    item["probe_task"] = asyncio.ensure_future(_early_probe(item))
+
+async def expand_playlist(url: str) -> list:
+    """لینک آیتم‌های playlist/album (حداکثر PLAYLIST_MAX_ITEMS)؛ [] اگر playlist نیست یا خواندن شکست خورد"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_probe_executor, probe.expand_playlist, url, PLAYLIST_MAX_ITEMS)
+    except Exception:
+        logger.warning("playlist expansion of %s failed", url, exc_info=True)
+        return []
+
+def _batch_picked(item):
+    batch = _batches.get(item.get("batch"))
+    if batch is not None:
+        batch["queued"].discard(item["seq"])
+
+async def _batch_advance(item, *stages):
+    """آیتم batch از این مراحل گذشت؛ آیتم‌های بعدی که منتظر نوبت‌اند بیدار می‌شوند"""
+    batch = _batches.get(item.get("batch"))
+    if batch is None:
+        return
+    for stage in stages:
+        batch[stage].discard(item["seq"])
+    async with batch["cond"]:
+        batch["cond"].notify_all()
+    if not batch["open"]:
+        _batches.pop(item["batch"], None)
+
+async def _batch_finish(item):
+    """آیتم batch تمام شد (ارسال، خطا، لغو یا رد)"""
+    await _batch_advance(item, "queued", "staged", "pending", "open")
+
+async def _wait_turn(item, stage: str = "open"):
+    """
+    ترتیب batch: تا وقتی آیتم‌های قبلی از stage نگذشته‌اند صبر می‌کند
+    "staged" قبل از ورود به صف transcode، "pending" قبل از ورود به صف آپلود،
+    "open" قبل از خود ارسال (دانلود آیتم‌های بعدی همزمان ادامه دارد)
+    """
+    batch = _batches.get(item.get("batch"))
+    if batch is None:
+        return
+    async with batch["cond"]:
+        await batch["cond"].wait_for(lambda: min(batch[stage], default=item["seq"]) >= item["seq"])
+
+def _transcode_limit() -> int:
+    """حداکثر حجم دانلودی که بعداً فشرده می‌شود (0 = مرحله‌ی transcode خاموش است)"""
+    if TRANSCODE_ENABLED and transcode.available():
+        return max(TRANSCODE_MAX_INPUT_MB * 1024 * 1024, MAX_UPLOAD_SIZE)
+    return 0
+
+async def _run_probe(item):
+    """returns probe result, or None if probing failed (دانلود با فرمت پیش‌فرض ادامه می‌دهد)"""
+    is_audio = _is_audio_url(item["url"])
+    cache_key = _cache_key(item["url"], is_audio)
+    if cache_key and await db.has_cached_media(cache_key):
+        return None  # از کش فرستاده می‌شود؛ probe لازم نیست
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_probe_executor, probe.probe, item["url"], is_audio, MAX_UPLOAD_SIZE,
+                                          cache_key, _transcode_limit())
+    except Exception:
+        return None
+
+async def _early_probe(item):
+    result = await _run_probe(item)
+    if result and result["reject"]:
+        async with _queue_cond:
+            still_queued = scheduler.remove(item["id"]) is not None
+            if still_queued:
+                _queue_cond.notify_all()
+        # اگر worker زودتر برش داشته، _process_job خودش رد می‌کند
+        if still_queued:
+            await _batch_finish(item)
+            if _bot is not None:
+                await _reject(_bot, item, result["reject"])
+    return result
+
+async def _get_probe(item):
+    task = item.get("probe_task")
+    if task is not None:
+        return await task
+    # job بازیابی‌شده بعد از restart
+    return await _run_probe(item)
+
+async def _notify(bot, chat_id, text: str):
+    """پیام کوتاه به کاربر؛ flood wait را sender مدیریت می‌کند و خطای نهایی فقط لاگ می‌شود"""
+    try:
+        await bot.send_message(chat_id, text)
+    except Exception:
+        logger.warning("message to %s lost", chat_id, exc_info=True)
+
+async def _reject(bot, item, reason: str):
+    await db.set_job_state(item["id"], "failed", reason)
+    _count_job(item, "rejected", reason)
+    lang = await db.get_user_lang(item["user_id"])
+    if reason == "too_long":
+        text = get_text("too_long", lang, limit=MAX_MEDIA_DURATION_SEC // 60)
+    elif reason == "disk_full":
+        text = get_text("disk_full", lang)
+    else:
+        text = get_text("too_large", lang, limit=MAX_UPLOAD_SIZE // (1024 * 1024))
+    await _notify(bot, item["chat_id"], text)
+
+async def cancel_job(job_id: str, user_id: int) -> bool:
+    """
+    لغو job — در دیتابیس cancelled می‌شود؛ اگر هنوز در صف است همان‌جا حذف می‌شود
+    و اگر در حال اجراست worker در اولین بررسی متوقفش می‌کند.
+    returns False اگر job تمام شده یا مال این کاربر نیست
+    """
+    prev = await db.cancel_job(job_id, user_id)
+    if prev is None:
+        return False
+    async with _queue_cond:
+        removed = scheduler.remove(job_id)
+        if removed is not None:
+            # آیتم بعدی batch دیگر پشت این job نمی‌ماند
+            _queue_cond.notify_all()
+    if removed is not None:
+        _count_job(removed, "cancelled")
+        await _batch_finish(removed)
+    # عضو یک دانلود مشترک: فقط همین گیرنده جدا می‌شود
+    if not _detach(job_id) and job_id in _active_jobs:
+        _request_cancel(job_id)
+    return True
+
+async def cancel_batch(batch_id: str, user_id: int) -> int:
+    """همه‌ی آیتم‌های تمام‌نشده‌ی یک batch را لغو می‌کند؛ returns تعداد لغوشده‌ها"""
+    batch = _batches.get(batch_id)
+    if batch is None:
+        return 0
+    cancelled = 0
+    for job_id in list(batch["jobs"]):
+        if await cancel_job(job_id, user_id):
+            cancelled += 1
+    return cancelled
+
+def is_cancelled(job_id: str) -> bool:
+    return job_id in _cancelled_running
+
+def _request_cancel(job_id: str):
+    """
+    لغو فوری job در حال اجرا: hook های yt-dlp در اولین callback متوقف می‌شوند،
+    ffmpeg فرزند kill می‌شود و worker بدون صبر برای thread آزاد می‌شود.
+    """
+    _cancelled_running.add(job_id)
+    ctrl = _job_ctrl.get(job_id)
+    if not ctrl:
+        tmpdir = _transcoding.get(job_id)
+        if tmpdir:
+            _kill_child_processes(os.path.basename(tmpdir))
+        return
+    ctrl["cancel_at"] = time.monotonic()
+    _abort(ctrl)
+
+def _abort(ctrl):
+    """دانلود در حال اجرا را متوقف می‌کند (لغو کاربر، timeout یا shutdown)"""
+    ctrl["event"].set()
+    ctrl["aevent"].set()
+    if ctrl["tmpdir"]:
+        if YTDL_BACKEND == "process":
+            ytdl_pool.request_cancel(ctrl["tmpdir"])
+            # job ای که به hook نمی‌رسد process را برای همیشه نگه می‌دارد؛ بعد از مهلت kill می‌شود
+            if YTDL_KILL_GRACE_SEC:
+                asyncio.get_running_loop().call_later(YTDL_KILL_GRACE_SEC, _kill_if_stuck, ctrl)
+        _kill_child_processes(os.path.basename(ctrl["tmpdir"]))
 
-# executor for blocking yt-dlp calls
-_executor = ThreadPoolExecutor(max_workers=1)
+def _kill_if_stuck(ctrl):
+    fut = ctrl["future"]
+    if fut is None or fut.done():
+        return
+    if ytdl_pool.kill_job(ctrl["tmpdir"]):
+        logger.warning("yt-dlp process for %s ignored cancel for %ss; killed, other jobs resubmitted",
+                       os.path.basename(ctrl["tmpdir"]), YTDL_KILL_GRACE_SEC)
+
+def _kill_child_processes(marker: str):
+    """
+    kill descendant processes (ffmpeg merge / external downloader) whose command line mentions marker.
+    در backend process، ffmpeg فرزندِ process دانلود است؛ پس کل درخت زیر این process بررسی می‌شود.
+    فقط روی لینوکس (/proc)؛ جای دیگر کاری نمی‌کند.
+    """
+    if not marker or not os.path.isdir("/proc"):
+        return
+    parents = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                # pid (comm) state ppid ... — comm ممکن است فاصله داشته باشد
+                parents[int(pid)] = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+    tree = {os.getpid()}
+    # ppid همیشه قبل از pid نمی‌آید (pid ها دور می‌زنند)؛ تا وقتی چیزی اضافه می‌شود تکرار
+    grown = True
+    while grown:
+        grown = False
+        for pid, ppid in parents.items():
+            if ppid in tree and pid not in tree:
+                tree.add(pid)
+                grown = True
+    tree.discard(os.getpid())
+    for pid in tree:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read()
+            if marker.encode() in cmdline:
+                os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+async def _requeue(rows):
+    async with _queue_cond:
+        for job_id, user_id, chat_id, url, platform, weight, _state in rows:
+            if job_id in _active_jobs or job_id in _job_flight:
+                continue
+            item = {"id": job_id, "user_id": user_id, "chat_id": chat_id, "url": url,
+                    "platform": platform, "weight": weight, "enqueued_at": time.monotonic()}
+            # job های بازیابی‌شده سقف صف کاربر را رد نمی‌کنند
+            scheduler.push(item)
+        _queue_cond.notify_all()
+
+async def recover_jobs(bot):
+    """
+    called once from bot.post_init (before start_workers):
+    job های نیمه‌کاره‌ی اجرای قبلی دوباره در صف قرار می‌گیرند و به کاربر خبر داده می‌شود.
+    """
+    requeued, failed = await db.recover_jobs(only_expired=False)
+    await _requeue(requeued)
+    for rows, key in ((requeued, "job_recovered"), (failed, "job_recover_failed")):
+        for row in rows:
+            await _notify(bot, row[2], get_text(key, await db.get_user_lang(row[1]), url=row[3]))
+    return len(requeued), len(failed)
+
+async def _heartbeat(job_id: str, worker: str):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SEC)
+        try:
+            await db.heartbeat_job(job_id, worker, JOB_LEASE_SEC)
+        except Exception:
+            _internal_error("heartbeat")
+
+def _has_slot(item) -> bool:
+    # آیتم‌های batch فقط به ترتیب برداشته می‌شوند (آیتمی که منتظر نوبت ارسال است هیچ‌وقت منتظر آیتم بعدی نیست)
+    batch = _batches.get(item.get("batch"))
+    if batch is not None and item["seq"] != min(batch["queued"]):
+        return False
+    platform = item["platform"]
+    return _running.get(platform, 0) < _platform_limit(platform)
+
+def _pick_job():
+    """job بعدی به نوبت کاربران، به شرطی که پلتفرمش زیر سقف همزمانی باشد"""
+    item = scheduler.pick(_has_slot)
+    if item is not None:
+        _running[item["platform"]] = _running.get(item["platform"], 0) + 1
+        _batch_picked(item)
+    return item
+
+async def _next_job():
+    async with _queue_cond:
+        while True:
+            item = _pick_job()
+            if item is not None:
+                return item
+            await _queue_cond.wait()
+
+async def _release_job(item, elapsed: float):
+    global _avg_job_sec
+    _avg_job_sec = 0.8 * _avg_job_sec + 0.2 * elapsed
+    async with _queue_cond:
+        _running[item["platform"]] -= 1
+        # یک slot آزاد شد؛ ممکن است job های این پلتفرم منتظر باشند
+        _queue_cond.notify_all()
+
+def _is_audio_url(url: str) -> bool:
+    return profiles.get(detect_platform(url))["audio"]
+
+def _cache_key(url: str, is_audio: bool):
+    """کلید کش = شناسه رسانه + پروفایل فرمت (audio/video و کیفیت)"""
+    media_id = canonical_media_id(url)
+    if not media_id:
+        return None
+    fmt = profiles.get(detect_platform(url))["format"]
+    return f"{media_id}|{'audio' if is_audio else 'video'}:{fmt}"
+
+# single-flight: درخواست‌های همزمان برای یک رسانه فقط یک بار دانلود می‌شوند
+# cache_key -> flight {"key": cache_key, "owner": job_id, "recipients": {job_id: item}}
+# (flight مال owner در item["flight"] هم هست: بعد از لغو owner ممکن است flight تازه‌ای جای آن را در _inflight بگیرد)
+_inflight: dict = {}
+# job_id -> flight ای که job گیرنده‌ی آن است
+_job_flight: dict = {}
 
-async def enqueue_download(user_id: int, chat_id: int, url: str):
+def _attach(cache_key: str, item) -> bool:
+    """اگر همین رسانه در حال دانلود است، job را به گیرنده‌های آن اضافه می‌کند"""
+    flight = _inflight.get(cache_key)
+    # flight ای که همه گیرنده‌هایش لغو کرده‌اند در حال توقف است؛ job تازه دانلود خودش را شروع می‌کند
+    if flight is None or flight["owner"] in _cancelled_running:
+        return False
+    flight["recipients"][item["id"]] = item
+    _job_flight[item["id"]] = flight
+    return True
+
+def _detach(job_id: str) -> bool:
+    """
+    فقط همین گیرنده جدا می‌شود؛ دانلود مشترک فقط وقتی متوقف می‌شود که گیرنده‌ای نماند.
+    returns False اگر job عضو هیچ flight ای نیست
+    """
+    flight = _job_flight.pop(job_id, None)
+    if flight is None:
+        return False
+    flight["recipients"].pop(job_id, None)
+    if not flight["recipients"]:
+        _request_cancel(flight["owner"])
+    return True
+
+def _start_flight(cache_key: str, item):
+    flight = {"key": cache_key, "owner": item["id"], "recipients": {item["id"]: item}}
+    _inflight[cache_key] = flight
+    _job_flight[item["id"]] = flight
+    item["flight"] = flight
+
+def _end_flight(flight):
+    if _inflight.get(flight["key"]) is flight:
+        del _inflight[flight["key"]]
+    for rid in flight["recipients"]:
+        if _job_flight.get(rid) is flight:
+            del _job_flight[rid]
+
+def _sent_file_id(msg):
+    """returns (file_id, kind) از پیام ارسال‌شده"""
+    if msg is None:
+        return None, None
+    for kind in ("video", "document", "audio"):
+        media = getattr(msg, kind, None)
+        if media is not None:
+            return media.file_id, kind
+    return None, None
+
+async def _send_cached(bot, chat_id, cached):
     """
-    called by bot when user sends link.
-    returns job_id
+    ارسال دوباره با file_id — بدون yt-dlp و بدون آپلود.
+    returns True اگر موفق بود؛ اگر تلگرام file_id را رد کند False
     """
-    job_id = os.urandom(8).hex()
-    await download_queue.put({"id": job_id, "user_id": user_id, "chat_id": chat_id, "url": url})
-    return job_id
+    file_id, kind, title, size = cached
+    try:
+        if kind == "video":
+            await bot.send_video(chat_id, file_id, caption=f"{title}")
+        elif kind == "audio":
+            await bot.send_audio(chat_id, file_id, caption=f"{title}")
+        else:
+            await bot.send_document(chat_id, file_id, caption=f"{title}")
+        return True
+    except BadRequest:
+        return False
+
+async def _serve_cached(bot, item, cache_key, cached) -> bool:
+    """
+    cache hit: job با file_id تمام می‌شود (فرستاده شد، یا خطای تلگرام مثل Forbidden/NetworkError = failed)
+    returns False اگر تلگرام file_id را رد کرد؛ کش پاک شده و job باید عادی دانلود شود
+    """
+    try:
+        if not await _send_cached(bot, item["chat_id"], cached):
+            # file_id منقضی/نامعتبر
+            await db.delete_cached_media(cache_key, stale=True)
+            return False
+    except TelegramError as e:
+        await db.set_job_state(item["id"], "failed", str(e)[:500])
+        _count_job(item, "failed", type(e).__name__)
+        logger.warning("cached send of %s failed: %s", item["id"], e)
+        await _notify(bot, item["chat_id"], f"❌ خطا در ارسال: {e}")
+        return True
+    await db.save_download(item["user_id"], cache_key.split(":", 1)[0], item["url"], cached[2], cached[3])
+    await db.set_job_state(item["id"], "done")
+    _count_job(item, "done", "cached")
+    return True
 
-def _run_yt_dlp(ydl_opts, url, tmpdir):
+async def _upload(bot, chat_id, path: str, caption: str, as_document: bool):
     """
-    blocking call executed in threadpool
-    returns path to file and info dict
+    حالت سرور محلی: فقط مسیر فایل (file://) فرستاده می‌شود و سرور خودش فایل را می‌خواند؛
+    حالت عمومی: فایل به صورت multipart از همین process آپلود می‌شود.
     """
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        # find file
-        files = glob.glob(os.path.join(tmpdir, "*"))
-        # pick newest
-        if not files:
-            # sometimes ydl writes to cwd with id.ext
-            files = glob.glob(os.path.join(".", "*"))
-        files = sorted(files, key=os.path.getmtime, reverse=True)
-        return files[0] if files else None, info
+    send = bot.send_document if as_document else bot.send_video
+    if LOCAL_BOT_API:
+        return await send(chat_id, Path(os.path.abspath(path)), caption=caption,
+                          read_timeout=UPLOAD_TIMEOUT_SEC)
+    with open(path, "rb") as f:
+        return await send(chat_id, f, caption=caption,
+                          read_timeout=UPLOAD_TIMEOUT_SEC, write_timeout=UPLOAD_TIMEOUT_SEC)
+
+async def _serve_recipients(bot, flight, served: set, cached, platform, url):
+    """
+    بقیه‌ی گیرنده‌های flight فایل را با file_id می‌گیرند؛ هر کدام جداگانه در سهمیه حساب می‌شوند.
+    flight=None: job دانلود مشترک نداشت. cached=None یعنی آپلود اصلی شکست خورد.
+    تا وقتی گیرنده‌ی جدیدی اضافه می‌شود ادامه می‌دهد؛ بعد از برگشتن، flight باید بلافاصله (بدون await) بسته شود.
+    """
+    while flight:
+        rest = [r for rid, r in flight["recipients"].items() if rid not in served]
+        if not rest:
+            return
+        for r in rest:
+            served.add(r["id"])
+            if cached and await _send_cached(bot, r["chat_id"], cached):
+                await db.save_download(r["user_id"], platform, url, cached[2], cached[3])
+                await db.set_job_state(r["id"], "done")
+                _count_job(r, "done", "shared")
+                continue
+            await db.set_job_state(r["id"], "failed", "shared download failed")
+            _count_job(r, "failed", "shared")
+            await _notify(bot, r["chat_id"], "❌ فایل دانلود نشد یا قابل پیدا کردن نیست.")
+
+def _progress_text(percent: int) -> str:
+    return f"⏳ در حال دانلود... {percent}%"
+
+def _progress_reporter(status_msg):
+    """
+    progress hook برای yt-dlp (در thread دانلود): فقط وقتی درصد عوض شده متن تازه را به loop می‌دهد؛
+    sender.edit_status ویرایش‌ها را ادغام و throttle می‌کند.
+    """
+    if status_msg is None:
+        return None
+    loop = asyncio.get_running_loop()
+    last = [None]
+
+    def _hook(d):
+        percent = ytdl_pool.progress_percent(d)
+        if percent is None or percent == last[0]:
+            return
+        last[0] = percent
+        loop.call_soon_threadsafe(sender.edit_status, status_msg, _progress_text(percent))
+    return _hook
+
+async def _poll_progress(tmpdir, status_msg):
+    """backend process: پیشرفت را process دانلود در فایل می‌نویسد"""
+    last = None
+    while True:
+        await asyncio.sleep(STATUS_EDIT_INTERVAL_SEC)
+        percent = ytdl_pool.read_progress(tmpdir)
+        if percent is not None and percent != last:
+            last = percent
+            sender.edit_status(status_msg, _progress_text(percent))
+
+async def _run_cancellable(job_id, ydl_opts, url, tmpdir, status_msg=None):
+    """
+    yt-dlp را در executor (thread یا process) اجرا می‌کند؛ با لغو، بلافاصله (بدون صبر برای thread/process) None برمی‌گرداند.
+    returns (out_path, info) or None if cancelled
+    raises TimeoutError بعد از YTDL_JOB_TIMEOUT_SEC
+    """
+    ctrl = {"event": threading.Event(), "aevent": asyncio.Event(), "tmpdir": tmpdir,
+            "future": None, "cancel_at": None}
+    _job_ctrl[job_id] = ctrl
+    if is_cancelled(job_id):
+        return None
+    loop = asyncio.get_running_loop()
+    poller = None
+    if YTDL_BACKEND == "process":
+        fut = asyncio.wrap_future(ytdl_pool.submit(ydl_opts, url, tmpdir))
+        if status_msg is not None:
+            poller = asyncio.ensure_future(_poll_progress(tmpdir, status_msg))
+    else:
+        fut = loop.run_in_executor(_executor, ytdl_pool.run_yt_dlp, ydl_opts, url, tmpdir, ctrl["event"],
+                                   _progress_reporter(status_msg))
+    deadline = time.monotonic() + YTDL_JOB_TIMEOUT_SEC if YTDL_JOB_TIMEOUT_SEC else None
+    waiter = asyncio.ensure_future(ctrl["aevent"].wait())
+    try:
+        for attempt in range(2):
+            ctrl["future"] = fut
+            await asyncio.wait({fut, waiter}, timeout=deadline and max(0, deadline - time.monotonic()),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not fut.done():
+                if not ctrl["aevent"].is_set():
+                    # timeout: دانلود متوقف و worker آزاد می‌شود؛ tmpdir بعد از برگشتن executor پاک می‌شود
+                    _abort(ctrl)
+                    raise TimeoutError(f"download took longer than {YTDL_JOB_TIMEOUT_SEC}s")
+                return None
+            try:
+                return fut.result()
+            except yt_dlp.utils.DownloadCancelled:
+                return None
+            except BrokenProcessPool:
+                # process دیگری از pool kill شد (job گیرکرده یا OOM) و همه‌ی job هایش شکست خوردند؛
+                # این job یک بار در pool تازه دوباره اجرا می‌شود (بار دوم یعنی خودش process را می‌کشد)
+                if attempt or is_cancelled(job_id):
+                    raise
+                logger.warning("yt-dlp pool broke under job %s; resubmitting", job_id)
+                fut = asyncio.wrap_future(ytdl_pool.submit(ydl_opts, url, tmpdir))
+    finally:
+        waiter.cancel()
+        if poller:
+            poller.cancel()
+
+def _finish_ctrl(job_id, release: bool = True):
+    """
+    workspace را آزاد می‌کند و زمان لغو تا آزاد شدن worker را ثبت می‌کند
+    release=False: دانلود تمام شده و فایل به مرحله‌ی آپلود رفته
+    """
+    ctrl = _job_ctrl.pop(job_id, None)
+    fut = ctrl["future"] if ctrl else None
+    if fut is not None and not fut.done():
+        def _cleanup(f):
+            if not f.cancelled():
+                f.exception()  # مصرف exception تا در لاگ «never retrieved» نیاید
+            workspace.release(job_id)
+        fut.add_done_callback(_cleanup)
+    elif release:
+        workspace.release(job_id)
+    if ctrl and ctrl["cancel_at"] is not None:
+        latency = time.monotonic() - ctrl["cancel_at"]
+        cancel_stats["count"] += 1
+        cancel_stats["total_sec"] += latency
+        cancel_stats["max_sec"] = max(cancel_stats["max_sec"], latency)
+        logger.info("job %s cancelled; worker freed after %.3fs", job_id, latency)
 
 async def _process_job(bot, item):
+    """
+    مرحله‌ی دانلود یک job (probe، yt-dlp)
+    returns True اگر فایل به صف transcode یا آپلود رفت (پایان job با آن مرحله است)، وگرنه job همین‌جا تمام شده
+    """
     job_id = item["id"]
-    user_id = item["user_id"]
     chat_id = item["chat_id"]
     url = item["url"]
 
-    status_msg = None
-    try:
-        status_msg = await bot.send_message(chat_id, "⏳ در حال پردازش دانلود...")
-    except Exception:
-        pass
+    is_audio = _is_audio_url(url)
+    cache_key = _cache_key(url, is_audio)
 
-    # check cancel before heavy work
-    if job_id in canceled_jobs:
+    # همین رسانه را worker دیگری دارد دانلود می‌کند: گیرنده‌ی آن شو و worker را آزاد کن
+    # (attached: heartbeat این job تمام می‌شود، پس lease sweeper نباید آن را دوباره در صف بگذارد)
+    if cache_key and _attach(cache_key, item):
+        await db.set_job_state(job_id, "attached")
+        return
+
+    # cache hit بعد از ورود به صف (یا job بازیابی‌شده): همان file_id قبلی را دوباره بفرست
+    cached = await db.get_cached_media(cache_key) if cache_key else None
+    if cached and not is_cancelled(job_id):
+        await _wait_turn(item)
+        if await _serve_cached(bot, item, cache_key, cached):
+            return
+
+    with tracing.span("probe"):
+        probed = await _get_probe(item)
+    if probed and probed["reject"]:
+        await _reject(bot, item, probed["reject"])
+        return
+
+    if cache_key and _attach(cache_key, item):
+        await db.set_job_state(job_id, "attached")
+        return
+    # پوشه‌ی اختصاصی job با رزرو فضای دیسک (حجم probe، وگرنه پیش‌فرض)
+    tmpdir = workspace.open_workspace(job_id, workspace.estimate_reserve(probed["size"] if probed else None))
+    if tmpdir is None:
+        await _reject(bot, item, "disk_full")
+        return
+
+    if cache_key:
+        _start_flight(cache_key, item)
+    # گیرنده‌هایی که فایل را گرفته‌اند یا نتیجه‌شان ثبت شده
+    served = set()
+
+    status_msg = None
+    # آیتم‌های batch پیام وضعیت جدا نمی‌گیرند (پیام تأیید batch کافی است و chat پر از ویرایش نمی‌شود)
+    if item.get("batch") is None:
         try:
-            if status_msg:
-                await bot.send_message(chat_id, "🚫 دانلود لغو شد.")
+            status_msg = await bot.send_message(chat_id, "⏳ در حال پردازش دانلود...")
         except Exception:
-            pass
+            logger.warning("status message to %s failed", chat_id, exc_info=True)
+
+    # check cancel before heavy work
+    if is_cancelled(job_id):
+        _count_job(item, "cancelled")
+        if status_msg:
+            await _notify(bot, chat_id, "🚫 دانلود لغو شد.")
+        if cache_key:
+            _end_flight(item.pop("flight"))
+        workspace.release(job_id)
         return
 
-    tmpdir = tempfile.mkdtemp(dir=DOWNLOAD_FOLDER)
     out_path = None
     info = None
+    handed = False
     try:
-        lower = url.lower()
-        is_audio = any(x in lower for x in ("soundcloud", "spotify"))
-        if is_audio:
-            ydl_opts = {
-                "format": YTDL_DEFAULT_AUDIO_FORMAT,
-                "outtmpl": os.path.join(tmpdir, "%(id)s.%(ext)s"),
-                "noplaylist": True,
-            }
-        else:
-            ydl_opts = {
-                "format": YTDL_DEFAULT_VIDEO_FORMAT,
-                "outtmpl": os.path.join(tmpdir, "%(id)s.%(ext)s"),
-                "merge_output_format": "mp4",
-                "noplaylist": True,
-            }
+        # فرمتی که probe انتخاب کرده (زیر سقف آپلود)، وگرنه فرمت پروفایل پلتفرم
+        chosen = probed["format"] if probed else ""
+        ydl_opts = profiles.ydl_options(profiles.get(detect_platform(url)),
+                                        os.path.join(tmpdir, "%(id)s.%(ext)s"), chosen)
 
-        loop = asyncio.get_running_loop()
-        out_path, info = await loop.run_in_executor(_executor, _run_yt_dlp, ydl_opts, url, tmpdir)
+        started = time.monotonic()
+        with tracing.span("ytdlp", format=chosen or "profile"):
+            result = await _run_cancellable(job_id, ydl_opts, url, tmpdir, status_msg)
+        if result is not None:
+            out_path, info = result
+            metrics.observe("bot_ytdlp_seconds", time.monotonic() - started, platform=item["platform"])
+            if info.get("merge_sec") is not None:
+                metrics.observe("bot_merge_seconds", info["merge_sec"], platform=item["platform"])
 
-        if job_id in canceled_jobs:
+        if result is None or is_cancelled(job_id):
             # user canceled during download
-            try:
-                await bot.send_message(chat_id, "🚫 دانلود لغو شد.")
-            except Exception:
-                pass
-            return
+            _count_job(item, "cancelled")
+            await _notify(bot, chat_id, "🚫 دانلود لغو شد.")
+            return False
 
         if not out_path or not os.path.exists(out_path):
+            await db.set_job_state(job_id, "failed", "file not found")
+            _count_job(item, "failed", "file_not_found")
+            served.add(job_id)
+            await _notify(bot, chat_id, "❌ فایل دانلود نشد یا قابل پیدا کردن نیست.")
+            await _serve_recipients(bot, item.get("flight"), served, None, None, url)
+            return False
+
+        job = {"item": item, "cache_key": cache_key, "served": served, "status_msg": status_msg,
+               "path": out_path, "info": info, "is_audio": is_audio}
+        if TRANSCODE_ENABLED:
+            # فشرده‌سازی در مرحله‌ی transcode_loop؛ این worker سراغ دانلود بعدی می‌رود
+            with tracing.span("turn_wait"):
+                await _wait_turn(item, "staged")
+            started = time.monotonic()
+            job["queued_at"] = started
+            with tracing.span("handoff_wait"):
+                await _transcode_queue.put(job)
+            _record_stage("handoff_wait", time.monotonic() - started)
+            handed = True
+            await _batch_advance(item, "staged")
+            return True
+        handed = await _to_upload(bot, job)
+        return handed
+
+    except Exception as e:
+        await db.set_job_state(job_id, "failed", str(e)[:500])
+        _count_job(item, "failed", type(e).__name__)
+        logger.warning("job %s (%s) failed: %s", job_id, item["platform"], e)
+        served.add(job_id)
+        await _notify(bot, chat_id, f"❌ خطا در دانلود: {e}")
+        await _serve_recipients(bot, item.get("flight"), served, None, None, url)
+        return False
+    finally:
+        if handed:
+            # فایل و workspace و flight از این به بعد مال مرحله‌ی آپلود است
+            _finish_ctrl(job_id, release=False)
+        else:
+            await _close_job(item, status_msg)
+
+async def _to_upload(bot, job) -> bool:
+    """
+    فایل آماده (بعد از دانلود یا transcode) به صف آپلود؛ returns False اگر job همین‌جا رد شد
+    صف محدود است: اگر پر باشد همین worker منتظر می‌ماند و کار تازه‌ای شروع نمی‌کند
+    """
+    item = job["item"]
+    cache_key = job["cache_key"]
+    info = job["info"]
+    size = os.path.getsize(job["path"])
+    if size > MAX_UPLOAD_SIZE:
+        # probe حجم را نمی‌دانست (یا فشرده‌سازی ممکن نبود)؛ آپلود قطعاً رد می‌شود
+        job["served"].add(item["id"])
+        await _reject(bot, item, "too_large")
+        await _serve_recipients(bot, item.get("flight"), job["served"], None, None, item["url"])
+        return False
+
+    upload = {"item": item, "cache_key": cache_key, "served": job["served"], "status_msg": job["status_msg"],
+              "path": job["path"], "size": size, "is_audio": job["is_audio"],
+              "title": info.get("title", "video"), "platform": info.get("extractor", "unknown")}
+    # ترتیب batch: آیتم‌ها به ترتیب وارد صف آپلود می‌شوند
+    with tracing.span("turn_wait"):
+        await _wait_turn(item, "pending")
+    sender.edit_status(job["status_msg"], "📤 در صف ارسال...")
+    started = time.monotonic()
+    upload["queued_at"] = started
+    with tracing.span("handoff_wait"):
+        await _upload_queue.put(upload)
+    _record_stage("handoff_wait", time.monotonic() - started)
+    await _batch_advance(item, "staged", "pending")
+    return True
+
+async def _transcode_job(bot, job) -> bool:
+    """
+    مرحله‌ی transcode: فشرده‌سازی تا زیر سقف آپلود، MP4 با faststart، یا تبدیل صدا
+    returns True اگر فایل به صف آپلود رفت، وگرنه job همین‌جا تمام شده
+    """
+    item = job["item"]
+    job_id = item["id"]
+    status_msg = job["status_msg"]
+    handed = False
+    try:
+        if not is_cancelled(job_id):
+            sender.edit_status(status_msg, "🎞 در حال آماده‌سازی فایل...")
+            started = time.monotonic()
+            _transcoding[job_id] = os.path.dirname(job["path"])
             try:
-                await bot.send_message(chat_id, "❌ فایل دانلود نشد یا قابل پیدا کردن نیست.")
-            except Exception:
-                pass
+                with tracing.span("transcode"), metrics.timer("bot_transcode_seconds", platform=item["platform"]):
+                    job["path"] = await transcode.process(job["path"], job["info"], job["is_audio"], MAX_UPLOAD_SIZE)
+            finally:
+                _transcoding.pop(job_id, None)
+            _record_stage("transcode", time.monotonic() - started)
+        if is_cancelled(job_id):
+            _count_job(item, "cancelled")
+            await _notify(bot, item["chat_id"], "🚫 دانلود لغو شد.")
+            return False
+        handed = await _to_upload(bot, job)
+        return handed
+    except Exception as e:
+        await db.set_job_state(job_id, "failed", str(e)[:500])
+        _count_job(item, "failed", type(e).__name__)
+        logger.warning("transcode of %s (%s) failed: %s", job_id, item["platform"], e)
+        job["served"].add(job_id)
+        await _notify(bot, item["chat_id"], f"❌ خطا در آماده‌سازی فایل: {e}")
+        await _serve_recipients(bot, item.get("flight"), job["served"], None, None, item["url"])
+        return False
+    finally:
+        if not handed:
+            await _close_job(item, status_msg)
+
+async def _close_job(item, status_msg):
+    """پایان job (در هر مرحله): flight، workspace و پیام وضعیت"""
+    job_id = item["id"]
+    # flight بسته می‌شود قبل از هر await دیگری تا گیرنده‌ای جا نماند
+    flight = item.pop("flight", None)
+    if flight:
+        _end_flight(flight)
+    # cleanup — اگر thread لغوشده هنوز برنگشته، بعد از برگشتنش پاک می‌شود
+    _finish_ctrl(job_id)
+    if status_msg:
+        # ویرایش پیشرفتی که هنوز در صف است دیگر فرستاده نشود
+        await sender.discard_status(status_msg)
+        try:
+            await status_msg.delete()
+        except Exception:
+            pass
+
+async def _upload_job(bot, upload):
+    """مرحله‌ی آپلود: فایل دانلودشده به تلگرام، ثبت کش و سرویس گیرنده‌های flight"""
+    item = upload["item"]
+    job_id = item["id"]
+    url = item["url"]
+    cache_key = upload["cache_key"]
+    # flight همین job (نه _inflight[cache_key] که بعد از لغو owner ممکن است مال job دیگری باشد)
+    flight = item.get("flight")
+    served = upload["served"]
+    out_path, size, title, platform = upload["path"], upload["size"], upload["title"], upload["platform"]
+    try:
+        # ترتیب batch: آیتم‌های قبلی اول ارسال می‌شوند (آن‌ها زودتر از صف برداشته شده‌اند)
+        await _wait_turn(item)
+        # لغو در مدتی که فایل در صف آپلود بود (همه‌ی گیرنده‌های flight هم رفته‌اند)
+        if is_cancelled(job_id):
+            _count_job(item, "cancelled")
+            await _notify(bot, item["chat_id"], "🚫 دانلود لغو شد.")
             return
 
-        size = os.path.getsize(out_path)
-        title = info.get("title", "video")
+        # فایل یک بار آپلود می‌شود — برای خود job، یا اگر لغو کرده برای اولین گیرنده‌ی باقی‌مانده
+        target = item
+        if flight:
+            recipients = list(flight["recipients"].values())
+            target = recipients[0] if recipients else item
+        served.add(target["id"])
+        # گیرنده‌ی جایگزین attached می‌ماند: lease و heartbeat مال خود job است
+        if target is item:
+            await db.set_job_state(job_id, "uploading")
+        sender.edit_status(upload["status_msg"], "📤 در حال ارسال...")
 
         # choose send method
-        if is_audio or size > MAX_VIDEO_DOC_SIZE:
+        sent = None
+        error = None
+        started = time.monotonic()
+        try:
             # send as document (safer for big files)
-            try:
-                with open(out_path, "rb") as f:
-                    await bot.send_document(chat_id, f, caption=f"{title}")
-            except Exception:
-                pass
+            sent = await _upload(bot, target["chat_id"], out_path, f"{title}",
+                                 as_document=upload["is_audio"] or size > MAX_VIDEO_DOC_SIZE)
+        except Exception as e:
+            error = e
+            logger.warning("upload of %s failed", job_id, exc_info=True)
+        _record_stage("upload", time.monotonic() - started)
+        metrics.observe("bot_upload_seconds", time.monotonic() - started, platform=item["platform"])
+        # فایل دیگر لازم نیست (گیرنده‌های دیگر با file_id سرویس می‌گیرند)
+        workspace.release(job_id)
+
+        # ذخیره file_id برای دفعات بعد
+        file_id, kind = _sent_file_id(sent)
+        if cache_key and file_id:
+            await db.save_cached_media(cache_key, file_id, kind, title, size)
+
+        if sent:
+            # save record in DB (فقط فایلی که رسیده در سهمیه حساب می‌شود)
+            await db.save_download(target["user_id"], platform, url, title, size)
+            await db.set_job_state(target["id"], "done")
+            _count_job(target, "done")
         else:
-            try:
-                with open(out_path, "rb") as f:
-                    await bot.send_video(chat_id, f, caption=f"{title}")
-            except Exception:
-                pass
+            await db.set_job_state(target["id"], "failed", f"upload failed: {error}"[:500])
+            _count_job(target, "failed", "upload_failed")
+            await _notify(bot, target["chat_id"], f"❌ خطا در ارسال: {error}")
 
-        # save record in DB
-        db.save_download(user_id, info.get("extractor", "unknown"), url, title, size)
+        await _serve_recipients(bot, flight, served, (file_id, kind, title, size) if file_id else None, platform, url)
 
     except Exception as e:
-        try:
-            await bot.send_message(chat_id, f"❌ خطا در دانلود: {e}")
-        except Exception:
-            pass
+        await db.set_job_state(job_id, "failed", str(e)[:500])
+        _count_job(item, "failed", type(e).__name__)
+        logger.warning("upload of %s failed: %s", job_id, e)
+        served.add(job_id)
+        await _notify(bot, item["chat_id"], f"❌ خطا در ارسال: {e}")
+        await _serve_recipients(bot, flight, served, None, None, url)
     finally:
-        # cleanup
-        try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
-        if status_msg:
-            try:
-                await status_msg.delete()
-            except Exception:
-                pass
+        await _close_job(item, upload["status_msg"])
+
+# زمان هر مرحله (ثانیه): download = گرفتن worker تا تحویل فایل به مرحله‌ی بعد، handoff_wait = انتظار برای جا
+# در صف مرحله‌ی بعد (backpressure)، transcode_wait / upload_wait = ماندن در صف، transcode / upload = خود کار
+stage_stats = {stage: {"count": 0, "total_sec": 0.0, "max_sec": 0.0}
+               for stage in ("download", "handoff_wait", "transcode_wait", "transcode", "upload_wait", "upload")}
+
+def _record_stage(stage: str, sec: float):
+    st = stage_stats[stage]
+    st["count"] += 1
+    st["total_sec"] += sec
+    st["max_sec"] = max(st["max_sec"], sec)
+
+def _log_stages():
+    parts = [f"{stage} avg {st['total_sec'] / st['count']:.1f}s max {st['max_sec']:.1f}s"
+             for stage, st in stage_stats.items() if st["count"]]
+    logger.info("pipeline (%d download / %d upload workers, queue %d/%d): %s", DOWNLOAD_WORKERS, UPLOAD_WORKERS,
+                _upload_queue.qsize(), UPLOAD_QUEUE_SIZE, ", ".join(parts))
 
-async def worker_loop(app):
+def _finish_item(item):
+    """job از همه‌ی مراحل بیرون آمد"""
+    hb = item.pop("heartbeat", None)
+    if hb:
+        hb.cancel()
+    _active_jobs.pop(item["id"], None)
+    _cancelled_running.discard(item["id"])
+    tracing.finish(item.pop("trace", None), TRACE_SLOW_JOB_SEC)
+
+async def worker_loop(app, worker: str):
     """
-    main worker loop — scheduled from bot.post_init (safe)
+    one download worker of the pool — started by start_workers
+    بعد از دانلود، job به صف transcode یا آپلود می‌رود و worker سراغ دانلود بعدی می‌رود.
     """
     bot = app.bot
     while True:
         try:
-            item = await download_queue.get()
-            # skip canceled
-            if item["id"] in canceled_jobs:
-                download_queue.task_done()
-                continue
-            await _process_job(bot, item)
-            download_queue.task_done()
+            item = await _next_job()
+        except asyncio.CancelledError:
+            raise
         except Exception:
             # never crash — sleep and continue
+            _internal_error("next_job")
+            await asyncio.sleep(1)
+            continue
+        started = time.monotonic()
+        job_id = item["id"]
+        handed = False
+        try:
+            # lease: اگر job در این فاصله لغو شده باشد claim نمی‌شود
+            if await db.claim_job(job_id, worker, JOB_LEASE_SEC):
+                if "enqueued_at" in item:
+                    metrics.observe("bot_queue_wait_seconds", started - item["enqueued_at"], platform=item["platform"])
+                _active_jobs[job_id] = item
+                # heartbeat تا پایان آپلود ادامه دارد (lease شامل مرحله‌ی آپلود هم هست)
+                item["heartbeat"] = asyncio.create_task(_heartbeat(job_id, worker))
+                # trace بعد از ساختن heartbeat فعال می‌شود تا کوئری‌های heartbeat جزو span ها نشوند
+                item["trace"] = tracing.start("job", job=job_id, platform=item["platform"],
+                                              queue_wait=f"{started - item.get('enqueued_at', started):.1f}s")
+                token = tracing.activate(item["trace"])
+                try:
+                    handed = await _process_job(bot, item)
+                finally:
+                    tracing.deactivate(token)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _internal_error("worker")
             await asyncio.sleep(1)
+        finally:
+            if not handed:
+                _finish_item(item)
+                await _batch_finish(item)
+            elapsed = time.monotonic() - started
+            if handed:
+                _record_stage("download", elapsed)
+            await _release_job(item, elapsed)
+
+async def transcode_loop(app):
+    """one transcode worker (TRANSCODE_ENABLED) — فایل‌های دانلودشده به ترتیب ورود فشرده و به صف آپلود داده می‌شوند"""
+    bot = app.bot
+    while True:
+        job = await _transcode_queue.get()
+        item = job["item"]
+        _record_stage("transcode_wait", time.monotonic() - job["queued_at"])
+        token = tracing.activate(item.get("trace"))
+        tracing.record("transcode_wait", job["queued_at"])
+        handed = False
+        try:
+            handed = await _transcode_job(bot, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _internal_error("transcode")
+        finally:
+            if not handed:
+                _finish_item(item)
+                await _batch_finish(item)
+            tracing.deactivate(token)
+            _transcode_queue.task_done()
+
+async def upload_loop(app):
+    """one upload worker — job های دانلودشده را به ترتیب ورود به صف ارسال می‌کند"""
+    bot = app.bot
+    while True:
+        upload = await _upload_queue.get()
+        item = upload["item"]
+        _record_stage("upload_wait", time.monotonic() - upload["queued_at"])
+        # هر STAGE_STATS_LOG_EVERY job یک بار (بعد از تمام شدن همین آپلود)
+        report = stage_stats["upload_wait"]["count"] % STAGE_STATS_LOG_EVERY == 0
+        # ادامه‌ی trace همان job
+        token = tracing.activate(item.get("trace"))
+        tracing.record("upload_wait", upload["queued_at"])
+        try:
+            with tracing.span("upload"):
+                await _upload_job(bot, upload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _internal_error("upload")
+        finally:
+            _finish_item(item)
+            tracing.deactivate(token)
+            await _batch_finish(item)
+            _upload_queue.task_done()
+        if report:
+            _log_stages()
+
+def start_workers(app, workers: int = DOWNLOAD_WORKERS):
+    """
+    start the worker pool and cleanup loop — scheduled from bot.post_init (safe)
+    از app.create_task استفاده نمی‌کنیم چون Application.stop منتظر آن task ها می‌ماند و
+    حلقه‌های بی‌پایان shutdown را قفل می‌کنند؛ stop_workers آن‌ها را cancel می‌کند.
+    """
+    global _bot
+    _bot = app.bot
+    # پوشه‌های اجرای قبلی صاحبی ندارند (job های بازیابی‌شده پوشه‌ی تازه می‌گیرند)
+    workspace.sweep(max_age=0)
+    loop = asyncio.get_running_loop()
+    for n in range(workers):
+        _worker_tasks.append(loop.create_task(worker_loop(app, f"{os.getpid()}-{n}")))
+    if TRANSCODE_ENABLED:
+        for _ in range(TRANSCODE_WORKERS):
+            _worker_tasks.append(loop.create_task(transcode_loop(app)))
+    for _ in range(UPLOAD_WORKERS):
+        _worker_tasks.append(loop.create_task(upload_loop(app)))
+    _worker_tasks.append(loop.create_task(cleanup_loop()))
+
+async def stop_workers():
+    """
+    clean shutdown — called from bot.post_shutdown
+    job های در حال اجرا cancel می‌شوند و thread/process های yt-dlp رها می‌شوند؛
+    وضعیتشان در دیتابیس running می‌ماند تا اجرای بعدی بازیابی‌شان کند.
+    """
+    for ctrl in _job_ctrl.values():
+        _abort(ctrl)
+    for t in _worker_tasks:
+        t.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _probe_executor.shutdown(wait=False, cancel_futures=True)
+    ytdl_pool.shutdown()
 
 async def cleanup_loop():
     """
-    periodically cleanup lingering files (safety)
+    periodic maintenance: پوشه‌های یتیم، TTL کش، job های گیرکرده
+    (پوشه‌ی هر job همان لحظه‌ی پایان/آپلود پاک می‌شود؛ اینجا فقط باقی‌مانده‌ی crash ها)
     """
-    import time
     while True:
         try:
-            now = time.time()
-            for p in os.listdir(DOWNLOAD_FOLDER):
-                full = os.path.join(DOWNLOAD_FOLDER, p)
-                try:
-                    if os.path.isdir(full):
-                        # check age of directory
-                        m = os.path.getmtime(full)
-                        if now - m > 3600:  # 1 hour
-                            shutil.rmtree(full, ignore_errors=True)
-                except Exception:
-                    pass
+            workspace.sweep()
+            await asyncio.to_thread(workspace.refresh_folder_bytes)
+            if not workspace.has_room():
+                logger.warning("low disk: %s", workspace.metrics())
+            # TTL کش نتایج
+            await db.purge_expired_media()
+            # job هایی که lease شان منقضی شده (worker گیر کرده/مرده) دوباره در صف
+            requeued, _failed = await db.recover_jobs(only_expired=True)
+            await _requeue(requeued)
+            await db.purge_finished_jobs(JOB_HISTORY_KEEP_SEC)
         except Exception:
-            pass
-        await asyncio.sleep(600)
+            _internal_error("cleanup")
+        await asyncio.sleep(CLEANUP_INTERVAL_SEC)
@@ -1,5 +1,6 @@
 # messages.py
-from translator import translate
+from config import TRANSLATION_CATALOG_PATH
+from translator import build_catalog, load_catalog
 
 # کلیدها و متن‌های پایه به فارسی
 BASE = {
@@ -46,16 +47,66 @@ BASE = {
     "btn_queue_status": "🗂 وضعیت صف",
     "btn_cancel_download": "🚫 لغو دانلود",
     "added_queue": "✅ لینک شما به صف اضافه شد. (برای لغو، دکمه لغو را بزن)",
+    "added_queue_batch": "✅ {count} لینک به صف اضافه شد؛ فایل‌ها به همین ترتیب ارسال می‌شوند. (برای لغو همه، دکمه لغو را بزن)",
+    "batch_partial": "⚠️ {skipped} لینک به خاطر سقف دانلود روزانه یا سقف صف پذیرفته نشد.",
+    "btn_cancel_all": "🚫 لغو همه",
+    "cancelled_batch": "🚫 {count} دانلود لغو شد.",
+    "playlist_usage": "📚 برای دانلود playlist یا آلبوم: /playlist <لینک>\n(حداکثر {limit} مورد اول)",
+    "playlist_expanding": "🔎 در حال خواندن فهرست...",
+    "playlist_empty": "❌ موردی در این لینک پیدا نشد (playlist یا آلبوم نیست؟).",
     "cancelled": "🚫 دانلود لغو شد.",
     "invalid_link": "❌ لینک معتبر نیست. لطفاً لینک کامل بفرست.",
     "guest_must_register": "🔐 این لینک فقط برای کاربران عضو است. لطفاً حساب بسازید.",
     "guest_limit": "⚠️ شما مهمان هستید؛ روزی {} دانلود مجاز است.",
     "registered_limit": "⚠️ سقف دانلود روزانه شما ({}) تکمیل شده.",
+    "queue_full": "⏳ تعداد لینک‌های در انتظار شما به سقف ({limit}) رسیده؛ کمی صبر کنید.",
+    "queue_position": "🗂 جایگاه شما در صف: {position}\n⏱ زمان تقریبی انتظار: {wait} ثانیه\n📋 کل صف: {total}",
+    "queue_empty": "🗂 لینکی از شما در صف نیست.\n📋 کل صف: {total}",
+    "cancel_too_late": "⚠️ این دانلود قبلاً تمام یا لغو شده است.",
+    "job_recovered": "🔄 ربات دوباره راه‌اندازی شد؛ لینک شما دوباره در صف قرار گرفت:\n{url}",
+    "job_recover_failed": "❌ دانلود این لینک بعد از چند تلاش ناموفق بود:\n{url}",
+    "too_large": "❌ این فایل برای ارسال در تلگرام خیلی بزرگ است (حداکثر {limit} MB).",
+    "too_long": "❌ این ویدیو خیلی طولانی است (حداکثر {limit} دقیقه).",
+    "disk_full": "⚠️ سرور در حال حاضر فضای کافی ندارد؛ چند دقیقه‌ی دیگر دوباره تلاش کنید.",
     "cancel_info": "برای لغو دانلود، روی دکمه «🚫 لغو دانلود» که بعد از ارسال لینک می‌آید بزنید."
 }
 
-def get_text(key: str, lang: str = "fa", **kwargs) -> str:
+# ترجمه‌ی از پیش ساخته‌شده‌ی BASE برای هر زبان (translations.json)
+_catalog = load_catalog(TRANSLATION_CATALOG_PATH)
+# زبان‌های غیر فارسی: misses = کلیدی که ترجمه نداشت و متن فارسی نشان داده شد
+catalog_stats = {"hits": 0, "misses": 0}
+
+def _lookup(key: str, lang: str):
+    # ترجمه‌ی کلیدی که متن فارسی‌اش بعد از build عوض شده، کهنه است
+    if _catalog.get("source", {}).get(key) != BASE.get(key):
+        return None
+    return _catalog.get(lang, {}).get(key)
+
+def get_text(key: str, lang: str = "fa", *args, **kwargs) -> str:
+    """
+    قالب ترجمه‌شده را از catalog برمی‌دارد و بعد format می‌کند — بدون درخواست شبکه؛
+    اگر ترجمه‌ای نباشد متن فارسی برمی‌گردد.
+    """
     text = BASE.get(key, "")
-    if kwargs:
-        text = text.format(**kwargs)
-    return translate(text, lang)
+    if lang != "fa":
+        translated = _lookup(key, lang)
+        catalog_stats["hits" if translated else "misses"] += 1
+        text = translated or text
+    if args or kwargs:
+        text = text.format(*args, **kwargs)
+    return text
+
+def warm_up():
+    """
+    کلیدهای ترجمه‌نشده را ترجمه و catalog را ذخیره می‌کند — blocking (شبکه)؛
+    از bot.post_init در یک thread جدا اجرا می‌شود.
+    """
+    global _catalog
+    _catalog = build_catalog(BASE, TRANSLATION_CATALOG_PATH, existing=_catalog)
+
+if __name__ == "__main__":
+    # build step: python messages.py
+    warm_up()
+    for lang, table in _catalog.items():
+        if lang != "source":
+            print(f"{lang}: {len(table)}/{len(BASE)} keys")
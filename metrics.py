@@ -0,0 +1,152 @@
+# metrics.py
+"""
+شمارنده‌ها و histogram های ساده در قالب متنی Prometheus (بدون وابستگی اضافه) و endpoint محلی /metrics.
+inc/observe فقط از event loop صدا زده می‌شوند؛ آمارهایی که ماژول‌ها خودشان در dict نگه می‌دارند
+(send_stats، workspace.metrics و ...) هنگام هر scrape با collector ها خوانده می‌شوند.
+"""
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ثانیه؛ از query دیتابیس تا دانلود چنددقیقه‌ای
+BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# name -> (type, help)
+_meta: dict = {}
+# name -> {labels tuple: value}
+_counters: dict = {}
+# name -> {labels tuple: [bucket counts..., sum, count]}
+_histograms: dict = {}
+# توابعی که هنگام scrape صدا زده می‌شوند: () -> iterable of (name, type, help, labels dict, value)
+_collectors: list = []
+
+def counter(name: str, help_text: str):
+    _meta[name] = ("counter", help_text)
+    _counters.setdefault(name, {})
+
+def histogram(name: str, help_text: str):
+    _meta[name] = ("histogram", help_text)
+    _histograms.setdefault(name, {})
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    series = _counters[name]
+    key = _key(labels)
+    series[key] = series.get(key, 0) + value
+
+def observe(name: str, seconds: float, **labels):
+    series = _histograms[name]
+    key = _key(labels)
+    h = series.get(key)
+    if h is None:
+        h = series[key] = [0] * (len(BUCKETS) + 2)
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            h[i] += 1
+    h[-2] += seconds
+    h[-1] += 1
+
+@contextmanager
+def timer(name: str, **labels):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+def totals(name: str) -> dict:
+    """{labels dict (به صورت tuple): (count, sum)} یک histogram — برای گزارش‌های bench"""
+    return {key: (h[-1], h[-2]) for key, h in _histograms.get(name, {}).items()}
+
+def register_collector(fn):
+    _collectors.append(fn)
+
+def _labels(key, extra=()) -> str:
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in items)
+    return "{" + body + "}"
+
+def _num(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def render() -> str:
+    """text exposition format 0.0.4"""
+    lines = []
+    for name, series in _counters.items():
+        mtype, help_text = _meta[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+        for key, value in series.items():
+            lines.append(f"{name}{_labels(key)} {_num(value)}")
+    for name, series in _histograms.items():
+        lines.append(f"# HELP {name} {_meta[name][1]}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, h in series.items():
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f"{name}_bucket{_labels(key, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_labels(key, [('le', '+Inf')])} {h[-1]}")
+            lines.append(f"{name}_sum{_labels(key)} {_num(h[-2])}")
+            lines.append(f"{name}_count{_labels(key)} {h[-1]}")
+    # collector ها: سری‌های هم‌نام باید پشت سر هم و زیر یک HELP/TYPE بیایند
+    families = {}
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception:
+            logger.warning("metrics collector %s failed", getattr(fn, "__name__", fn), exc_info=True)
+            continue
+        for name, mtype, help_text, labels, value in samples:
+            families.setdefault(name, (mtype, help_text, []))[2].append((labels, value))
+    for name, (mtype, help_text, series) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+        for labels, value in series:
+            lines.append(f"{name}{_labels(_key(labels))} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+# ---------------- HTTP endpoint ----------------
+_server = None
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        # هدرها خوانده و دور ریخته می‌شوند
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", render().encode()
+        else:
+            status, ctype, body = "404 Not Found", "text/plain", b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(host: str, port: int):
+    """called from bot.post_init؛ port=0 یعنی خاموش"""
+    global _server
+    if not port or _server is not None:
+        return
+    _server = await asyncio.start_server(_handle, host, port)
+    logger.info("metrics on http://%s:%d/metrics", host, port)
+
+async def stop_server():
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
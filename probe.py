@@ -0,0 +1,157 @@
+# probe.py
+"""
+پیش‌بررسی لینک قبل از دانلود (extract_info با download=False):
+مدت و حجم هر فرمت خوانده می‌شود، بهترین فرمتی که زیر سقف آپلود جا می‌شود انتخاب می‌شود
+و job هایی که هیچ فرمتی‌شان جا نمی‌شود قبل از گرفتن worker رد می‌شوند.
+"""
+import time
+import itertools
+import threading
+from collections import OrderedDict
+import profiles
+import transcode
+import ytdl_pool
+from utils import detect_platform
+from config import (
+    PROBE_CACHE_TTL_SEC, PROBE_CACHE_SIZE, MAX_VIDEO_HEIGHT, MAX_MEDIA_DURATION_SEC, YTDL_SOCKET_TIMEOUT_SEC,
+)
+
+# key -> (expires_at, result)
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _format_size(f: dict, duration):
+    """حجم فرمت؛ اگر yt-dlp نداد از bitrate × مدت تخمین زده می‌شود"""
+    size = f.get("filesize") or f.get("filesize_approx")
+    if not size and f.get("tbr") and duration:
+        size = int(f["tbr"] * 1000 / 8 * duration)
+    return size
+
+def _has(codec) -> bool:
+    return codec is not None and codec != "none"
+
+def select_format(info: dict, is_audio: bool, limit: int, max_height: int = MAX_VIDEO_HEIGHT, fallback: str = ""):
+    """
+    returns (format_spec, estimated_size):
+      format_spec=None  -> هیچ فرمتی زیر limit نیست (رد)
+      format_spec=""    -> حجم‌ها معلوم نیست؛ فرمت پیش‌فرض config استفاده شود
+    fallback: بعد از format_id های انتخاب‌شده با "/" اضافه می‌شود (معمولاً فرمت پروفایل) تا اگر
+    هنگام دانلود همان format_id دیگر موجود نبود (لینک منقضی، فهرست فرمت عوض شده) دانلود شکست نخورد.
+    """
+    spec, size = _select_format(info, is_audio, limit, max_height)
+    if spec and fallback:
+        spec = f"{spec}/{fallback}"
+    return spec, size
+
+def _select_format(info: dict, is_audio: bool, limit: int, max_height: int):
+    duration = info.get("duration")
+    formats = info.get("formats") or []
+    if not formats:
+        size = _format_size(info, duration)
+        if size and size > limit:
+            return None, size
+        return "", size
+
+    unknown = False
+    audios, videos, progressive = [], [], []
+    for f in formats:
+        size = _format_size(f, duration)
+        v, a = f.get("vcodec"), f.get("acodec")
+        if not size:
+            unknown = True
+            continue
+        if _has(a) and not _has(v) and v is not None:
+            audios.append((f.get("abr") or f.get("tbr") or 0, size, f["format_id"]))
+        elif _has(v) and not _has(a) and a is not None:
+            videos.append((f.get("height") or 0, f.get("tbr") or 0, size, f["format_id"]))
+        else:
+            # هر دو codec یا codec نامعلوم (سایت‌های تک‌فایلی)
+            progressive.append((f.get("height") or 0, f.get("tbr") or 0, size, f["format_id"]))
+
+    if is_audio:
+        fitting = [x for x in audios if x[1] <= limit]
+        if fitting:
+            best = max(fitting)
+            return best[2], best[1]
+        fitting = [x for x in progressive if x[2] <= limit]
+        if fitting:
+            best = min(fitting, key=lambda x: x[2])
+            return best[3], best[2]
+        return ("" if unknown else None), None
+
+    candidates = []
+    for height, tbr, size, fid in progressive:
+        if height <= max_height and size <= limit:
+            candidates.append(((height, tbr), size, fid))
+    for height, tbr, size, fid in videos:
+        if height > max_height or size > limit:
+            continue
+        room = [x for x in audios if x[1] <= limit - size]
+        if room:
+            abr, asize, afid = max(room)
+            candidates.append(((height, tbr + abr), size + asize, f"{fid}+{afid}"))
+    if candidates:
+        _rank, size, spec = max(candidates, key=lambda x: x[0])
+        return spec, size
+    return ("" if unknown else None), None
+
+def probe(url: str, is_audio: bool, limit: int, cache_key: str = None, transcode_limit: int = 0) -> dict:
+    """
+    blocking — در executor اجرا شود.
+    returns {"format", "size", "duration", "reject"}؛ reject: None | "too_large" | "too_long"
+    transcode_limit: اگر هیچ فرمتی زیر limit نیست ولی بعد از فشرده‌سازی جا می‌شود، فرمتی تا این حجم
+    انتخاب می‌شود (مرحله‌ی transcode بعد از دانلود آن را زیر سقف آپلود می‌برد).
+    نتیجه برای PROBE_CACHE_TTL_SEC کش می‌شود (لینک‌های پرتکرار دوباره بررسی نمی‌شوند).
+    """
+    key = (cache_key or url, is_audio, limit, transcode_limit)
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now:
+            _cache.move_to_end(key)
+            return hit[1]
+    opts = {"quiet": True, "no_warnings": True, "noplaylist": True, "skip_download": True,
+            "socket_timeout": YTDL_SOCKET_TIMEOUT_SEC or None}
+    with ytdl_pool.warm_ydl(opts) as ydl:
+        info = ydl.extract_info(url, download=False, ie_key=ytdl_pool.extractor_key(ydl, url))
+    duration = info.get("duration")
+    result = {"format": "", "size": None, "duration": duration, "reject": None}
+    if duration and MAX_MEDIA_DURATION_SEC and duration > MAX_MEDIA_DURATION_SEC:
+        result["reject"] = "too_long"
+    else:
+        fallback = profiles.get(detect_platform(url))["format"]
+        spec, size = select_format(info, is_audio, limit, fallback=fallback)
+        if spec is None and transcode_limit and transcode.fits_after_transcode(duration, is_audio, limit):
+            spec, size = select_format(info, is_audio, transcode_limit, fallback=fallback)
+        result["size"] = size
+        if spec is None:
+            result["reject"] = "too_large"
+        else:
+            result["format"] = spec
+    with _cache_lock:
+        _cache[key] = (now + PROBE_CACHE_TTL_SEC, result)
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+def expand_playlist(url: str, max_items: int) -> list:
+    """
+    blocking — لینک آیتم‌های یک playlist/album به ترتیب، حداکثر max_items.
+    فقط فهرست خوانده می‌شود (extract_flat)، بدون extract هر آیتم؛ با lazy_playlist و playlistend
+    صفحه‌های بعدی فهرست فقط تا همان max_items گرفته می‌شوند.
+    returns [] اگر لینک playlist نیست
+    """
+    opts = {"quiet": True, "no_warnings": True, "skip_download": True, "extract_flat": "in_playlist",
+            "lazy_playlist": True, "playlistend": max_items, "socket_timeout": YTDL_SOCKET_TIMEOUT_SEC or None}
+    with ytdl_pool.warm_ydl(opts) as ydl:
+        info = ydl.extract_info(url, download=False, ie_key=ytdl_pool.extractor_key(ydl, url))
+    if not info or info.get("_type") not in ("playlist", "multi_video"):
+        return []
+    urls = []
+    for entry in itertools.islice(info.get("entries") or [], max_items):
+        if not entry:
+            continue
+        link = entry.get("webpage_url") or entry.get("url") or ""
+        if link.startswith(("http://", "https://")) and link not in urls:
+            urls.append(link)
+    return urls
@@ -0,0 +1,83 @@
+# profiler.py
+"""
+پروفایل زمان‌دار process در حال اجرا برای دستور ادمین /profile:
+- "cpu": cProfile روی thread event loop (handler ها، sender، downloader — همان چیزی که ربات را کند می‌کند)
+- "stack": نمونه‌برداری از stack همه‌ی thread ها (yt-dlp، db، executor ها) هر PROFILE_SAMPLE_MS
+هم‌زمان فقط یک پروفایل اجرا می‌شود.
+"""
+import io
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import threading
+from collections import Counter
+from config import PROFILE_SAMPLE_MS
+
+MODES = ("cpu", "stack")
+
+_busy = False
+
+async def capture(seconds: float, mode: str = "cpu"):
+    """returns گزارش متنی؛ None اگر پروفایل دیگری در حال اجراست"""
+    global _busy
+    if _busy:
+        return None
+    _busy = True
+    try:
+        if mode == "stack":
+            return await _sample_stacks(seconds)
+        return await _cprofile(seconds)
+    finally:
+        _busy = False
+
+async def _cprofile(seconds: float) -> str:
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    out = io.StringIO()
+    out.write(f"cProfile of the event loop thread, {seconds:.0f}s\n\n")
+    stats = pstats.Stats(prof, stream=out)
+    stats.sort_stats("cumulative").print_stats(40)
+    stats.sort_stats("tottime").print_stats(25)
+    return out.getvalue()
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}"
+
+def _sampler(seconds: float, interval: float, stacks: Counter, leaves: Counter):
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread = names.get(ident, str(ident))
+            leaves[(thread, _frame_name(frame))] += 1
+            chain = []
+            while frame is not None and len(chain) < 40:
+                chain.append(_frame_name(frame))
+                frame = frame.f_back
+            stacks[(thread, ";".join(reversed(chain)))] += 1
+        time.sleep(interval)
+
+async def _sample_stacks(seconds: float) -> str:
+    stacks, leaves = Counter(), Counter()
+    interval = PROFILE_SAMPLE_MS / 1000
+    await asyncio.to_thread(_sampler, seconds, interval, stacks, leaves)
+    total = sum(leaves.values()) or 1
+    out = io.StringIO()
+    out.write(f"stack samples of all threads, {seconds:.0f}s every {PROFILE_SAMPLE_MS}ms\n\n")
+    out.write("top frames (samples, share, thread, frame):\n")
+    for (thread, name), n in leaves.most_common(30):
+        out.write(f"{n:7d} {n * 100 / total:5.1f}% {thread:20} {name}\n")
+    out.write("\ntop stacks (collapsed, root first):\n")
+    for (thread, chain), n in stacks.most_common(15):
+        out.write(f"\n{n} samples [{thread}]\n  " + "\n  ".join(chain.split(";")) + "\n")
+    return out.getvalue()
@@ -0,0 +1,98 @@
+# profiles.py
+"""
+پروفایل دانلود yt-dlp برای هر پلتفرم (config.DOWNLOAD_PROFILES، کلید = utils.detect_platform):
+فرمت، فقط صدا، دانلود همزمان fragment های HLS/DASH، اندازه‌ی chunk درخواست‌های HTTP، retry ها
+و downloader خارجی اختیاری (مثلاً aria2c). هر پلتفرم فقط کلیدهایی را که با "default" فرق دارد می‌نویسد.
+validate() یک بار در startup صدا زده می‌شود.
+"""
+import shutil
+import logging
+from config import DOWNLOAD_PROFILES, YTDL_SOCKET_TIMEOUT_SEC
+
+logger = logging.getLogger(__name__)
+
+# کلید -> نوع(های) مجاز
+_FIELDS = {
+    "format": str,
+    "audio": bool,
+    "merge_output_format": (str, type(None)),
+    "concurrent_fragments": int,
+    "http_chunk_size": int,  # بایت؛ 0 = یک درخواست برای کل فایل
+    "retries": int,
+    "fragment_retries": int,
+    "external_downloader": (str, type(None)),
+    "external_downloader_args": list,
+}
+
+# platform -> پروفایل کامل (بعد از validate)
+_resolved: dict = {}
+
+def _merge(platform: str) -> dict:
+    return {**DOWNLOAD_PROFILES["default"], **DOWNLOAD_PROFILES.get(platform, {})}
+
+def _check(name: str, profile: dict):
+    unknown = set(profile) - set(_FIELDS)
+    if unknown:
+        raise ValueError(f"DOWNLOAD_PROFILES[{name!r}]: unknown keys {sorted(unknown)}")
+    for key, value in profile.items():
+        kinds = _FIELDS[key]
+        # bool زیرکلاس int است؛ True به جای عدد قبول نمی‌شود
+        if not isinstance(value, kinds) or (kinds is int and isinstance(value, bool)):
+            raise ValueError(f"DOWNLOAD_PROFILES[{name!r}][{key!r}]: bad value {value!r}")
+    if profile.get("concurrent_fragments", 1) < 1:
+        raise ValueError(f"DOWNLOAD_PROFILES[{name!r}]: concurrent_fragments must be >= 1")
+    for key in ("http_chunk_size", "retries", "fragment_retries"):
+        if profile.get(key, 0) < 0:
+            raise ValueError(f"DOWNLOAD_PROFILES[{name!r}]: {key} must be >= 0")
+
+def validate():
+    """
+    raises ValueError برای تنظیمات غلط (کلید ناشناخته، نوع یا عدد نامعتبر، نبودن "default")؛
+    downloader خارجی‌ای که نصب نیست فقط هشدار می‌گیرد و پروفایل با downloader خود yt-dlp اجرا می‌شود.
+    """
+    if "default" not in DOWNLOAD_PROFILES:
+        raise ValueError("DOWNLOAD_PROFILES needs a 'default' profile")
+    missing = set(_FIELDS) - set(DOWNLOAD_PROFILES["default"])
+    if missing:
+        raise ValueError(f"DOWNLOAD_PROFILES['default']: missing keys {sorted(missing)}")
+    _resolved.clear()
+    for name, profile in DOWNLOAD_PROFILES.items():
+        _check(name, profile)
+        merged = _merge(name)
+        tool = merged["external_downloader"]
+        if tool and shutil.which(tool) is None:
+            logger.warning("download profile %s: %s is not installed; using the native downloader", name, tool)
+            merged["external_downloader"] = None
+        _resolved[name] = merged
+
+def get(platform) -> dict:
+    """پروفایل کامل پلتفرم (None یا پلتفرم بدون پروفایل -> default)"""
+    if not _resolved:
+        validate()
+    return _resolved.get(platform) or _resolved["default"]
+
+def ydl_options(profile: dict, outtmpl: str, fmt: str = "") -> dict:
+    """
+    ydl_opts دانلود از روی پروفایل
+    fmt: فرمتی که probe انتخاب کرده؛ خالی = فرمت پروفایل
+    """
+    opts = {
+        "format": fmt or profile["format"],
+        "outtmpl": outtmpl,
+        "noplaylist": True,
+        "retries": profile["retries"],
+        "fragment_retries": profile["fragment_retries"],
+        "concurrent_fragment_downloads": profile["concurrent_fragments"],
+    }
+    if YTDL_SOCKET_TIMEOUT_SEC:
+        opts["socket_timeout"] = YTDL_SOCKET_TIMEOUT_SEC
+    if profile["http_chunk_size"]:
+        opts["http_chunk_size"] = profile["http_chunk_size"]
+    if not profile["audio"] and profile["merge_output_format"]:
+        opts["merge_output_format"] = profile["merge_output_format"]
+    tool = profile["external_downloader"]
+    if tool:
+        opts["external_downloader"] = {"default": tool}
+        if profile["external_downloader_args"]:
+            opts["external_downloader_args"] = {tool: list(profile["external_downloader_args"])}
+    return opts
@@ -0,0 +1,107 @@
+# scheduler.py
+"""
+صف منصفانه بین کاربران (deficit round robin)
+هر کاربر صف خودش را دارد و worker ها به نوبت از صف کاربران برمی‌دارند؛
+کاربر عضو وزن بیشتری دارد (در هر دور job بیشتری برمی‌دارد).
+فقط از داخل event loop (زیر قفل downloader) صدا زده می‌شود.
+"""
+from collections import deque
+
+# user_id -> deque of jobs
+_user_queues: dict = {}
+# ترتیب نوبت کاربران (round robin)
+_ring: deque = deque()
+# user_id -> deficit counter
+_deficit: dict = {}
+
+def pending_count() -> int:
+    return sum(len(q) for q in _user_queues.values())
+
+def user_pending(user_id: int) -> int:
+    q = _user_queues.get(user_id)
+    return len(q) if q else 0
+
+def push(item: dict):
+    """
+    item باید user_id و weight داشته باشد.
+    سقف job های در انتظار هر کاربر را enqueue_downloads (همراه سهمیه‌ی روزانه) حساب می‌کند.
+    """
+    user_id = item["user_id"]
+    q = _user_queues.get(user_id)
+    if q is None:
+        q = _user_queues[user_id] = deque()
+        _ring.append(user_id)
+        _deficit[user_id] = 0.0
+    q.append(item)
+
+def _drop_user(user_id: int):
+    del _user_queues[user_id]
+    _deficit.pop(user_id, None)
+    try:
+        _ring.remove(user_id)
+    except ValueError:
+        pass
+
+def pick(has_slot):
+    """
+    has_slot(item) -> bool: آیا برای این job ظرفیت (مثلاً سقف پلتفرم) هست؟
+    returns next job or None
+    """
+    for _ in range(2 * len(_ring)):
+        user_id = _ring[0]
+        q = _user_queues[user_id]
+        if _deficit[user_id] < 1:
+            _deficit[user_id] += q[0]["weight"]
+        idx = next((i for i, it in enumerate(q) if has_slot(it)), None)
+        if idx is None:
+            # هیچ job این کاربر الان قابل اجرا نیست؛ نوبت بعدی
+            _ring.rotate(-1)
+            continue
+        item = q[idx]
+        del q[idx]
+        _deficit[user_id] -= 1
+        if not q:
+            _drop_user(user_id)
+        elif _deficit[user_id] < 1:
+            _ring.rotate(-1)
+        return item
+    return None
+
+def remove(job_id: str):
+    """job لغو شده را از صف حذف می‌کند؛ returns item or None"""
+    for user_id, q in list(_user_queues.items()):
+        for item in q:
+            if item["id"] == job_id:
+                q.remove(item)
+                if not q:
+                    _drop_user(user_id)
+                return item
+    return None
+
+def position(user_id: int):
+    """
+    جایگاه اولین job کاربر (1 = نفر بعدی) — با شبیه‌سازی همین round robin روی تعداد job ها؛
+    سقف همزمانی پلتفرم‌ها در نظر گرفته نمی‌شود پس عدد تقریبی است.
+    returns None اگر job ای در صف ندارد
+    """
+    if not _user_queues.get(user_id):
+        return None
+    counts = {u: len(q) for u, q in _user_queues.items()}
+    weights = {u: q[0]["weight"] for u, q in _user_queues.items()}
+    deficit = dict(_deficit)
+    ring = deque(_ring)
+    served = 0
+    while ring:
+        u = ring[0]
+        if deficit[u] < 1:
+            deficit[u] += weights[u]
+        if u == user_id:
+            return served + 1
+        served += 1
+        counts[u] -= 1
+        deficit[u] -= 1
+        if not counts[u]:
+            ring.popleft()
+        elif deficit[u] < 1:
+            ring.rotate(-1)
+    return served + 1
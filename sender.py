@@ -0,0 +1,258 @@
+# sender.py
+"""
+زمان‌بند ارسال به تلگرام: همه‌ی درخواست‌های Bot (handler ها و downloader) از این limiter رد می‌شوند.
+- token bucket سراسری و token bucket جدا برای هر chat (گروه‌ها کندتر)
+- RetryAfter: chat (یا کل ارسال) به اندازه‌ی retry_after متوقف و درخواست دوباره فرستاده می‌شود
+- اولویت: پاسخ‌های کوچک تعاملی < ویرایش وضعیت < آپلود فایل
+- edit_status: ویرایش‌های پیام وضعیت (پیشرفت دانلود) ادغام و حداکثر هر STATUS_EDIT_INTERVAL_SEC یک بار فرستاده می‌شوند
+"""
+import time
+import asyncio
+import bisect
+import logging
+import itertools
+from telegram import InputFile
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+import tracing
+from config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GROUP_RATE,
+    SEND_MAX_RETRIES, SEND_UPLOAD_CONCURRENCY, STATUS_EDIT_INTERVAL_SEC,
+)
+
+logger = logging.getLogger(__name__)
+
+# اولویت‌ها (عدد کمتر زودتر)؛ rate_limit_args=PRIORITY_STATUS برای پیام‌هایی که عجله ندارند
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STATUS = 1
+PRIORITY_UPLOAD = 2
+
+# endpoint هایی که سهمیه‌ی پیام مصرف نمی‌کنند
+_UNLIMITED = frozenset({"answerCallbackQuery", "answerInlineQuery", "getMe", "getFile", "getChat",
+                        "setWebhook", "deleteWebhook", "getWebhookInfo"})
+
+send_stats = {"sent": 0, "retry_after": 0, "dropped": 0, "coalesced": 0, "wait_sec": 0.0}
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp", "blocked_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait(self, now: float) -> float:
+        """ثانیه تا وقتی یک token آماده است (0 = همین حالا)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 0
+
+class OutboundLimiter(BaseRateLimiter):
+    """
+    Application.builder().rate_limiter(OutboundLimiter())
+    درخواست‌ها در صف اولویت منتظر می‌مانند؛ dispatcher به ترتیب (اولویت، زمان ورود)
+    به اولین درخواستی که bucket chat اش آماده است token می‌دهد.
+    """
+
+    def __init__(self):
+        self._global = _Bucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        # chat_id -> _Bucket
+        self._chats: dict = {}
+        # sorted [(priority, seq, chat_id, future)]
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._uploads = None
+
+    async def initialize(self) -> None:
+        # ExtBot.initialize limiter را قبل از چک «initialized» خودش صدا می‌زند (Application و Updater هر دو)
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._uploads = asyncio.Semaphore(SEND_UPLOAD_CONCURRENCY)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for _p, _s, _c, fut in self._waiters:
+            fut.cancel()
+        self._waiters.clear()
+
+    def _chat_bucket(self, chat_id) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # chat_id منفی/رشته = گروه یا کانال (۲۰ پیام در دقیقه)
+            group = isinstance(chat_id, str) or chat_id < 0
+            rate = SEND_GROUP_RATE if group else SEND_CHAT_RATE
+            bucket = self._chats[chat_id] = _Bucket(rate, SEND_CHAT_BURST)
+        return bucket
+
+    def _prune(self, now: float):
+        """bucket هایی که پر شده‌اند اطلاعاتی ندارند؛ حذف تا dict بی‌نهایت بزرگ نشود"""
+        if len(self._chats) < 1000:
+            return
+        waiting = {w[2] for w in self._waiters}
+        for chat_id in [c for c, b in self._chats.items()
+                        if c not in waiting and b.wait(now) == 0 and b.tokens >= b.burst]:
+            del self._chats[chat_id]
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            # درخواست‌هایی که فرستنده‌شان cancel شده
+            self._waiters = [w for w in self._waiters if not w[3].done()]
+            now = time.monotonic()
+            sleep = self._global.wait(now) or None
+            granted = False
+            if sleep is None:
+                for _p, _s, chat_id, fut in self._waiters:
+                    cwait = self._chat_bucket(chat_id).wait(now) if chat_id is not None else 0.0
+                    if cwait == 0:
+                        self._global.take()
+                        if chat_id is not None:
+                            self._chats[chat_id].take()
+                        fut.set_result(None)
+                        granted = True
+                        break
+                    sleep = cwait if sleep is None else min(sleep, cwait)
+            if granted:
+                # دوباره از اول صف (بالاترین اولویت) بررسی شود
+                continue
+            self._prune(now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, chat_id, priority: int):
+        fut = asyncio.get_running_loop().create_future()
+        # seq یکتاست پس مقایسه‌ی tuple هیچ‌وقت به future نمی‌رسد
+        bisect.insort(self._waiters, (priority, next(self._seq), chat_id, fut))
+        self._wakeup.set()
+        started = time.monotonic()
+        try:
+            await fut
+        finally:
+            send_stats["wait_sec"] += time.monotonic() - started
+
+    def _block(self, chat_id, seconds: float):
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._global.block(until)
+        else:
+            self._chat_bucket(chat_id).block(until)
+        self._wakeup.set()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        with tracing.span("api", method=endpoint):
+            return await self._process(callback, args, kwargs, endpoint, data, rate_limit_args)
+
+    async def _process(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in _UNLIMITED:
+            return await callback(*args, **kwargs)
+        chat_id = data.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        # InputFile = آپلود multipart؛ file:// = ارسال با مسیر در حالت سرور محلی
+        upload = any(isinstance(v, InputFile) or (isinstance(v, str) and v.startswith("file://"))
+                     for v in data.values())
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        else:
+            priority = PRIORITY_UPLOAD if upload else PRIORITY_INTERACTIVE
+
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            with tracing.span("rate_limit_wait"):
+                await self._acquire(chat_id, priority)
+            try:
+                if upload:
+                    # آپلودهای بزرگ پهنای باند را می‌گیرند؛ تعدادشان محدود است
+                    async with self._uploads:
+                        result = await callback(*args, **kwargs)
+                else:
+                    result = await callback(*args, **kwargs)
+                send_stats["sent"] += 1
+                return result
+            except RetryAfter as e:
+                send_stats["retry_after"] += 1
+                ra = e.retry_after
+                seconds = ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+                if attempt == SEND_MAX_RETRIES:
+                    send_stats["dropped"] += 1
+                    logger.warning("%s to %s dropped after %d flood waits", endpoint, chat_id, attempt + 1)
+                    raise
+                logger.info("flood wait %.1fs on %s (chat %s)", seconds, endpoint, chat_id)
+                self._block(chat_id, seconds + 0.1)
+
+# ویرایش‌های ادغام‌شده‌ی پیام وضعیت: (chat_id, message_id) -> {"msg", "text", "sent", "last", "task"}
+_status: dict = {}
+
+def edit_status(msg, text: str):
+    """
+    non-blocking — فقط آخرین متن نگه داشته و حداکثر هر STATUS_EDIT_INTERVAL_SEC یک بار ویرایش می‌شود.
+    از thread های yt-dlp با loop.call_soon_threadsafe صدا زده شود.
+    """
+    if msg is None:
+        return
+    key = (msg.chat_id, msg.message_id)
+    entry = _status.get(key)
+    if entry is None:
+        entry = _status[key] = {"msg": msg, "text": None, "sent": msg.text, "last": time.monotonic(),
+                                "task": None}
+    elif entry["task"] is not None:
+        send_stats["coalesced"] += 1
+    entry["text"] = text
+    if entry["task"] is None:
+        entry["task"] = asyncio.get_running_loop().create_task(_flush_status(key))
+
+async def _flush_status(key):
+    entry = _status.get(key)
+    msg = entry["msg"]
+    try:
+        # متن‌هایی که در حین ارسال رسیده‌اند هم فرستاده شوند
+        while entry["text"] != entry["sent"]:
+            delay = entry["last"] + STATUS_EDIT_INTERVAL_SEC - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = entry["text"]
+            entry["last"] = time.monotonic()
+            await msg.get_bot().edit_message_text(text, chat_id=msg.chat_id, message_id=msg.message_id,
+                                                  rate_limit_args=PRIORITY_STATUS)
+            entry["sent"] = text
+    except BadRequest:
+        # پیام پاک شده یا متن تغییری نکرده
+        pass
+    except Exception:
+        logger.debug("status edit failed", exc_info=True)
+    finally:
+        entry["task"] = None
+        # چیزی در انتظار نیست؛ ویرایش بعدی entry تازه می‌سازد (last تازه = همان فاصله‌ی حداقل)
+        if _status.get(key) is entry:
+            del _status[key]
+
+async def discard_status(msg):
+    """قبل از پاک کردن پیام وضعیت: ویرایش‌های در انتظار لغو می‌شوند"""
+    if msg is None:
+        return
+    entry = _status.pop((msg.chat_id, msg.message_id), None)
+    if entry and entry["task"]:
+        entry["task"].cancel()
@@ -0,0 +1,122 @@
+# tests/conftest.py
+"""
+تست‌ها در یک پوشه‌ی موقت اجرا می‌شوند (downloads.db و downloads/ پروژه دست نمی‌خورند)؛
+yt-dlp و Telegram نسخه‌های جعلی fakes.py هستند.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# قبل از import ماژول‌های ربات (config متغیرهای محیطی را موقع import می‌خواند)
+os.environ.setdefault("TOKEN", "123456:TEST-TOKEN")
+os.environ["METRICS_PORT"] = "0"
+_WORKDIR = tempfile.mkdtemp(prefix="bot-tests-")
+os.chdir(_WORKDIR)
+
+import yt_dlp  # noqa: E402
+import config  # noqa: E402
+import database as db  # noqa: E402
+import downloader  # noqa: E402
+import scheduler  # noqa: E402
+import sender  # noqa: E402
+import transcode  # noqa: E402
+import workspace  # noqa: E402
+from fakes import MEDIA_METHODS, FakeTelegram, FakeYoutubeDL  # noqa: E402
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(ROOT)
+    shutil.rmtree(_WORKDIR, ignore_errors=True)
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """دیتابیس خالی برای هر تست (connection روی thread دیتابیس دوباره باز می‌شود)"""
+    db._download_buffer.clear()
+    db._profiles.clear()
+    db._executor.submit(db._close).result()
+    monkeypatch.setattr(db, "DATABASE_PATH", str(tmp_path / "bot.db"))
+    db.init_db()
+    yield tmp_path / "bot.db"
+    db._download_buffer.clear()
+    db._executor.submit(db._close).result()
+
+@pytest.fixture
+def fake_ytdl(monkeypatch):
+    """YoutubeDL جعلی؛ تست‌ها delay/size/steps را روی همین کلاس تنظیم می‌کنند"""
+    monkeypatch.setattr(yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    monkeypatch.setattr(FakeYoutubeDL, "delay", 0.2)
+    monkeypatch.setattr(FakeYoutubeDL, "probe_delay", 0.0)
+    monkeypatch.setattr(FakeYoutubeDL, "size", 64 * 1024)
+    monkeypatch.setattr(FakeYoutubeDL, "steps", 10)
+    return FakeYoutubeDL
+
+def make_bot(request=None):
+    """ExtBot روی Telegram جعلی با زمان‌بند ارسال واقعی (sender.OutboundLimiter)"""
+    from telegram.ext import ExtBot
+    return ExtBot(os.environ["TOKEN"], request=request or FakeTelegram(0, 0, 0, 0),
+                  get_updates_request=FakeTelegram(0, 0, 0, 0), rate_limiter=sender.OutboundLimiter())
+
+def reset_downloader():
+    """
+    وضعیت سطح ماژول downloader برای event loop تازه‌ی هر asyncio.run
+    (Condition/Queue به اولین loop بسته می‌شوند و stop_workers executor ها را خاموش می‌کند)
+    """
+    downloader._queue_cond = asyncio.Condition()
+    downloader._upload_queue = asyncio.Queue(maxsize=config.UPLOAD_QUEUE_SIZE)
+    downloader._transcode_queue = asyncio.Queue(maxsize=config.TRANSCODE_QUEUE_SIZE)
+    downloader._executor = ThreadPoolExecutor(max_workers=config.DOWNLOAD_WORKERS, thread_name_prefix="ytdlp")
+    downloader._probe_executor = ThreadPoolExecutor(max_workers=config.PROBE_WORKERS, thread_name_prefix="probe")
+    for state in (downloader._running, downloader._active_jobs, downloader._job_ctrl, downloader._batches,
+                  downloader._transcoding, downloader._inflight, downloader._job_flight, scheduler._user_queues,
+                  scheduler._deficit, sender._status):
+        state.clear()
+    downloader._cancelled_running.clear()
+    scheduler._ring.clear()
+    downloader._worker_tasks.clear()
+    downloader.cancel_stats.update(count=0, total_sec=0.0, max_sec=0.0)
+    transcode._slots = None
+
+class Pipeline:
+    """worker های واقعی downloader با yt-dlp جعلی و Bot روی Telegram جعلی"""
+
+    def __init__(self):
+        self.events = []
+        self.bot = None
+
+    async def start(self, workers: int = config.DOWNLOAD_WORKERS):
+        reset_downloader()
+        self.events = []
+        request = FakeTelegram(0, 0, 0, 0)
+        request.on_event = lambda chat_id, method, params, result: self.events.append((chat_id, method, params))
+        self.bot = make_bot(request)
+        await self.bot.initialize()
+        downloader.start_workers(SimpleNamespace(bot=self.bot), workers)
+
+    async def stop(self):
+        await downloader.stop_workers()
+        await self.bot.shutdown()
+
+    def uploads(self) -> list:
+        return [e for e in self.events if e[1] in MEDIA_METHODS]
+
+    async def wait_for(self, predicate, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise AssertionError("timed out waiting for the pipeline")
+            await asyncio.sleep(0.02)
+
+@pytest.fixture
+def pipeline(fresh_db, fake_ytdl, monkeypatch):
+    # لینک‌های تست پلتفرم "other" دارند؛ سقف همزمانی پلتفرم مانع مقایسه‌ی تعداد worker ها نشود
+    monkeypatch.setattr(downloader, "DEFAULT_PLATFORM_CONCURRENCY", 16)
+    monkeypatch.setattr(workspace, "WORKSPACE_MIN_FREE_MB", 0)
+    return Pipeline()
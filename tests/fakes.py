@@ -0,0 +1,144 @@
+# tests/fakes.py
+"""
+yt-dlp و Telegram جعلی (بدون شبکه) برای تست‌ها و bench_load.py
+- FakeYoutubeDL: با تأخیر قابل تنظیم فایل واقعی با حجم داده‌شده در پوشه‌ی job می‌نویسد
+  (progress hook ها و لغو مثل yt-dlp واقعی کار می‌کنند)
+- FakeTelegram: یک BaseRequest که هر فراخوانی Bot API را ثبت می‌کند، تأخیر رفت‌وبرگشت و سرعت آپلود
+  را شبیه‌سازی می‌کند و (اختیاری) بخشی از ارسال‌ها را با 429 / retry_after رد می‌کند
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import itertools
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+MB = 1024 * 1024
+MEDIA_METHODS = frozenset({"sendVideo", "sendAudio", "sendDocument"})
+REPLY_METHODS = frozenset({"sendMessage", "editMessageText"})
+
+# ---------------- yt-dlp جعلی ----------------
+class FakeYoutubeDL:
+    """فقط همان بخشی از API که probe.py و ytdl_pool (instance گرم) استفاده می‌کنند"""
+    delay = 1.0
+    probe_delay = 0.05
+    size = 2 * MB
+    steps = 10
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self._ies = {}
+        self._progress_hooks = list(self.params.get("progress_hooks", []))
+        self._postprocessor_hooks = list(self.params.get("postprocessor_hooks", []))
+        self._parse_outtmpl()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _parse_outtmpl(self):
+        if isinstance(self.params.get("outtmpl"), str):
+            self.params["outtmpl"] = {"default": self.params["outtmpl"]}
+
+    @staticmethod
+    def title_for(url: str) -> str:
+        """عنوان (و caption ارسال) فایل این لینک"""
+        return f"bench {hashlib.md5(url.encode()).hexdigest()[:11]}"
+
+    def build_format_selector(self, spec):
+        return spec
+
+    def close(self):
+        pass
+
+    def extract_info(self, url, download=True, ie_key=None):
+        vid = hashlib.md5(url.encode()).hexdigest()[:11]
+        # حجم هر لینک ثابت است (لینک‌های تکراری همان فایل را می‌دهند)
+        size = int(self.size * random.Random(vid).uniform(0.5, 1.5))
+        info = {"id": vid, "title": self.title_for(url), "extractor": "bench", "extractor_key": "Bench",
+                "duration": 60, "ext": "mp4", "filesize": size, "webpage_url": url}
+        if not download:
+            time.sleep(self.probe_delay)
+            return info
+        path = self.params["outtmpl"]["default"] % {"id": vid, "ext": "mp4", "title": vid}
+        hooks = self._progress_hooks
+        chunk = size // self.steps
+        with open(path, "wb") as f:
+            for i in range(self.steps):
+                time.sleep(self.delay / self.steps)
+                f.write(b"\0" * chunk)
+                d = {"status": "downloading", "downloaded_bytes": (i + 1) * chunk, "total_bytes": size,
+                     "filename": path}
+                for hook in hooks:
+                    hook(d)  # DownloadCancelled از hook لغو
+        info["requested_downloads"] = [{"filepath": path}]
+        return info
+
+# ---------------- Telegram جعلی ----------------
+class FakeTelegram(BaseRequest):
+    """جواب همه‌ی متدهای Bot API؛ on_event(chat_id, method, params, result) برای هر ارسال موفق"""
+    def __init__(self, latency: float, upload_bps: float, retry_rate: float, seed: int):
+        self.latency = latency
+        self.upload_bps = upload_bps
+        self.retry_rate = retry_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.retried = 0
+        self.upload_bytes = 0
+        self.ids = itertools.count(1)
+        self.on_event = None
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        files = (request_data.multipart_data or {}) if request_data else {}
+        size = sum(len(part[1]) for part in files.values())
+        delay = self.latency + (size / self.upload_bps if self.upload_bps else 0)
+        await asyncio.sleep(delay)
+        if self.retry_rate and (name in MEDIA_METHODS or name in REPLY_METHODS) and self.rng.random() < self.retry_rate:
+            self.retried += 1
+            body = {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}}
+            return 429, json.dumps(body).encode()
+        self.calls[name] += 1
+        self.upload_bytes += size
+        result = self._result(name, params)
+        if self.on_event is not None and params.get("chat_id") is not None:
+            self.on_event(int(params["chat_id"]), name, params, result)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def _result(self, name, params):
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if name not in MEDIA_METHODS and name not in REPLY_METHODS:
+            return True
+        n = next(self.ids)
+        msg = {"message_id": int(params.get("message_id") or n), "date": int(time.time()),
+               "chat": {"id": int(params["chat_id"]), "type": "private"},
+               "text": params.get("text") or params.get("caption") or ""}
+        media = {"file_id": f"bench-file-{n}", "file_unique_id": f"bench-{n}"}
+        if name == "sendVideo":
+            msg["video"] = {**media, "width": 1280, "height": 720, "duration": 60}
+        elif name == "sendAudio":
+            msg["audio"] = {**media, "duration": 60}
+        elif name == "sendDocument":
+            msg["document"] = media
+        return msg
@@ -0,0 +1,169 @@
+# tests/test_bot.py
+"""
+راه‌اندازی Application:
+- سرور Bot API محلی: آپلود فقط با مسیر file:// به سرور stub می‌رسد، نه multipart
+- webhook: update با secret درست به update_queue می‌رسد و بقیه با 403 رد می‌شوند
+"""
+import json
+import socket
+import asyncio
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import bot
+import config
+import downloader
+from conftest import FakeTelegram
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class StubBotAPI(ThreadingHTTPServer):
+    """سرور Bot API محلی جعلی: getMe و sendDocument؛ requests = [(method, content-type, params)]"""
+
+    def __init__(self):
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(handler):
+                method = handler.path.rsplit("/", 1)[-1]
+                ctype = handler.headers.get("Content-Type", "")
+                body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+                if ctype.startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                elif ctype.startswith("application/x-www-form-urlencoded"):
+                    params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                else:
+                    params = {"_raw": body}
+                self.requests.append((method, ctype, params))
+                if method == "getMe":
+                    result = {"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+                else:
+                    result = {"message_id": 1, "date": 0, "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                              "document": {"file_id": "local-1", "file_unique_id": "l1"}}
+                out = json.dumps({"ok": True, "result": result}).encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/json")
+                handler.send_header("Content-Length", str(len(out)))
+                handler.end_headers()
+                handler.wfile.write(out)
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+def test_local_bot_api_uploads_by_path(tmp_path, monkeypatch):
+    server = StubBotAPI()
+    monkeypatch.setattr(config, "LOCAL_BOT_API", True)
+    monkeypatch.setattr(config, "LOCAL_BOT_API_URL", server.url)
+    monkeypatch.setattr(downloader, "LOCAL_BOT_API", True)
+    monkeypatch.setattr(bot, "_update_queue", bot._StampedQueue())
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"\0" * 4096)
+
+    async def run():
+        app = bot.build_application()
+        await app.bot.initialize()
+        try:
+            msg = await downloader._upload(app.bot, 42, str(path), "title", as_document=True)
+        finally:
+            await app.bot.shutdown()
+        return msg
+    try:
+        msg = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert msg.document.file_id == "local-1"
+    methods = [r[0] for r in server.requests]
+    assert methods == ["getMe", "sendDocument"]
+    _method, ctype, params = server.requests[1]
+    # فقط مسیر؛ سرور محلی خودش فایل را از دیسک می‌خواند
+    assert not ctype.startswith("multipart/")
+    assert params["document"] == path.resolve().as_uri()
+    assert params["caption"] == "title"
+
+def _post(url: str, body: dict, secret: str = None) -> int:
+    headers = {"Content-Type": "application/json"}
+    if secret is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    req = urllib.request.Request(url, data=json.dumps(body).encode(), headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def _update(update_id: int) -> dict:
+    return {"update_id": update_id,
+            "message": {"message_id": 1, "date": 0, "text": "hi", "chat": {"id": 5, "type": "private"},
+                        "from": {"id": 5, "is_bot": False, "first_name": "u"}}}
+
+def test_webhook_accepts_only_the_secret_token(monkeypatch):
+    monkeypatch.setattr(bot, "_update_queue", bot._StampedQueue())
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/{config.WEBHOOK_PATH}"
+    secret = bot._webhook_secret()
+
+    async def run():
+        app = bot.build_application(request=FakeTelegram(0, 0, 0, 0), get_updates_request=FakeTelegram(0, 0, 0, 0))
+        await app.initialize()
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path=config.WEBHOOK_PATH,
+                                        webhook_url=f"https://example.com/{config.WEBHOOK_PATH}",
+                                        secret_token=secret)
+        try:
+            statuses = {
+                "wrong": await asyncio.to_thread(_post, url, _update(1), "not-the-secret"),
+                "missing": await asyncio.to_thread(_post, url, _update(2)),
+            }
+            rejected_queue = app.update_queue.qsize()
+            statuses["ok"] = await asyncio.to_thread(_post, url, _update(3), secret)
+            update = await asyncio.wait_for(app.update_queue.get(), timeout=5)
+        finally:
+            await app.updater.stop()
+            await app.shutdown()
+        return statuses, rejected_queue, update
+    statuses, rejected_queue, update = asyncio.run(run())
+
+    assert statuses == {"wrong": 403, "missing": 403, "ok": 200}
+    assert rejected_queue == 0
+    assert update.update_id == 3 and update.message.text == "hi"
+    # زمان رسیدن برای update_latency ثبت شده
+    assert 3 in bot._update_queue.stamps
+
+def test_webhook_secret_is_stable_and_overridable(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_SECRET", "")
+    derived = bot._webhook_secret()
+    assert derived == bot._webhook_secret() and len(derived) == 48
+    assert bot.TOKEN not in derived
+    monkeypatch.setattr(config, "WEBHOOK_SECRET", "custom-secret")
+    assert bot._webhook_secret() == "custom-secret"
+
+@pytest.mark.parametrize("mode, url, tornado, expected", [
+    ("polling", "https://example.com", True, "polling"),
+    ("webhook", "", True, "polling"),
+    ("webhook", "https://example.com", False, "polling"),
+    ("webhook", "https://example.com", True, "webhook"),
+])
+def test_update_mode_falls_back_to_polling(monkeypatch, mode, url, tornado, expected):
+    monkeypatch.setattr(config, "UPDATE_MODE", mode)
+    monkeypatch.setattr(config, "WEBHOOK_URL", url)
+    if not tornado:
+        find_spec = bot.importlib.util.find_spec
+        monkeypatch.setattr(bot.importlib.util, "find_spec",
+                            lambda name, *a: None if name == "tornado" else find_spec(name, *a))
+    assert bot._update_mode() == expected
@@ -0,0 +1,66 @@
+# tests/test_cache.py
+"""cache hit: file_id قبلی همان موقع ثبت لینک فرستاده می‌شود، بدون صف و worker"""
+import time
+import asyncio
+import sqlite3
+
+from telegram.error import Forbidden
+
+import database as db
+import downloader
+import workspace
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def _cache(url: str):
+    cache_key = downloader._cache_key(url, downloader._is_audio_url(url))
+    return db.save_cached_media(cache_key, "cached-file-1", "video", "cached title", 1024)
+
+def _states(path) -> dict:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT user_id, state FROM jobs"))
+
+def test_cache_hit_is_sent_while_workers_are_busy(pipeline, fake_ytdl, fresh_db):
+    fake_ytdl.delay = 5
+    fake_ytdl.steps = 50
+
+    async def run():
+        await pipeline.start(workers=1)
+        await _cache(URL)
+        # تنها worker مشغول دانلود طولانی است
+        await downloader.enqueue_downloads(1, 1, ["https://example.com/busy/1"])
+        await pipeline.wait_for(lambda: downloader._job_ctrl)
+        started = time.monotonic()
+        job_ids, batch_id, reason = await downloader.enqueue_downloads(2, 2, [URL])
+        elapsed = time.monotonic() - started
+        count = await db.get_daily_download_count(2)
+        await pipeline.stop()
+        # thread دانلود لغوشده در اولین hook برمی‌گردد و پوشه‌اش پاک می‌شود
+        await pipeline.wait_for(lambda: not workspace._workspaces, timeout=2)
+        return job_ids, batch_id, reason, elapsed, count
+    job_ids, batch_id, reason, elapsed, count = asyncio.run(run())
+
+    # در صف نرفت؛ bot پیام «در صف» نمی‌فرستد
+    assert (job_ids, batch_id, reason) == ([], None, None)
+    assert elapsed < 1.0, elapsed
+    assert [(e[0], e[2]["video"]) for e in pipeline.uploads()] == [(2, "cached-file-1")]
+    assert count == 1
+    assert _states(fresh_db)[2] == "done"
+
+def test_cache_hit_send_error_fails_the_job(pipeline, fresh_db, monkeypatch):
+    async def blocked(*args, **kwargs):
+        raise Forbidden("bot was blocked by the user")
+    monkeypatch.setattr(downloader, "_send_cached", blocked)
+
+    async def run():
+        await pipeline.start()
+        await _cache(URL)
+        job_ids, _b, _r = await downloader.enqueue_downloads(3, 3, [URL])
+        count = await db.get_daily_download_count(3)
+        await pipeline.stop()
+        return job_ids, count
+    job_ids, count = asyncio.run(run())
+
+    assert job_ids == [] and count == 0
+    assert _states(fresh_db)[3] == "failed"
+    assert downloader.pending_count() == 0 and not downloader._active_jobs
@@ -0,0 +1,54 @@
+# tests/test_cancel.py
+"""لغو دانلود در حال اجرا: worker فوراً آزاد و پوشه‌ی job پاک می‌شود"""
+import os
+import asyncio
+import sqlite3
+
+import downloader
+
+# سقف فاصله‌ی لغو تا آزاد شدن worker
+MAX_CANCEL_SEC = 0.5
+
+def test_cancel_mid_download_frees_worker_and_tmpdir(pipeline, fake_ytdl, fresh_db):
+    fake_ytdl.delay = 10
+    fake_ytdl.steps = 200
+
+    async def run():
+        await pipeline.start()
+        job_ids, _batch, _reason = await downloader.enqueue_downloads(7, 7, ["https://example.com/cancel/1"])
+        job_id = job_ids[0]
+        await pipeline.wait_for(lambda: job_id in downloader._job_ctrl)
+        tmpdir = downloader._job_ctrl[job_id]["tmpdir"]
+        # دانلود واقعاً شروع شده (فایل در پوشه‌ی job)
+        await pipeline.wait_for(lambda: any(not f.startswith(".") for f in os.listdir(tmpdir)))
+        assert await downloader.cancel_job(job_id, 7)
+        await pipeline.wait_for(lambda: job_id not in downloader._active_jobs, timeout=MAX_CANCEL_SEC * 4)
+        # thread دانلود در اولین progress hook متوقف می‌شود و بعد پوشه پاک می‌شود
+        await pipeline.wait_for(lambda: not os.path.exists(tmpdir), timeout=2)
+        await pipeline.stop()
+        return job_id
+    job_id = asyncio.run(run())
+
+    assert downloader.cancel_stats["count"] == 1
+    assert downloader.cancel_stats["max_sec"] < MAX_CANCEL_SEC, downloader.cancel_stats
+    assert pipeline.uploads() == []
+    assert any(e[1] == "sendMessage" and e[2].get("text", "").startswith("🚫") for e in pipeline.events)
+    with sqlite3.connect(fresh_db) as conn:
+        assert conn.execute("SELECT state FROM jobs WHERE id=?", (job_id,)).fetchone()[0] == "cancelled"
+
+def test_cancel_queued_job_never_downloads(pipeline, fake_ytdl):
+    fake_ytdl.delay = 1
+
+    async def run():
+        # یک worker: job دوم در صف می‌ماند
+        await pipeline.start(workers=1)
+        first, _b, _r = await downloader.enqueue_downloads(8, 8, ["https://example.com/cancel/2"])
+        second, _b, _r = await downloader.enqueue_downloads(9, 9, ["https://example.com/cancel/3"])
+        await pipeline.wait_for(lambda: first[0] in downloader._job_ctrl)
+        assert await downloader.cancel_job(second[0], 9)
+        assert downloader.pending_count() == 0
+        await pipeline.wait_for(lambda: len(pipeline.uploads()) == 1)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        await pipeline.stop()
+    asyncio.run(run())
+    assert [e[0] for e in pipeline.uploads()] == [8]
@@ -0,0 +1,53 @@
+# tests/test_database.py
+"""write-behind دانلودها: flush ناموفق ردیف‌ها را نگه می‌دارد، نیمه‌کاره commit نمی‌کند و خواندن‌ها را خراب نمی‌کند"""
+import asyncio
+import sqlite3
+
+import pytest
+
+import database as db
+
+def _count(path, table) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_failed_flush_rolls_back_and_keeps_rows(fresh_db):
+    async def run():
+        for i in range(3):
+            await db.save_download(1, "youtube", f"https://example.com/{i}", f"t{i}", 100)
+        # insert دوم (daily_counts) خطا می‌دهد، بعد از اینکه insert downloads اجرا شده
+        with sqlite3.connect(fresh_db) as conn:
+            conn.execute("ALTER TABLE daily_counts RENAME TO daily_counts_off")
+        with pytest.raises(sqlite3.OperationalError):
+            await db.flush_downloads()
+        assert [r[2] for r in db._download_buffer] == [f"https://example.com/{i}" for i in range(3)]
+        assert _count(fresh_db, "downloads") == 0
+        with sqlite3.connect(fresh_db) as conn:
+            conn.execute("ALTER TABLE daily_counts_off RENAME TO daily_counts")
+        assert await db.flush_downloads() == 3
+    asyncio.run(run())
+    assert not db._download_buffer
+    assert _count(fresh_db, "downloads") == 3
+    with sqlite3.connect(fresh_db) as conn:
+        assert conn.execute("SELECT SUM(count) FROM daily_counts WHERE user_id=1").fetchone()[0] == 3
+
+def test_reads_and_quota_survive_a_failing_flush(fresh_db):
+    async def run():
+        with sqlite3.connect(fresh_db) as conn:
+            conn.execute("CREATE TRIGGER disk_full BEFORE INSERT ON downloads BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        for i in range(2):
+            await db.save_download(1, "youtube", f"https://example.com/{i}", f"t{i}", 100)
+        with pytest.raises(sqlite3.IntegrityError):
+            await db.flush_downloads()
+        # دانلودهای بافر در سهمیه حساب می‌شوند، بدون flush
+        assert await db.get_daily_download_count(1) == 2
+        assert (await db.get_user_profile(1))["daily_count"] == 2
+        assert await db.create_jobs(1, [(f"j{i}", 1, "https://example.com/x", "youtube", 1) for i in range(3)], 3) == 1
+        assert await db.get_user_stats(1) == (0, 0)
+        assert await db.get_user_downloads(1) == []
+        with sqlite3.connect(fresh_db) as conn:
+            conn.execute("DROP TRIGGER disk_full")
+        assert await db.flush_downloads() == 2
+        assert await db.get_daily_download_count(1) == 2
+        assert await db.get_user_stats(1) == (2, 200)
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+# tests/test_probe.py
+"""انتخاب فرمت probe: format_id های انتخاب‌شده با فرمت پروفایل به عنوان fallback"""
+import probe
+
+MB = 1024 * 1024
+
+INFO = {
+    "duration": 60,
+    "formats": [
+        {"format_id": "140", "vcodec": "none", "acodec": "mp4a", "abr": 128, "filesize": 1 * MB},
+        {"format_id": "137", "vcodec": "avc1", "acodec": "none", "height": 1080, "tbr": 4000, "filesize": 30 * MB},
+        {"format_id": "136", "vcodec": "avc1", "acodec": "none", "height": 720, "tbr": 2000, "filesize": 15 * MB},
+    ],
+}
+
+def test_selected_ids_get_the_fallback_appended():
+    spec, size = probe.select_format(INFO, False, 20 * MB, max_height=1080, fallback="best")
+    assert spec == "136+140/best"
+    assert size == 16 * MB
+    spec, _size = probe.select_format(INFO, True, 20 * MB, fallback="bestaudio/best")
+    assert spec == "140/bestaudio/best"
+
+def test_reject_and_unknown_sizes_are_unchanged():
+    assert probe.select_format(INFO, False, 1 * MB, fallback="best") == (None, None)
+    # حجم نامعلوم: "" یعنی خود فرمت پروفایل، بدون fallback تکراری
+    assert probe.select_format({"formats": [{"format_id": "x"}]}, False, MB, fallback="best") == ("", None)
+
+def test_exact_limit_fits_for_every_format_type():
+    info = {"formats": [
+        {"format_id": "a", "vcodec": "none", "acodec": "mp4a", "abr": 128, "filesize": 2 * MB},
+        {"format_id": "v", "vcodec": "avc1", "acodec": "none", "height": 720, "tbr": 2000, "filesize": 8 * MB},
+        {"format_id": "p", "vcodec": "avc1", "acodec": "mp4a", "height": 360, "tbr": 800, "filesize": 5 * MB},
+    ]}
+    # سقف دقیقاً برابر حجم: هم progressive و هم video+audio پذیرفته می‌شوند
+    assert probe.select_format(info, False, 5 * MB) == ("p", 5 * MB)
+    assert probe.select_format(info, False, 10 * MB) == ("v+a", 10 * MB)
@@ -0,0 +1,135 @@
+# tests/test_sender.py
+"""
+زمان‌بند ارسال روی Bot با Telegram جعلی: bucket هر chat و سراسری، RetryAfter،
+ترتیب اولویت و ادغام ویرایش‌های پیام وضعیت.
+"""
+import json
+import time
+import asyncio
+
+import sender
+from conftest import FakeTelegram, make_bot
+
+class Recorder(FakeTelegram):
+    """(زمان، chat_id، متد، متن) هر ارسال موفق؛ retry_after: chat_id -> ثانیه برای اولین sendMessage"""
+
+    def __init__(self, retry_after: dict = None):
+        super().__init__(0, 0, 0, 0)
+        self.sent = []
+        self.retry_after = dict(retry_after or {})
+        self.on_event = lambda chat_id, method, params, result: self.sent.append(
+            (time.monotonic(), chat_id, method, params.get("text")))
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        params = request_data.parameters if request_data else {}
+        seconds = self.retry_after.pop(params.get("chat_id"), None)
+        if seconds is not None and url.endswith("/sendMessage"):
+            body = {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {seconds}",
+                    "parameters": {"retry_after": seconds}}
+            return 429, json.dumps(body).encode()
+        return await super().do_request(url, method, request_data, **kwargs)
+
+def _limits(monkeypatch, chat_rate=100, chat_burst=100, global_rate=1000, global_burst=1000):
+    # OutboundLimiter نرخ‌ها را موقع ساخته شدن از sender می‌خواند
+    monkeypatch.setattr(sender, "SEND_CHAT_RATE", chat_rate)
+    monkeypatch.setattr(sender, "SEND_CHAT_BURST", chat_burst)
+    monkeypatch.setattr(sender, "SEND_GLOBAL_RATE", global_rate)
+    monkeypatch.setattr(sender, "SEND_GLOBAL_BURST", global_burst)
+
+async def _with_bot(request, fn):
+    bot = make_bot(request)
+    await bot.initialize()
+    try:
+        return await fn(bot)
+    finally:
+        await bot.shutdown()
+
+def test_per_chat_bucket_does_not_hold_other_chats(monkeypatch):
+    _limits(monkeypatch, chat_rate=10, chat_burst=2)
+    request = Recorder()
+
+    async def run(bot):
+        started = time.monotonic()
+        busy = [asyncio.create_task(bot.send_message(1, f"m{i}")) for i in range(6)]
+        await asyncio.sleep(0.05)
+        await bot.send_message(2, "other")
+        other = time.monotonic() - started
+        await asyncio.gather(*busy)
+        return other, time.monotonic() - started
+    other, total = asyncio.run(_with_bot(request, run))
+
+    # burst 2، بعد هر 0.1 ثانیه یکی
+    assert total >= 0.35, total
+    assert other < 0.15, other
+    assert [s[3] for s in request.sent if s[1] == 1] == [f"m{i}" for i in range(6)]
+
+def test_global_bucket_spans_chats(monkeypatch):
+    _limits(monkeypatch, global_rate=20, global_burst=2)
+    request = Recorder()
+
+    async def run(bot):
+        started = time.monotonic()
+        await asyncio.gather(*(bot.send_message(100 + i, "hi") for i in range(6)))
+        return time.monotonic() - started
+    total = asyncio.run(_with_bot(request, run))
+
+    assert total >= 0.18, total
+    assert len(request.sent) == 6
+
+def test_retry_after_blocks_only_that_chat_and_resends(monkeypatch):
+    _limits(monkeypatch)
+    request = Recorder(retry_after={1: 1})
+    before = sender.send_stats["retry_after"]
+
+    async def run(bot):
+        started = time.monotonic()
+        flooded = asyncio.create_task(bot.send_message(1, "flooded"))
+        await asyncio.sleep(0.05)
+        await bot.send_message(2, "free")
+        free = time.monotonic() - started
+        await flooded
+        return free, time.monotonic() - started
+    free, total = asyncio.run(_with_bot(request, run))
+
+    assert free < 0.5, free
+    assert total >= 1.0, total
+    assert sender.send_stats["retry_after"] == before + 1
+    assert [(s[1], s[3]) for s in request.sent] == [(2, "free"), (1, "flooded")]
+
+def test_priority_order_when_tokens_are_scarce(monkeypatch):
+    _limits(monkeypatch, global_rate=10, global_burst=1)
+    request = Recorder()
+
+    async def run(bot):
+        await bot.send_message(10, "first")
+        # bucket سراسری خالی است؛ هر سه منتظر می‌مانند و به ترتیب اولویت فرستاده می‌شوند
+        tasks = [asyncio.create_task(bot.send_message(20, "upload", rate_limit_args=sender.PRIORITY_UPLOAD)),
+                 asyncio.create_task(bot.send_message(21, "status", rate_limit_args=sender.PRIORITY_STATUS)),
+                 asyncio.create_task(bot.send_message(22, "interactive"))]
+        await asyncio.gather(*tasks)
+    asyncio.run(_with_bot(request, run))
+
+    assert [s[3] for s in request.sent] == ["first", "interactive", "status", "upload"]
+
+def test_edit_status_coalesces_and_forgets_the_message(monkeypatch):
+    _limits(monkeypatch)
+    monkeypatch.setattr(sender, "STATUS_EDIT_INTERVAL_SEC", 0.2)
+    sender._status.clear()
+    request = Recorder()
+
+    async def run(bot):
+        msg = await bot.send_message(5, "0%")
+        for i in range(1, 21):
+            sender.edit_status(msg, f"{i * 5}%")
+            await asyncio.sleep(0.02)
+        deadline = time.monotonic() + 2
+        while sender._status and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+    asyncio.run(_with_bot(request, run))
+
+    edits = [s for s in request.sent if s[2] == "editMessageText"]
+    # 20 متن در ~0.4 ثانیه -> حداکثر یک ویرایش در هر 0.2 ثانیه
+    assert 2 <= len(edits) <= 4, edits
+    assert edits[-1][3] == "100%"
+    assert all(b[0] - a[0] >= 0.18 for a, b in zip(edits, edits[1:]))
+    assert not sender._status
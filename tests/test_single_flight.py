@@ -0,0 +1,61 @@
+# tests/test_single_flight.py
+"""دانلود مشترک: گیرنده‌های یک flight با file_id سرویس می‌گیرند و lease sweeper دوباره صفشان نمی‌کند"""
+import asyncio
+import sqlite3
+
+import database as db
+import downloader
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def _states(path) -> dict:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT user_id, state FROM jobs"))
+
+def test_attached_job_is_not_requeued_and_gets_the_shared_file(pipeline, fake_ytdl, fresh_db):
+    fake_ytdl.delay = 1.0
+
+    async def run():
+        await pipeline.start()
+        await downloader.enqueue_downloads(1, 1, [URL])
+        await pipeline.wait_for(lambda: downloader._inflight)
+        # همان رسانه با لینک دیگر، وقتی دانلود اول در جریان است
+        await downloader.enqueue_downloads(2, 2, [URL + "&t=42"])
+        assert _states(fresh_db)[2] == "attached"
+        # lease منقضی (مثل وقتی JOB_LEASE_SEC گذشته باشد): attached نباید دوباره در صف برود
+        with sqlite3.connect(fresh_db) as conn:
+            conn.execute("UPDATE jobs SET lease_until=0 WHERE user_id=2")
+        requeued, _failed = await db.recover_jobs(only_expired=True)
+        assert requeued == []
+        await pipeline.wait_for(lambda: len(pipeline.uploads()) == 2)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        await pipeline.stop()
+    asyncio.run(run())
+
+    uploads = pipeline.uploads()
+    # یک آپلود واقعی؛ گیرنده‌ی دوم همان file_id را گرفت
+    assert [e[0] for e in uploads] == [1, 2]
+    assert isinstance(uploads[1][2]["video"], str) and uploads[1][2]["video"].startswith("bench-file-")
+    assert _states(fresh_db) == {1: "done", 2: "done"}
+
+def test_upload_serves_its_own_flight_after_the_key_is_reused(pipeline, fresh_db, tmp_path):
+    key = downloader._cache_key(URL, downloader._is_audio_url(URL))
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"\0" * 1024)
+
+    async def run():
+        await pipeline.start()
+        owner = {"id": "owner", "user_id": 4, "chat_id": 4, "url": URL, "platform": "youtube"}
+        downloader._start_flight(key, owner)
+        # owner (در صف آپلود) لغو شد و job تازه‌ای برای همان رسانه flight خودش را گرفت و تمام کرد
+        newer = {"id": "newer", "user_id": 5, "chat_id": 5, "url": URL, "platform": "youtube"}
+        downloader._start_flight(key, newer)
+        downloader._end_flight(newer.pop("flight"))
+        upload = {"item": owner, "cache_key": key, "served": set(), "status_msg": None, "path": str(path),
+                  "size": 1024, "is_audio": False, "title": "t", "platform": "youtube"}
+        await downloader._upload_job(pipeline.bot, upload)
+        await pipeline.stop()
+    asyncio.run(run())
+
+    assert [e[0] for e in pipeline.uploads()] == [4]
+    assert not downloader._inflight and not downloader._job_flight
@@ -0,0 +1,50 @@
+# tests/test_transcode_stage.py
+"""
+مرحله‌ی transcode: ffmpeg بین دانلود و آپلود در صف خودش اجرا می‌شود،
+پس worker دانلود و اسلات پلتفرم در مدت فشرده‌سازی آزادند و ترتیب batch حفظ می‌شود.
+"""
+import time
+import asyncio
+import hashlib
+
+import downloader
+import transcode
+
+TRANSCODE_SEC = 1.0
+
+def _title(url: str) -> str:
+    return f"bench {hashlib.md5(url.encode()).hexdigest()[:11]}"
+
+def test_downloads_continue_while_a_file_is_transcoding(pipeline, fake_ytdl, monkeypatch):
+    fake_ytdl.delay = 0.1
+    monkeypatch.setattr(downloader, "TRANSCODE_ENABLED", True)
+    monkeypatch.setattr(downloader, "TRANSCODE_WORKERS", 1)
+    runs = []
+
+    async def fake_process(path, info, is_audio, limit):
+        runs.append({"start": time.monotonic(), "downloaded": downloader.stage_stats["download"]["count"],
+                     "running": sum(downloader._running.values())})
+        await asyncio.sleep(TRANSCODE_SEC)
+        runs[-1]["end_downloaded"] = downloader.stage_stats["download"]["count"]
+        return path
+    monkeypatch.setattr(transcode, "process", fake_process)
+    urls = [f"https://example.com/tc/{i}" for i in range(4)]
+
+    async def run():
+        await pipeline.start(workers=2)
+        await downloader.enqueue_downloads(3, 3, urls, registered=True)
+        await pipeline.wait_for(lambda: len(pipeline.uploads()) == 4)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        await pipeline.stop()
+    before = downloader.stage_stats["download"]["count"]
+    asyncio.run(run())
+
+    assert len(runs) == 4
+    # فشرده‌سازی‌ها پشت سر هم (یک worker)، ولی دانلودها در همان مدت جلو رفته‌اند:
+    # تا پایان اولین transcode، دو دانلود بعدی هم در صف transcode هستند
+    assert runs[0]["end_downloaded"] - before >= 3, runs
+    # worker دانلود اسلات پلتفرم را در مدت transcode نگه نمی‌دارد
+    assert runs[-1]["running"] == 0, runs
+    assert all(b["start"] >= a["start"] + TRANSCODE_SEC * 0.9 for a, b in zip(runs, runs[1:]))
+    assert [e[2]["caption"] for e in pipeline.uploads()] == [_title(u) for u in urls]
+    assert downloader.stage_stats["transcode"]["count"] >= 4
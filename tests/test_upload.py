@@ -0,0 +1,29 @@
+# tests/test_upload.py
+"""مرحله‌ی آپلود: ارسال ناموفق به کاربر خبر داده می‌شود و در سهمیه‌ی روزانه حساب نمی‌شود"""
+import asyncio
+import sqlite3
+
+import database as db
+import downloader
+
+def test_failed_upload_notifies_and_is_not_counted(pipeline, fresh_db, monkeypatch):
+    async def failing_upload(*args, **kwargs):
+        raise OSError("connection reset")
+    monkeypatch.setattr(downloader, "_upload", failing_upload)
+
+    async def run():
+        await pipeline.start()
+        job_ids, _b, _r = await downloader.enqueue_downloads(3, 3, ["https://example.com/upload/1"])
+        await pipeline.wait_for(lambda: any(e[2].get("text", "").startswith("❌") for e in pipeline.events), timeout=5)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        count = await db.get_daily_download_count(3)
+        await pipeline.stop()
+        return job_ids[0], count
+    job_id, count = asyncio.run(run())
+
+    assert count == 0
+    texts = [e[2].get("text", "") for e in pipeline.events if e[1] == "sendMessage"]
+    assert any(t.startswith("❌") and "connection reset" in t for t in texts), texts
+    with sqlite3.connect(fresh_db) as conn:
+        state, error = conn.execute("SELECT state, error FROM jobs WHERE id=?", (job_id,)).fetchone()
+    assert state == "failed" and "connection reset" in error
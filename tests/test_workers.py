@@ -0,0 +1,111 @@
+# tests/test_workers.py
+"""worker pool دانلود: مقیاس throughput با تعداد worker و خاموش شدن تمیز"""
+import os
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import database as db
+import downloader
+import workspace
+import ytdl_pool
+
+JOBS = 8
+DELAY = 0.4
+
+def _job_states(path) -> list:
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT state FROM jobs")]
+
+async def _run_jobs(pipeline, workers: int) -> float:
+    await pipeline.start(workers)
+    started = time.monotonic()
+    for i in range(JOBS):
+        uid = 1000 * workers + i
+        await downloader.enqueue_downloads(uid, uid, [f"https://example.com/w{workers}/{i}"])
+    await pipeline.wait_for(lambda: len(pipeline.uploads()) == JOBS)
+    elapsed = time.monotonic() - started
+    await pipeline.stop()
+    return elapsed
+
+def test_throughput_scales_with_workers(pipeline, fake_ytdl):
+    fake_ytdl.delay = DELAY
+    workers = config.DOWNLOAD_WORKERS
+    serial = asyncio.run(_run_jobs(pipeline, 1))
+    parallel = asyncio.run(_run_jobs(pipeline, workers))
+    assert serial >= JOBS * DELAY
+    # حدود 1/N زمان سریال (سربار probe و آپلود جعلی کم است)
+    assert parallel < serial / workers * 1.6, (serial, parallel)
+
+def test_stop_workers_after_idle_drains(pipeline, fresh_db):
+    async def run():
+        await pipeline.start()
+        for i in range(3):
+            await downloader.enqueue_downloads(50 + i, 50 + i, [f"https://example.com/idle/{i}"])
+        await pipeline.wait_for(lambda: len(pipeline.uploads()) == 3)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        await pipeline.stop()
+        assert not downloader._worker_tasks
+        assert not downloader._job_ctrl
+        assert not workspace._workspaces
+        assert os.listdir(config.DOWNLOAD_FOLDER) == []
+        left = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        assert not left, left
+    asyncio.run(run())
+    assert _job_states(fresh_db) == ["done"] * 3
+
+def test_stop_workers_mid_download_leaves_jobs_recoverable(pipeline, fake_ytdl, fresh_db):
+    fake_ytdl.delay = 5
+    fake_ytdl.steps = 50
+
+    async def run():
+        await pipeline.start()
+        for i in range(3):
+            await downloader.enqueue_downloads(70 + i, 70 + i, [f"https://example.com/busy/{i}"])
+        await pipeline.wait_for(lambda: len(downloader._job_ctrl) == 3)
+        started = time.monotonic()
+        await pipeline.stop()
+        assert time.monotonic() - started < 1.0
+        # thread های yt-dlp در اولین hook متوقف و پوشه‌ها پاک می‌شوند
+        await pipeline.wait_for(lambda: not workspace._workspaces, timeout=2)
+        assert os.listdir(config.DOWNLOAD_FOLDER) == []
+        # job ها running می‌مانند تا اجرای بعدی بازیابی‌شان کند
+        requeued, failed = await db.recover_jobs(only_expired=False)
+        return requeued, failed
+    requeued, failed = asyncio.run(run())
+    assert len(requeued) == 3 and not failed
+    assert pipeline.uploads() == []
+
+def test_jobs_of_a_broken_process_pool_are_resubmitted(pipeline, fake_ytdl, fresh_db, monkeypatch):
+    """kill_job یک process را می‌کشد و بقیه‌ی job های pool با BrokenProcessPool شکست می‌خورند"""
+    pool = ThreadPoolExecutor(max_workers=config.DOWNLOAD_WORKERS)
+    submitted = []
+
+    def submit(ydl_opts, url, tmpdir):
+        submitted.append(url)
+        if submitted.count(url) == 1:
+            fut = Future()
+            fut.set_exception(BrokenProcessPool("a process in the pool was terminated abruptly"))
+            return fut
+        return pool.submit(ytdl_pool.run_yt_dlp, ydl_opts, url, tmpdir, ytdl_pool._CancelMarker(tmpdir))
+    monkeypatch.setattr(downloader, "YTDL_BACKEND", "process")
+    monkeypatch.setattr(ytdl_pool, "submit", submit)
+
+    async def run():
+        await pipeline.start()
+        for i in range(2):
+            await downloader.enqueue_downloads(90 + i, 90 + i, [f"https://example.com/broken/{i}"])
+        await pipeline.wait_for(lambda: len(pipeline.uploads()) == 2)
+        await pipeline.wait_for(lambda: not downloader._active_jobs)
+        await pipeline.stop()
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    assert sorted(submitted) == sorted([f"https://example.com/broken/{i}" for i in range(2)] * 2)
+    assert _job_states(fresh_db) == ["done"] * 2
+    assert not [e for e in pipeline.events if e[2].get("text", "").startswith("❌")]
@@ -0,0 +1,42 @@
+# tests/test_workspace.py
+"""رزرو دیسک: بایت‌های نوشته‌شده دو بار (در free و در رزرو) کم نمی‌شوند"""
+import os
+
+import workspace
+
+MB = 1024 * 1024
+
+def _write(path: str, name: str, size: int):
+    with open(os.path.join(path, name), "wb") as f:
+        f.write(b"\0" * size)
+
+def test_only_the_unused_part_of_a_reservation_counts(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "DOWNLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(workspace, "_workspaces", {})
+    monkeypatch.setattr(workspace, "WORKSPACE_MIN_FREE_MB", 0)
+    free = [100 * MB]
+    monkeypatch.setattr(workspace, "free_bytes", lambda: free[0])
+
+    path = workspace.open_workspace("job1", 60 * MB)
+    assert workspace.reserved_bytes() == 60 * MB
+    assert not workspace.has_room(50 * MB)
+    # دانلود 30MB نوشته: فضای آزاد 30MB کم شده و رزرو باقی‌مانده 30MB است
+    _write(path, "video.mp4.part", 30 * MB)
+    free[0] -= 30 * MB
+    assert workspace.reserved_bytes() == 30 * MB
+    assert workspace.has_room(40 * MB)
+    assert not workspace.has_room(41 * MB)
+    # فایل از رزرو بزرگ‌تر شد: رزرو منفی حساب نمی‌شود
+    _write(path, "audio.m4a", 40 * MB)
+    assert workspace.reserved_bytes() == 0
+    workspace.release("job1")
+    assert not os.path.exists(path)
+
+def test_folder_bytes_is_refreshed_not_scanned_on_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "DOWNLOAD_FOLDER", str(tmp_path))
+    os.makedirs(tmp_path / "left-over")
+    _write(str(tmp_path / "left-over"), "a.part", 3 * MB)
+    assert workspace.refresh_folder_bytes() == 3 * MB
+    _write(str(tmp_path), "b", MB)
+    assert workspace.cached_folder_bytes() == 3 * MB
+    assert workspace.refresh_folder_bytes() == 4 * MB
@@ -0,0 +1,40 @@
+# tests/test_ytdl_pool.py
+"""YoutubeDL گرم: اگر yt-dlp ویژگی‌های داخلی را عوض کرده باشد، هر job یک instance تازه می‌گیرد"""
+import os
+
+import yt_dlp
+
+import ytdl_pool
+from fakes import FakeYoutubeDL
+
+class RenamedInternals(FakeYoutubeDL):
+    """نسخه‌ی فرضی yt-dlp که _parse_outtmpl را جای دیگری برده"""
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self._ies = {}
+        self._progress_hooks = list(self.params.get("progress_hooks", []))
+        if isinstance(self.params.get("outtmpl"), str):
+            self.params["outtmpl"] = {"default": self.params["outtmpl"]}
+
+    def __getattribute__(self, name):
+        if name == "_parse_outtmpl":
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+def test_failed_reconfigure_falls_back_to_a_fresh_instance(tmp_path, monkeypatch):
+    monkeypatch.setattr(yt_dlp, "YoutubeDL", RenamedInternals)
+    monkeypatch.setattr(RenamedInternals, "delay", 0.0)
+    monkeypatch.setattr(RenamedInternals, "size", 1024)
+    monkeypatch.setattr(ytdl_pool, "_reuse_ok", True)
+    monkeypatch.setattr(ytdl_pool._local, "ydls", {}, raising=False)
+    paths = []
+    for i in range(2):
+        tmpdir = tmp_path / str(i)
+        tmpdir.mkdir()
+        opts = {"quiet": True, "outtmpl": os.path.join(str(tmpdir), "%(id)s.%(ext)s"), "format": "best"}
+        path, info = ytdl_pool.run_yt_dlp(opts, f"https://example.com/v/{i}", str(tmpdir))
+        paths.append(path)
+    assert all(os.path.getsize(p) > 0 for p in paths)
+    assert ytdl_pool._reuse_ok is False
+    # instance خراب دوباره در کش گذاشته نشد
+    assert ytdl_pool._local.ydls == {}
@@ -0,0 +1,125 @@
+# tracing.py
+"""
+tracing سبک درون‌برنامه‌ای: یک trace برای هر update (handler، کوئری‌های DB، درخواست‌های Bot API)
+و یک trace برای هر job دانلود (probe، yt-dlp، transcode، انتظار صف‌ها، آپلود).
+span جاری در یک ContextVar است؛ task هایی که از داخل update ساخته می‌شوند همان trace را ادامه می‌دهند
+تا وقتی root بسته نشده. فقط TRACE_SAMPLE_RATE از trace ها ساخته می‌شوند؛ trace ای که از آستانه‌ی
+کندی بیشتر طول بکشد با درخت کامل span ها لاگ می‌شود.
+"""
+import time
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from config import TRACE_SAMPLE_RATE, TRACE_MAX_SPANS
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+trace_stats = {"started": 0, "unsampled": 0, "slow": 0, "dropped_spans": 0}
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "root", "count")
+
+    def __init__(self, name: str, root=None, attrs=None, start=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.monotonic() if start is None else start
+        self.end = None
+        self.children = []
+        self.root = root or self
+        # فقط روی root: تعداد span های این trace
+        self.count = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+def start(name: str, **attrs):
+    """root span تازه؛ None اگر این trace نمونه‌برداری نشد"""
+    if TRACE_SAMPLE_RATE < 1 and random.random() >= TRACE_SAMPLE_RATE:
+        trace_stats["unsampled"] += 1
+        return None
+    trace_stats["started"] += 1
+    return Span(name, attrs=attrs)
+
+def activate(span):
+    """span را جاری می‌کند (مثلاً trace یک job در task آپلود)؛ returns token برای deactivate"""
+    return _current.set(span)
+
+def deactivate(token):
+    _current.reset(token)
+
+def current():
+    return _current.get()
+
+def _child(name: str, attrs: dict, start=None):
+    parent = _current.get()
+    if parent is None or parent.root.end is not None:
+        return None
+    root = parent.root
+    if root.count >= TRACE_MAX_SPANS:
+        trace_stats["dropped_spans"] += 1
+        return None
+    root.count += 1
+    s = Span(name, root, attrs, start)
+    parent.children.append(s)
+    return s
+
+@contextmanager
+def span(name: str, **attrs):
+    """span فرزند span جاری؛ بیرون از trace کاری نمی‌کند (yield None)"""
+    s = _child(name, attrs)
+    if s is None:
+        yield None
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        s.end = time.monotonic()
+        _current.reset(token)
+
+def record(name: str, started: float, **attrs):
+    """span ای که زمانش جای دیگری اندازه گرفته شده (از started تا الان)، مثل انتظار در صف"""
+    s = _child(name, attrs, started)
+    if s is not None:
+        s.end = time.monotonic()
+
+@contextmanager
+def trace(name: str, slow_sec: float, **attrs):
+    """root span با with؛ بعد از بستن، اگر از slow_sec کندتر بود درختش لاگ می‌شود"""
+    root = start(name, **attrs)
+    if root is None:
+        yield None
+        return
+    token = _current.set(root)
+    try:
+        yield root
+    finally:
+        _current.reset(token)
+        finish(root, slow_sec)
+
+def finish(root, slow_sec: float):
+    if root is None or root.end is not None:
+        return
+    root.end = time.monotonic()
+    if root.duration >= slow_sec:
+        trace_stats["slow"] += 1
+        logger.warning("slow %s\n%s", root.name, format_tree(root))
+
+def format_tree(root) -> str:
+    lines = []
+
+    def walk(s, depth):
+        offset = (s.start - root.start) * 1000
+        attrs = " ".join(f"{k}={v}" for k, v in s.attrs.items())
+        open_mark = "" if s.end is not None else " (open)"
+        lines.append(f"{'  ' * depth}{s.name} {s.duration * 1000:.1f}ms @+{offset:.0f}ms {attrs}{open_mark}".rstrip())
+        for child in s.children:
+            walk(child, depth + 1)
+    walk(root, 0)
+    if root.count >= TRACE_MAX_SPANS:
+        lines.append(f"... (span limit {TRACE_MAX_SPANS} reached)")
+    return "\n".join(lines)
@@ -0,0 +1,145 @@
+# transcode.py
+"""
+مرحله‌ی اختیاری ffmpeg بعد از دانلود (TRANSCODE_ENABLED):
+- ویدیوی بزرگ‌تر از سقف آپلود با bitrate محاسبه‌شده از مدت و بودجه‌ی حجم دوباره encode می‌شود (CRF با سقف maxrate)
+- ویدیوی زیر سقف فقط به MP4 با faststart remux می‌شود تا کلاینت‌ها بتوانند stream کنند
+- صدا به کدک/bitrate تنظیم‌شده (mp3 یا opus) تبدیل می‌شود
+حداکثر TRANSCODE_WORKERS ffmpeg همزمان و با nice پایین اجرا می‌شود تا CPU دانلودها گرفته نشود.
+"""
+import os
+import time
+import shutil
+import asyncio
+import logging
+from config import (
+    TRANSCODE_WORKERS, TRANSCODE_THREADS, TRANSCODE_NICE, TRANSCODE_TIMEOUT_SEC, TRANSCODE_PRESET,
+    TRANSCODE_CRF, TRANSCODE_SIZE_MARGIN, TRANSCODE_MIN_VIDEO_KBPS, TRANSCODE_VIDEO_AUDIO_KBPS,
+    TRANSCODE_AUDIO_CODEC, TRANSCODE_AUDIO_KBPS, MAX_VIDEO_HEIGHT,
+)
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+# codec -> (encoder, پسوند فایل خروجی)
+_AUDIO_CODECS = {"mp3": ("libmp3lame", "mp3"), "opus": ("libopus", "ogg")}
+
+_slots = None
+transcode_stats = {"video": 0, "remux": 0, "audio": 0, "failed": 0, "saved_bytes": 0, "total_sec": 0.0}
+
+def available() -> bool:
+    return FFMPEG is not None
+
+def target_video_kbps(duration, budget: int, audio_kbps: int = TRANSCODE_VIDEO_AUDIO_KBPS):
+    """
+    bitrate ویدیو (kbps) تا کل فایل زیر budget بایت بماند؛
+    None اگر مدت معلوم نیست یا نتیجه از TRANSCODE_MIN_VIDEO_KBPS کمتر است (کیفیت غیرقابل قبول)
+    """
+    if not duration or duration <= 0:
+        return None
+    total_kbps = budget * 8 * TRANSCODE_SIZE_MARGIN / duration / 1000
+    video_kbps = int(total_kbps - audio_kbps)
+    if video_kbps < TRANSCODE_MIN_VIDEO_KBPS:
+        return None
+    return video_kbps
+
+def fits_after_transcode(duration, is_audio: bool, limit: int) -> bool:
+    """آیا فایلی با این مدت بعد از تبدیل زیر limit جا می‌شود؟ (برای probe قبل از دانلود)"""
+    if not available() or not duration:
+        return False
+    if is_audio:
+        return duration * TRANSCODE_AUDIO_KBPS * 1000 / 8 <= limit * TRANSCODE_SIZE_MARGIN
+    return target_video_kbps(duration, limit) is not None
+
+def _lower_priority():
+    # در process فرزند ffmpeg (قبل از exec)
+    os.nice(TRANSCODE_NICE)
+
+async def _ffmpeg(args, timeout=TRANSCODE_TIMEOUT_SEC) -> bool:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(TRANSCODE_WORKERS)
+    async with _slots:
+        proc = await asyncio.create_subprocess_exec(
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *args,
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE, preexec_fn=_lower_priority,
+        )
+        try:
+            _out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            proc.kill()
+            await proc.wait()
+            raise
+        if proc.returncode != 0:
+            logger.warning("ffmpeg exited %s: %s", proc.returncode, err.decode(errors="replace")[-500:])
+            return False
+        return True
+
+async def _probe_duration(path: str):
+    if FFPROBE is None:
+        return None
+    proc = await asyncio.create_subprocess_exec(
+        FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    out, _err = await proc.communicate()
+    try:
+        return float(out.strip())
+    except ValueError:
+        return None
+
+def _output_path(path: str, ext: str) -> str:
+    base, _ = os.path.splitext(path)
+    return f"{base}.t.{ext}"
+
+async def process(path: str, info: dict, is_audio: bool, limit: int) -> str:
+    """
+    returns path فایلی که باید فرستاده شود — خروجی ffmpeg، یا همان ورودی اگر لازم نبود/شکست خورد.
+    فایل ورودی بعد از تبدیل موفق پاک می‌شود (فضای workspace).
+    raises asyncio.TimeoutError بعد از TRANSCODE_TIMEOUT_SEC
+    """
+    if not available():
+        return path
+    size = os.path.getsize(path)
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if is_audio:
+        encoder, out_ext = _AUDIO_CODECS.get(TRANSCODE_AUDIO_CODEC, _AUDIO_CODECS["mp3"])
+        if ext == out_ext and size <= limit:
+            return path
+        kind = "audio"
+        out = _output_path(path, out_ext)
+        args = ["-i", path, "-vn", "-map_metadata", "0", "-c:a", encoder, "-b:a", f"{TRANSCODE_AUDIO_KBPS}k", out]
+    elif size > limit:
+        duration = info.get("duration") or await _probe_duration(path)
+        kbps = target_video_kbps(duration, limit)
+        if kbps is None:
+            return path
+        kind = "video"
+        out = _output_path(path, "mp4")
+        args = ["-i", path, "-c:v", "libx264", "-preset", TRANSCODE_PRESET, "-crf", str(TRANSCODE_CRF),
+                "-maxrate", f"{kbps}k", "-bufsize", f"{kbps * 2}k",
+                "-vf", f"scale=-2:'min({MAX_VIDEO_HEIGHT},ih)'", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-b:a", f"{TRANSCODE_VIDEO_AUDIO_KBPS}k",
+                "-threads", str(TRANSCODE_THREADS), "-movflags", "+faststart", out]
+    else:
+        # فقط جابه‌جایی moov atom به ابتدای فایل؛ بدون encode
+        kind = "remux"
+        out = _output_path(path, "mp4")
+        args = ["-i", path, "-map", "0", "-c", "copy", "-movflags", "+faststart", out]
+
+    started = time.monotonic()
+    ok = await _ffmpeg(args)
+    transcode_stats["total_sec"] += time.monotonic() - started
+    if not ok or not os.path.exists(out):
+        transcode_stats["failed"] += 1
+        if os.path.exists(out):
+            os.remove(out)
+        return path
+    transcode_stats[kind] += 1
+    transcode_stats["saved_bytes"] += size - os.path.getsize(out)
+    os.remove(path)
+    logger.info("%s %s: %d -> %d bytes in %.1fs", kind, os.path.basename(path), size,
+                os.path.getsize(out), time.monotonic() - started)
+    return out
@@ -1,29 +1,83 @@
 # translator.py
+"""
+ترجمه فقط در مرحله‌ی build/warm-up انجام می‌شود (build_catalog) و نتیجه در فایل catalog ذخیره می‌شود؛
+مسیر پاسخ به کاربر هیچ درخواست شبکه‌ای نمی‌فرستد.
+"""
+import json
+import os
+import re
+
 try:
     from deep_translator import GoogleTranslator
 except Exception:
     GoogleTranslator = None
 
-_cache = {}
+SUPPORTED_LANGS = ("fa", "en", "ar")
+
+def _translate_remote(text: str, lang: str) -> str:
+    """raises on failure (translate_template خطا را None برمی‌گرداند)"""
+    if GoogleTranslator is None:
+        raise RuntimeError("deep_translator is not installed")
+    return GoogleTranslator(source='auto', target=lang).translate(text)
+
+# placeholder های format ({name} یا {}) نباید ترجمه شوند
+_PLACEHOLDER = re.compile(r"\{[^{}]*\}")
+_TOKEN = re.compile(r"\[\s*(\d+)\s*\]")
 
-def translate(text: str, lang: str = "fa") -> str:
+def translate_template(text: str, lang: str):
     """
-    text: متن فارسی
-    lang: 'fa'|'en'|'ar'
+    placeholder ها قبل از ترجمه با [0], [1], ... عوض و بعد برگردانده می‌شوند.
+    returns None اگر ترجمه شکست خورد یا placeholder ها آسیب دیدند
     """
-    if not text:
-        return ""
-    if lang == "fa":
-        return text
-    key = (text, lang)
-    if key in _cache:
-        return _cache[key]
-    if GoogleTranslator is None:
-        # fallback conservative: متن فارسی را برگردان
-        return text
+    holders = _PLACEHOLDER.findall(text)
+    protected = _PLACEHOLDER.sub(lambda m, it=iter(range(len(holders))): f"[{next(it)}]", text)
     try:
-        res = GoogleTranslator(source='auto', target=lang).translate(text)
+        res = _translate_remote(protected, lang)
     except Exception:
-        res = text
-    _cache[key] = res
-    return res
+        return None
+    if not res:
+        return None
+    found = [int(i) for i in _TOKEN.findall(res)]
+    if sorted(found) != list(range(len(holders))):
+        return None
+    return _TOKEN.sub(lambda m: holders[int(m.group(1))], res)
+
+def load_catalog(path: str) -> dict:
+    """
+    catalog: {"source": {key: متن فارسی}, "en": {key: ...}, "ar": {key: ...}}
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"source": {}}
+
+def build_catalog(base: dict, path: str, existing: dict = None, langs=SUPPORTED_LANGS) -> dict:
+    """
+    فقط کلیدهای جاافتاده یا کلیدهایی که متن فارسی‌شان عوض شده ترجمه می‌شوند؛
+    ترجمه‌های ناموفق ذخیره نمی‌شوند (در اجرا متن فارسی نمایش داده می‌شود و build بعدی دوباره تلاش می‌کند).
+    """
+    old = existing if existing is not None else load_catalog(path)
+    old_source = old.get("source", {})
+    catalog = {"source": dict(base)}
+    changed = False
+    for lang in langs:
+        if lang == "fa":
+            continue
+        table = {}
+        for key, text in base.items():
+            prev = old.get(lang, {}).get(key)
+            if prev is not None and old_source.get(key) == text:
+                table[key] = prev
+                continue
+            res = translate_template(text, lang) if text else ""
+            if res is not None:
+                table[key] = res
+                changed = True
+        catalog[lang] = table
+    if changed or old_source != base:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+    return catalog
@@ -1,5 +1,6 @@
 # utils.py
-from urllib.parse import urlparse
+import re
+from urllib.parse import urlparse, parse_qs, urlencode
 
 def detect_platform(url: str) -> str | None:
     u = url.lower()
@@ -15,8 +16,60 @@ def detect_platform(url: str) -> str | None:
         return "spotify"
     return None
 
+_URL_RE = re.compile(r"https?://\S+")
+
+def extract_urls(text: str, limit: int) -> list:
+    """لینک‌های یک پیام به ترتیب، بدون تکرار، حداکثر limit تا"""
+    urls = []
+    for m in _URL_RE.finditer(text or ""):
+        url = m.group(0).rstrip(".,;)»")
+        if url not in urls:
+            urls.append(url)
+        if len(urls) >= limit:
+            break
+    return urls
+
 def is_audio_platform(platform: str) -> bool:
     return platform in ("soundcloud", "spotify")
 
 def is_video_platform(platform: str) -> bool:
     return platform in ("youtube", "tiktok", "instagram")
+
+# شناسه‌ی اصلی رسانه از روی لینک (برای کش نتایج)
+_MEDIA_ID_PATTERNS = {
+    "youtube": re.compile(r"(?:youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})"),
+    "instagram": re.compile(r"/(?:p|reel|reels|tv)/([\w-]+)"),
+    "tiktok": re.compile(r"/video/(\d+)"),
+    "spotify": re.compile(r"/(track|episode|album|playlist)/(\w+)"),
+}
+
+# پارامترهای ردگیری/اشتراک‌گذاری که رسانه را عوض نمی‌کنند (بقیه‌ی query جزو کلید می‌ماند)
+_TRACKING_PARAMS = frozenset({"si", "feature", "pp", "igsh", "igshid", "img_index", "is_from_webapp", "sender_device",
+                              "ref", "fbclid", "gclid", "utm_source", "utm_medium", "utm_campaign", "utm_term",
+                              "utm_content", "t", "start", "index", "in"})
+
+def canonical_media_id(url: str) -> str | None:
+    """
+    returns 'platform:id' — دو لینک متفاوت از یک ویدیو (با query های مختلف) یک کلید می‌گیرند.
+    لینک بدون شناسه‌ی شناخته‌شده: host + path + پارامترهای query شناسه‌دار (مثلاً list=)، مرتب‌شده.
+    """
+    platform = detect_platform(url)
+    if not platform:
+        return None
+    parsed = urlparse(url.strip())
+    if platform == "youtube":
+        v = parse_qs(parsed.query).get("v")
+        if v:
+            return f"youtube:{v[0]}"
+    m = _MEDIA_ID_PATTERNS.get(platform)
+    m = m.search(parsed.path if platform != "youtube" else url) if m else None
+    if m:
+        return f"{platform}:{':'.join(m.groups())}"
+    # fallback: host + path + query بدون پارامترهای ردگیری (و بدون fragment)
+    host = (parsed.netloc or "").lower()
+    if host.startswith("www.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+    params = sorted((k, v) for k, values in parse_qs(parsed.query).items()
+                    if k.lower() not in _TRACKING_PARAMS for v in values)
+    query = "?" + urlencode(params) if params else ""
+    return f"{platform}:{host}{parsed.path.rstrip('/')}{query}"
@@ -0,0 +1,132 @@
+# workspace.py
+"""
+پوشه‌ی کاری هر job زیر DOWNLOAD_FOLDER با رزرو فضای دیسک:
+- open_workspace فقط وقتی پوشه می‌سازد که بعد از رزرو، فضای آزاد از WORKSPACE_MIN_FREE_MB کمتر نشود
+- release پوشه را بلافاصله بعد از آپلود (یا پایان/لغو job) پاک و رزرو را آزاد می‌کند
+- sweep فقط پوشه‌های یتیم (بدون job زنده، مثلاً از crash قبلی) را پاک می‌کند
+"""
+import os
+import time
+import shutil
+import tempfile
+import logging
+from config import DOWNLOAD_FOLDER, CLEANUP_OLDER_THAN_SEC, WORKSPACE_MIN_FREE_MB, WORKSPACE_DEFAULT_RESERVE_MB
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+# job_id -> {"path", "reserved"}
+_workspaces: dict = {}
+disk_stats = {"refused": 0, "opened": 0, "released": 0, "swept": 0}
+# آخرین حجم DOWNLOAD_FOLDER (refresh_folder_bytes در cleanup_loop)؛ scrape متریک‌ها دیسک را اسکن نمی‌کند
+_folder_bytes = 0
+
+def reserved_bytes() -> int:
+    """
+    بخش پرنشده‌ی رزروها: آنچه job تا الان نوشته از free_bytes کم شده است،
+    پس فقط رزرو منهای حجم فعلی پوشه‌ی job حساب می‌شود
+    """
+    return sum(max(0, w["reserved"] - folder_bytes(w["path"])) for w in _workspaces.values())
+
+def free_bytes() -> int:
+    try:
+        return shutil.disk_usage(DOWNLOAD_FOLDER).free
+    except OSError:
+        return 0
+
+def has_room(need: int = 0) -> bool:
+    """فضای آزاد منهای بخش پرنشده‌ی رزروها و need بالای watermark است؟"""
+    return free_bytes() - reserved_bytes() - need >= WORKSPACE_MIN_FREE_MB * _MB
+
+def estimate_reserve(size) -> int:
+    """
+    size: حجم تخمینی probe (یا None)
+    دانلود جداگانه‌ی تصویر و صدا و فایل merge شده همزمان روی دیسک‌اند، پس دو برابر
+    """
+    if size:
+        return int(size * 2)
+    return WORKSPACE_DEFAULT_RESERVE_MB * _MB
+
+def open_workspace(job_id: str, reserve: int):
+    """returns path of a fresh directory, or None if the disk budget is exhausted"""
+    if job_id in _workspaces:
+        return _workspaces[job_id]["path"]
+    if not has_room(reserve):
+        disk_stats["refused"] += 1
+        logger.warning("workspace for %s refused: free=%dMB reserved=%dMB need=%dMB",
+                       job_id, free_bytes() // _MB, reserved_bytes() // _MB, reserve // _MB)
+        return None
+    path = tempfile.mkdtemp(dir=DOWNLOAD_FOLDER, prefix=f"{job_id}-")
+    _workspaces[job_id] = {"path": path, "reserved": reserve}
+    disk_stats["opened"] += 1
+    return path
+
+def release(job_id: str):
+    """پوشه و رزرو را آزاد می‌کند (چند بار صدا زدن بی‌خطر است)"""
+    w = _workspaces.pop(job_id, None)
+    if w is None:
+        return
+    shutil.rmtree(w["path"], ignore_errors=True)
+    disk_stats["released"] += 1
+
+def sweep(max_age: float = CLEANUP_OLDER_THAN_SEC) -> int:
+    """پوشه‌هایی که job زنده‌ای ندارند و از max_age قدیمی‌ترند پاک می‌شوند؛ returns تعداد"""
+    live = {w["path"] for w in _workspaces.values()}
+    now = time.time()
+    removed = 0
+    try:
+        entries = list(os.scandir(DOWNLOAD_FOLDER))
+    except OSError:
+        return 0
+    for entry in entries:
+        if entry.path in live:
+            continue
+        try:
+            if now - entry.stat(follow_symlinks=False).st_mtime < max_age:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        except OSError:
+            pass
+    disk_stats["swept"] += removed
+    return removed
+
+def folder_bytes(path: str) -> int:
+    """حجم واقعی فایل‌های زیر path (شامل .part ها)"""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += folder_bytes(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+def refresh_folder_bytes() -> int:
+    """blocking — در executor اجرا شود؛ حجم کل DOWNLOAD_FOLDER (شامل باقی‌مانده‌های crash)"""
+    global _folder_bytes
+    _folder_bytes = folder_bytes(DOWNLOAD_FOLDER)
+    return _folder_bytes
+
+def cached_folder_bytes() -> int:
+    return _folder_bytes
+
+def metrics() -> dict:
+    """برای گزارش/metrics: فضای دیسک و رزروها"""
+    try:
+        usage = shutil.disk_usage(DOWNLOAD_FOLDER)
+        total, free = usage.total, usage.free
+    except OSError:
+        total = free = 0
+    return {"disk_total_bytes": total, "disk_free_bytes": free, "reserved_bytes": reserved_bytes(),
+            "active_workspaces": len(_workspaces), **disk_stats}
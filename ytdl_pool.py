@@ -0,0 +1,361 @@
+# ytdl_pool.py
+"""
+اجرای yt-dlp برای downloader؛ دو backend:
+- "thread": در thread های همین process (پیش‌فرض)
+- "process": در pool از process های جدا تا parse و استخراج سنگین yt-dlp با event loop ربات سر GIL رقابت نکند.
+  هر process بعد از YTDL_MAX_TASKS_PER_CHILD job عوض می‌شود (رشد حافظه مهار می‌شود)،
+  سقف حافظه (RLIMIT_AS) و سقف CPU هر job (RLIMIT_CPU) دارد.
+  لغو و پیشرفت از طریق فایل‌های کنترلی داخل tmpdir job منتقل می‌شوند؛ job ای که بعد از لغو یا timeout
+  متوقف نمی‌شود (گیر کرده قبل از هر hook) با kill_job کشته و pool از نو ساخته می‌شود
+  (downloader بقیه‌ی job های آن pool را که با BrokenProcessPool شکست خوردند دوباره submit می‌کند).
+در هر دو backend هر thread/process یک YoutubeDL گرم برای هر مجموعه گزینه (پروفایل) نگه می‌دارد و
+گزینه‌های مخصوص job (outtmpl، format، hook ها) قبل از هر job روی آن عوض می‌شوند؛ extractor هم از روی
+پلتفرمی که utils.detect_platform می‌شناسد مستقیم انتخاب می‌شود، بدون امتحان regex همه‌ی extractor ها.
+process ها از forkserver ساخته می‌شوند: ماژول‌ها یک بار در سرور import و بعد fork می‌شوند
+(بدون کپی event loop و thread های ربات، و بدون import دوباره‌ی telegram/yt_dlp برای هر process).
+"""
+import os
+import glob
+import time
+import signal
+import logging
+import resource
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import yt_dlp
+from utils import detect_platform
+from config import (
+    DOWNLOAD_WORKERS, YTDL_MAX_TASKS_PER_CHILD, YTDL_MEMORY_LIMIT_MB, YTDL_CPU_LIMIT_SEC, YTDL_REUSE_MAX_JOBS,
+    YTDL_JOB_TIMEOUT_SEC,
+)
+
+logger = logging.getLogger(__name__)
+
+# فایل‌های کنترلی (با نقطه شروع می‌شوند تا در جستجوی فایل خروجی دیده نشوند)
+CANCEL_MARKER = ".cancel"
+PROGRESS_FILE = ".progress"
+PID_FILE = ".pid"
+
+# فقط همین کلیدهای info به downloader برمی‌گردد (info کامل yt-dlp چند MB است و pickle نمی‌شود)
+_INFO_KEYS = ("id", "title", "extractor", "extractor_key", "duration", "ext",
+              "filesize", "filesize_approx", "width", "height", "webpage_url")
+
+class JobError(Exception):
+    """خطای yt-dlp در process جدا (exception اصلی ممکن است traceback داشته باشد و pickle نشود)"""
+
+class CpuLimitExceeded(Exception):
+    pass
+
+class JobTimeout(BaseException):
+    """BaseException: yt-dlp خطاهای شبکه (Exception) را می‌گیرد و دوباره تلاش می‌کند"""
+
+def trim_info(info: dict) -> dict:
+    if not info:
+        return {}
+    out = {k: info[k] for k in _INFO_KEYS if info.get(k) is not None}
+    downloads = info.get("requested_downloads") or []
+    if downloads and downloads[0].get("filepath"):
+        out["filepath"] = downloads[0]["filepath"]
+    return out
+
+# ---------------- YoutubeDL گرم ----------------
+# گزینه‌هایی که هر job فرق می‌کنند؛ بقیه‌ی ydl_opts کلید instance گرم است
+_PER_JOB = ("outtmpl", "format", "progress_hooks", "postprocessor_hooks")
+# پلتفرم -> پیشوند کلید extractor های yt-dlp آن سایت.
+# spotify عمداً نیست: لینک‌هایش در اسکن کامل به KnownDRM می‌خورند که قبل از Spotify* است.
+_EXTRACTOR_PREFIX = {"youtube": "Youtube", "instagram": "Instagram", "tiktok": "TikTok", "soundcloud": "Soundcloud"}
+# پیشوند -> کلیدها به همان ترتیب اسکن خود yt-dlp
+_candidates: dict = {}
+_local = threading.local()
+# False بعد از اولین شکست _configure (yt-dlp به‌روز شده و ویژگی‌های داخلی‌اش عوض شده‌اند)؛
+# از آن به بعد در این process هر job یک YoutubeDL تازه می‌گیرد
+_reuse_ok = True
+ydl_stats = {"created": 0, "reused": 0, "discarded": 0, "direct": 0, "scan": 0}
+
+def extractor_key(ydl, url: str):
+    """
+    کلید extractor برای extract_info(ie_key=...)؛ همان extractor ای که اسکن کامل پیدا می‌کرد.
+    None = پلتفرم ناشناخته یا هیچ extractor آن پلتفرم لینک را نمی‌شناسد (اسکن کامل yt-dlp)
+    """
+    prefix = _EXTRACTOR_PREFIX.get(detect_platform(url))
+    # _ies ویژگی داخلی yt-dlp است؛ اگر در نسخه‌ای نبود همان اسکن کامل
+    ies = getattr(ydl, "_ies", None)
+    if prefix is not None and isinstance(ies, dict):
+        keys = _candidates.get(prefix)
+        if keys is None:
+            keys = _candidates[prefix] = [k for k in ies if k.startswith(prefix)]
+        for key in keys:
+            if key in ies and ies[key].suitable(url):
+                ydl_stats["direct"] += 1
+                return key
+    ydl_stats["scan"] += 1
+    return None
+
+def _configure(entry: dict, ydl_opts: dict):
+    """
+    گزینه‌های job روی instance گرم، همان کاری که YoutubeDL.__init__ با آن‌ها می‌کند
+    (outtmpl نرمال می‌شود، format selector ساخته می‌شود، hook ها ثبت می‌شوند).
+    ویژگی‌های داخلی yt-dlp را عوض می‌کند؛ اگر نسخه‌ی تازه‌ی yt-dlp آن‌ها را تغییر داده باشد raise می‌کند.
+    """
+    ydl = entry["ydl"]
+    ydl.params["outtmpl"] = {"default": ydl_opts["outtmpl"]} if ydl_opts.get("outtmpl") else {}
+    ydl._parse_outtmpl()
+    fmt = ydl_opts.get("format")
+    ydl.params["format"] = fmt
+    if fmt in (None, "-") or callable(fmt):
+        ydl.format_selector = fmt
+    else:
+        selectors = entry["selectors"]
+        if fmt not in selectors:
+            if len(selectors) >= 64:
+                selectors.clear()
+            selectors[fmt] = ydl.build_format_selector(fmt)
+        ydl.format_selector = selectors[fmt]
+    ydl._progress_hooks = list(ydl_opts.get("progress_hooks", []))
+    ydl._postprocessor_hooks = list(ydl_opts.get("postprocessor_hooks", []))
+    ydl._num_downloads = 0
+    ydl._download_retcode = 0
+
+@contextmanager
+def warm_ydl(ydl_opts: dict):
+    """
+    YoutubeDL گرم همین thread برای این گزینه‌ها، آماده‌ی یک job.
+    بعد از خطا (مثلاً لغو وسط دانلود) instance بسته و کنار گذاشته می‌شود؛ بعد از YTDL_REUSE_MAX_JOBS job هم
+    (cookie jar و حافظه‌ی پیام‌های یک‌باره‌ی yt-dlp بی‌نهایت بزرگ نمی‌شوند).
+    """
+    global _reuse_ok
+    if not YTDL_REUSE_MAX_JOBS or not _reuse_ok:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            yield ydl
+        return
+    base = {k: v for k, v in ydl_opts.items() if k not in _PER_JOB}
+    key = repr(sorted(base.items()))
+    cache = getattr(_local, "ydls", None)
+    if cache is None:
+        cache = _local.ydls = {}
+    # pop: اگر همین thread تو در تو instance بخواهد، یکی تازه می‌گیرد
+    entry = cache.pop(key, None)
+    if entry is None:
+        entry = {"ydl": yt_dlp.YoutubeDL(base), "jobs": 0, "selectors": {}}
+        ydl_stats["created"] += 1
+    else:
+        ydl_stats["reused"] += 1
+    try:
+        _configure(entry, ydl_opts)
+    except Exception:
+        _reuse_ok = False
+        logger.warning("could not reconfigure a warm YoutubeDL (yt-dlp %s); using a fresh instance per job",
+                       getattr(yt_dlp.version, "__version__", "?"), exc_info=True)
+        entry["ydl"].close()
+        entry = None
+    if entry is None:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            yield ydl
+        return
+    try:
+        yield entry["ydl"]
+    except BaseException:
+        ydl_stats["discarded"] += 1
+        entry["ydl"].close()
+        raise
+    entry["jobs"] += 1
+    if entry["jobs"] >= YTDL_REUSE_MAX_JOBS:
+        entry["ydl"].close()
+        return
+    # hook های job (event لغو، callback پیشرفت) بعد از job نگه داشته نمی‌شوند
+    entry["ydl"]._progress_hooks = []
+    entry["ydl"]._postprocessor_hooks = []
+    cache[key] = entry
+
+def progress_percent(d: dict):
+    """درصد از dict پیشرفت yt-dlp؛ None اگر معلوم نیست"""
+    if d.get("status") != "downloading":
+        return None
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    if not total:
+        return None
+    return min(100, int(d.get("downloaded_bytes", 0) * 100 / total))
+
+def run_yt_dlp(ydl_opts, url, tmpdir, cancel_event=None, on_progress=None):
+    """
+    blocking call executed in threadpool (or a pool process)
+    returns path to file and trimmed info dict
+    cancel_event: اگر set شود، در اولین progress/postprocessor hook دانلود با DownloadCancelled متوقف می‌شود
+    on_progress: با dict پیشرفت yt-dlp از همین thread صدا زده می‌شود
+    info["merge_sec"]: زمان merge صدا و تصویر جدا با ffmpeg (فقط اگر merge انجام شد)
+    """
+    merge = {}
+
+    def _merge_timer(d):
+        if d.get("postprocessor") != "Merger":
+            return
+        if d.get("status") == "started":
+            merge["started"] = time.monotonic()
+        elif d.get("status") == "finished" and "started" in merge:
+            merge["sec"] = time.monotonic() - merge["started"]
+    ydl_opts = dict(ydl_opts)
+    ydl_opts["postprocessor_hooks"] = list(ydl_opts.get("postprocessor_hooks", [])) + [_merge_timer]
+    if cancel_event is not None:
+        def _check_cancel(_d):
+            if cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled("cancelled by user")
+        ydl_opts = dict(ydl_opts)
+        ydl_opts["progress_hooks"] = list(ydl_opts.get("progress_hooks", [])) + [_check_cancel]
+        ydl_opts["postprocessor_hooks"] = list(ydl_opts.get("postprocessor_hooks", [])) + [_check_cancel]
+    if on_progress is not None:
+        ydl_opts = dict(ydl_opts)
+        ydl_opts["progress_hooks"] = list(ydl_opts.get("progress_hooks", [])) + [on_progress]
+    with warm_ydl(ydl_opts) as ydl:
+        info = trim_info(ydl.extract_info(url, download=True, ie_key=extractor_key(ydl, url)))
+    if "sec" in merge:
+        info["merge_sec"] = merge["sec"]
+    # مسیر دقیق فایل نهایی (بعد از merge/postprocess) را خود yt-dlp می‌دهد
+    path = info.get("filepath")
+    if path and os.path.exists(path):
+        return path, info
+    # extractor هایی که requested_downloads ندارند: تنها فایل داخل پوشه‌ی همین job
+    files = [f for f in glob.glob(os.path.join(tmpdir, "*")) if not f.endswith((".part", ".ytdl"))]
+    return (max(files, key=os.path.getmtime) if files else None), info
+
+# ---------------- process backend ----------------
+class _CancelMarker:
+    """جایگزین threading.Event در process جدا: لغو = وجود فایل CANCEL_MARKER در tmpdir"""
+    def __init__(self, tmpdir: str):
+        self.path = os.path.join(tmpdir, CANCEL_MARKER)
+
+    def is_set(self) -> bool:
+        return os.path.exists(self.path)
+
+def request_cancel(tmpdir: str):
+    """از process اصلی: job ای که در pool روی این tmpdir کار می‌کند در اولین hook متوقف می‌شود"""
+    try:
+        with open(os.path.join(tmpdir, CANCEL_MARKER), "w"):
+            pass
+    except OSError:
+        pass
+
+def read_progress(tmpdir: str):
+    try:
+        with open(os.path.join(tmpdir, PROGRESS_FILE)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+def _on_xcpu(_signum, _frame):
+    raise CpuLimitExceeded(f"CPU limit of {YTDL_CPU_LIMIT_SEC}s exceeded")
+
+def _on_alarm(_signum, _frame):
+    # خواندن بلاک‌شده از socket هم با EINTR قطع می‌شود، حتی اگر هیچ hook ای اجرا نشود
+    raise JobTimeout(f"download took longer than {YTDL_JOB_TIMEOUT_SEC}s")
+
+def _init_worker(memory_mb: int):
+    # Ctrl+C را process اصلی مدیریت می‌کند؛ job ها با CANCEL_MARKER متوقف می‌شوند
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, _on_xcpu)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def _run_job(ydl_opts, url, tmpdir, cpu_sec, timeout_sec=0):
+    """entry point در process pool"""
+    _soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    progress_path = os.path.join(tmpdir, PROGRESS_FILE)
+    # kill_job از روی این فایل process همین job را پیدا می‌کند
+    with open(os.path.join(tmpdir, PID_FILE), "w") as f:
+        f.write(str(os.getpid()))
+    last = [None]
+
+    def _progress(d):
+        percent = progress_percent(d)
+        if percent is None or percent == last[0]:
+            return
+        last[0] = percent
+        tmp = progress_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(percent))
+        os.replace(tmp, progress_path)
+
+    try:
+        if cpu_sec:
+            # RLIMIT_CPU برای کل عمر process است؛ سقف این job = مصرف تا الان + cpu_sec
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime) + 1
+            resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_sec, hard))
+        if timeout_sec:
+            signal.setitimer(signal.ITIMER_REAL, timeout_sec)
+        return run_yt_dlp(ydl_opts, url, tmpdir, _CancelMarker(tmpdir), _progress)
+    except yt_dlp.utils.DownloadCancelled:
+        raise yt_dlp.utils.DownloadCancelled("cancelled by user") from None
+    except (Exception, JobTimeout) as e:
+        raise JobError(str(e) or type(e).__name__) from None
+    finally:
+        if timeout_sec:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cpu_sec:
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # fork مستقیم از process چندنخی ربات امن نیست و با max_tasks_per_child هم ممکن نیست
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["__main__", "ytdl_pool"])
+        _pool = ProcessPoolExecutor(
+            max_workers=DOWNLOAD_WORKERS,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(YTDL_MEMORY_LIMIT_MB,),
+            max_tasks_per_child=YTDL_MAX_TASKS_PER_CHILD,
+        )
+    return _pool
+
+def submit(ydl_opts, url, tmpdir):
+    """
+    returns concurrent.futures.Future -> (out_path, trimmed info)
+    اگر process ای کشته شده باشد (مثلاً OOM killer) pool خراب است؛ pool تازه ساخته می‌شود.
+    """
+    global _pool
+    try:
+        return _get_pool().submit(_run_job, ydl_opts, url, tmpdir, YTDL_CPU_LIMIT_SEC, YTDL_JOB_TIMEOUT_SEC)
+    except BrokenProcessPool:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        return _get_pool().submit(_run_job, ydl_opts, url, tmpdir, YTDL_CPU_LIMIT_SEC, YTDL_JOB_TIMEOUT_SEC)
+
+def kill_job(tmpdir: str) -> bool:
+    """
+    process ای که job این tmpdir را اجرا می‌کند kill می‌شود (لغو/timeout بی‌اثر ماند: گیر کرده در کد C
+    یا قبل از هر hook). ProcessPoolExecutor با مرگ یک process کل pool را خراب اعلام می‌کند و job های دیگرش
+    با BrokenProcessPool شکست می‌خورند؛ pool تازه ساخته می‌شود و downloader آن job ها را دوباره submit می‌کند.
+    returns False اگر process پیدا نشد (job هنوز شروع نشده یا تمام شده)
+    """
+    global _pool
+    try:
+        with open(os.path.join(tmpdir, PID_FILE)) as f:
+            pid = int(f.read())
+    except (OSError, ValueError):
+        return False
+    pool = _pool
+    # فقط process های همین pool (pid ممکن است دوباره به process دیگری داده شده باشد)
+    if pool is None or pid not in (getattr(pool, "_processes", None) or {}):
+        return False
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        return False
+    _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    return True
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None